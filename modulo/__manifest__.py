@@ -20,11 +20,13 @@ Módulo de integración de IA para control de inventario y CRM con soporte para
         'im_livechat'
     ],
     'data': [
+        'security/ir.model.access.csv',
         'data/ai_actions.xml',
         'data/ai_crm_actions.xml',
         'data/ai_agent.xml',
         'data/ai_agent_source.xml',
         'data/livechat_ai_integration.xml',
+        'data/ir_cron.xml',
         'views/views.xml',
         'views/templates.xml',
         'views/res_config_settings_views.xml',
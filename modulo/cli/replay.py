@@ -0,0 +1,524 @@
+"""Reproducción concurrente de conversaciones de livechat contra una base de datos local.
+
+    odoo-bin modulo_replay -c odoo.conf -d carga --synthetic 200 --ramp 2x30,8x60 --output run.json
+    odoo-bin modulo_replay -c odoo.conf -d carga --transcripts chats.jsonl --baseline run.json
+    odoo-bin modulo_replay -c odoo.conf -d produccion --export chats.jsonl --days 7
+
+Cada hilo simula visitantes con su propio cursor: abre un canal de livechat
+y publica los mensajes del visitante con ``message_post``, lo que recorre el
+camino real ``mail.message.create`` -> ``livechat.ai.queue``. En modo
+``inline`` el propio hilo despacha los trabajos del canal
+(``_process_channel`` -> ``_process_livechat_ai_response`` -> respuesta del
+bot); en modo ``queue`` espera a que responda el cron del servidor.
+
+Las conversaciones son ficheros JSONL, una por línea::
+
+    {"messages": ["hola", {"body": "stock de desks", "delay": 4.0}]}
+
+El informe incluye histogramas de latencia por intención, rendimiento por
+etapa de la rampa, demora hasta la respuesta del bot y esperas de bloqueos
+muestreadas de ``pg_stat_activity``/``pg_locks``. Con ``--baseline`` se
+compara con un informe anterior y el comando termina con código 1 si p50/p99
+o el rendimiento empeoran más de ``--max-regression`` por ciento.
+"""
+import argparse
+import collections
+import itertools
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+from odoo import api, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.tools import config
+
+from ..tools import intent_router, llm_stub
+
+_logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de los cubos de los histogramas
+HISTOGRAM_BOUNDS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+LOCK_SAMPLE_INTERVAL = 0.5
+REPLY_POLL_INTERVAL = 0.1
+# Pausa máxima entre mensajes al exportar conversaciones reales
+MAX_EXPORT_DELAY = 30.0
+REPLAY_LIVECHAT_NAME = "Replay modulo"
+
+SYNTHETIC_PROMPTS = [
+    "¿hay stock de {product}?",
+    "stock de {product}, {product2} y {product3} en el almacén {warehouse}",
+    "busco {word}",
+    "¿hay productos con stock bajo?",
+    "resumen inventario por almacén",
+    "productos de la categoría {category}",
+    "¿hay cotizaciones de {product}?",
+    "leads en qualified",
+    "resumen del pipeline por vendedor",
+    "muéstrame las oportunidades abiertas",
+    "hola, buenas tardes",
+]
+
+
+def percentile(values, percent):
+    """Percentil por rango más cercano"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def summarize(seconds):
+    """Conteo, percentiles (ms) e histograma acumulado por cubos de una lista de latencias"""
+    millis = sorted(value * 1000 for value in seconds)
+    histogram = {}
+    for bound in HISTOGRAM_BOUNDS:
+        histogram[str(bound)] = sum(1 for value in millis if value <= bound)
+    histogram['+Inf'] = len(millis)
+    return {
+        'count': len(millis),
+        'p50': percentile(millis, 50),
+        'p90': percentile(millis, 90),
+        'p99': percentile(millis, 99),
+        'max': millis[-1] if millis else 0.0,
+        'histogram': histogram,
+    }
+
+
+def parse_ramp(text):
+    """"2x30,8x60" -> [(2, 30.0), (8, 60.0)]: hilos activos y segundos de cada etapa"""
+    stages = []
+    for part in text.split(','):
+        workers, _sep, seconds = part.strip().partition('x')
+        stages.append((int(workers), float(seconds)))
+    if not stages or any(workers < 1 or seconds <= 0 for workers, seconds in stages):
+        raise ValueError(f"Rampa no válida: {text!r}")
+    return stages
+
+
+def load_transcripts(path):
+    transcripts = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            messages = data['messages'] if isinstance(data, dict) else data
+            transcripts.append([
+                message if isinstance(message, dict) else {'body': message}
+                for message in messages
+            ])
+    return transcripts
+
+
+def diff_reports(report, baseline, max_regression):
+    """Cambios (%) de p50/p99 por intención y del rendimiento respecto al informe base"""
+    rows, regressions = [], []
+
+    def compare(label, metric, current, previous, higher_is_better=False):
+        if not previous:
+            return
+        change = (current - previous) / previous * 100
+        rows.append({'name': label, 'metric': metric, 'baseline': previous, 'current': current, 'change': change})
+        if (-change if higher_is_better else change) > max_regression:
+            regressions.append(f"{label} {metric}: {previous:.1f} -> {current:.1f} ({change:+.1f}%)")
+
+    for intent, current in report['intents'].items():
+        previous = baseline.get('intents', {}).get(intent)
+        if previous:
+            for metric in ('p50', 'p99'):
+                compare(intent, metric, current[metric], previous[metric])
+    for metric in ('p50', 'p99'):
+        compare('reply_lag', metric, report['reply_lag'][metric], baseline.get('reply_lag', {}).get(metric))
+    compare('total', 'throughput', report['throughput'], baseline.get('throughput'), higher_is_better=True)
+    return {'rows': rows, 'regressions': regressions}
+
+
+class ReplayStats:
+    """Muestras de todos los hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+        self.lock_samples = []
+        self.blocked_relations = collections.Counter()
+        self.counters = collections.Counter()
+
+    def record(self, **sample):
+        with self._lock:
+            self.samples.append(sample)
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+
+class ModuloReplay(Command):
+    """Reproduce conversaciones de livechat en paralelo y mide latencias de las respuestas IA"""
+    name = 'modulo_replay'
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog=f'{Path(sys.argv[0]).name} {self.name}',
+            description=self.__doc__,
+            epilog="El resto de opciones (-c, -d, --db_host...) se pasan a la configuración de Odoo.",
+        )
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--transcripts', help="Fichero JSONL de conversaciones")
+        source.add_argument('--synthetic', type=int, metavar='N', help="Generar N conversaciones con datos de la base")
+        source.add_argument('--export', metavar='FILE', help="Exportar conversaciones reales a JSONL y salir")
+        parser.add_argument('--days', type=int, default=7, help="Antigüedad de las conversaciones exportadas")
+        parser.add_argument('--workers', type=int, default=4, help="Hilos simultáneos (sin --ramp)")
+        parser.add_argument('--duration', type=float, default=60, help="Segundos de prueba (sin --ramp)")
+        parser.add_argument('--ramp', help="Etapas HILOSxSEGUNDOS separadas por comas, p. ej. 1x30,4x60,8x60")
+        parser.add_argument('--mode', choices=['inline', 'queue'], default='inline',
+                            help="inline: los hilos despachan la cola; queue: se espera al cron del servidor")
+        parser.add_argument('--think-time', type=float, default=1.0,
+                            help="Pausa entre mensajes cuando la conversación no la indica")
+        parser.add_argument('--reply-timeout', type=float, default=60, help="Espera máxima de la respuesta (modo queue)")
+        parser.add_argument('--llm-stub', type=float, metavar='SECONDS',
+                            help="Servir el fallback LLM desde un servidor local con esta latencia")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Informe JSON")
+        parser.add_argument('--baseline', help="Informe JSON anterior con el que comparar")
+        parser.add_argument('--max-regression', type=float, default=10.0,
+                            help="Empeoramiento máximo (%%) admitido frente a --baseline")
+        parser.add_argument('--keep', action='store_true', help="No borrar los canales y visitantes creados")
+        args, odoo_args = parser.parse_known_args(cmdargs)
+
+        config.parse_config(odoo_args)
+        dbname = config['db_name']
+        if isinstance(dbname, (list, tuple)):
+            dbname = dbname[0] if dbname else None
+        if not dbname:
+            parser.error("Falta la base de datos (-d)")
+        self.dbname = dbname
+        self.registry = Registry(dbname)
+        self.args = args
+        threading.current_thread().dbname = dbname
+
+        if args.export:
+            count = self._export(args.export, args.days)
+            print(f"{count} conversaciones exportadas a {args.export}")
+            return
+
+        if args.transcripts:
+            transcripts = load_transcripts(args.transcripts)
+        else:
+            transcripts = self._synthetic_transcripts(args.synthetic, random.Random(args.seed))
+        if not transcripts:
+            parser.error("No hay conversaciones que reproducir")
+        stages = parse_ramp(args.ramp) if args.ramp else [(args.workers, args.duration)]
+
+        stub = llm_stub.StubLLMServer(latency=args.llm_stub).start() if args.llm_stub is not None else None
+        saved_params = self._configure_llm(stub.url) if stub else None
+        try:
+            report = self._replay(transcripts, stages)
+        finally:
+            if stub:
+                self._restore_params(saved_params)
+                stub.stop()
+            if not args.keep:
+                self._cleanup()
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                report['baseline_diff'] = diff_reports(report, json.load(f), args.max_regression)
+        self._print_report(report)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        if report.get('baseline_diff', {}).get('regressions'):
+            sys.exit(1)
+
+    # -- preparación --------------------------------------------------------
+
+    def _env(self, cr):
+        return api.Environment(cr, SUPERUSER_ID, {})
+
+    def _synthetic_transcripts(self, count, rng):
+        """Conversaciones de 2 a 5 mensajes con productos, categorías y almacenes de la base"""
+        with self.registry.cursor() as cr:
+            env = self._env(cr)
+            products = env['product.product'].search([('is_storable', '=', True)], limit=200).mapped('name') or ['Desk']
+            categories = env['product.category'].search([], limit=50).mapped('name') or ['All']
+            warehouses = env['stock.warehouse'].search([]).mapped('name') or ['WH']
+        words = [word for name in products for word in intent_router.extract_search_terms(name)] or ['desk']
+
+        transcripts = []
+        for _index in range(count):
+            messages = []
+            for _message in range(rng.randint(2, 5)):
+                template = rng.choice(SYNTHETIC_PROMPTS)
+                messages.append({'body': template.format(
+                    product=rng.choice(products), product2=rng.choice(products), product3=rng.choice(products),
+                    category=rng.choice(categories), warehouse=rng.choice(warehouses), word=rng.choice(words),
+                )})
+            transcripts.append(messages)
+        return transcripts
+
+    def _export(self, path, days):
+        """Mensajes de visitantes de las conversaciones de livechat recientes, con sus pausas"""
+        with self.registry.cursor() as cr:
+            cr.execute("""
+                SELECT m.res_id, m.body, m.create_date
+                  FROM mail_message m
+                  JOIN discuss_channel c ON c.id = m.res_id
+                 WHERE m.model = 'discuss.channel'
+                   AND c.channel_type = 'livechat'
+                   AND c.create_date > NOW() AT TIME ZONE 'UTC' - make_interval(days => %s)
+                   AND m.message_type = 'comment'
+                   AND m.author_id IS DISTINCT FROM c.livechat_operator_id
+                   AND m.author_id IS DISTINCT FROM (
+                       SELECT res_id FROM ir_model_data WHERE module = 'base' AND name = 'partner_root')
+              ORDER BY m.res_id, m.id
+            """, [days])
+            rows = cr.fetchall()
+
+        count = 0
+        with open(path, 'w') as f:
+            for _channel_id, messages in itertools.groupby(rows, key=lambda row: row[0]):
+                transcript, previous = [], None
+                for _res_id, body, create_date in messages:
+                    delay = min((create_date - previous).total_seconds(), MAX_EXPORT_DELAY) if previous else 0.0
+                    transcript.append({'body': body, 'delay': delay})
+                    previous = create_date
+                f.write(json.dumps({'messages': transcript}, ensure_ascii=False) + '\n')
+                count += 1
+        return count
+
+    def _configure_llm(self, url):
+        keys = ('modulo.ai_api_key', 'modulo.ai_base_url')
+        with self.registry.cursor() as cr:
+            params = self._env(cr)['ir.config_parameter']
+            saved = {key: params.get_param(key) for key in keys}
+            params.set_param('modulo.ai_api_key', 'replay')
+            params.set_param('modulo.ai_base_url', url)
+        return saved
+
+    def _restore_params(self, saved):
+        with self.registry.cursor() as cr:
+            params = self._env(cr)['ir.config_parameter']
+            for key, value in saved.items():
+                params.set_param(key, value)
+
+    def _cleanup(self):
+        with self.registry.cursor() as cr:
+            env = self._env(cr)
+            livechat = env['im_livechat.channel'].search([('name', '=', REPLAY_LIVECHAT_NAME)])
+            channels = env['discuss.channel'].search([('livechat_channel_id', 'in', livechat.ids)])
+            visitors = channels.channel_member_ids.partner_id.filtered(lambda p: p.name.startswith("Visitante replay"))
+            channels.unlink()
+            visitors.unlink()
+
+    # -- reproducción -------------------------------------------------------
+
+    def _replay(self, transcripts, stages):
+        with self.registry.cursor() as cr:
+            env = self._env(cr)
+            livechat = env['im_livechat.channel'].search([('name', '=', REPLAY_LIVECHAT_NAME)], limit=1) \
+                or env['im_livechat.channel'].create({'name': REPLAY_LIVECHAT_NAME})
+            self.livechat_id = livechat.id
+            self.operator_id = env.user.partner_id.id
+            self.bot_partner_id = env.ref('base.partner_root').id
+
+        self.stats = ReplayStats()
+        self._transcripts = itertools.cycle(enumerate(transcripts))
+        self._transcripts_lock = threading.Lock()
+        self._visitors = itertools.count(1)
+
+        # Cada hilo arranca al comenzar la primera etapa que lo necesita y sigue hasta el final
+        start = time.monotonic()
+        stage_starts, elapsed = [], 0.0
+        for _workers, seconds in stages:
+            stage_starts.append(start + elapsed)
+            elapsed += seconds
+        stop_at = start + elapsed
+        threads = []
+        for index in range(max(workers for workers, _seconds in stages)):
+            stage = next(number for number, (workers, _seconds) in enumerate(stages) if index < workers)
+            threads.append(threading.Thread(
+                target=self._worker, args=(stage_starts[stage], stop_at), name=f'modulo-replay-{index}'))
+
+        monitor_stop = threading.Event()
+        monitor = threading.Thread(target=self._monitor_locks, args=(monitor_stop,), name='modulo-replay-locks')
+        monitor.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - start
+        monitor_stop.set()
+        monitor.join()
+        return self._build_report(stages, stage_starts, start, duration)
+
+    def _worker(self, start_at, stop_at):
+        threading.current_thread().dbname = self.dbname
+        time.sleep(max(start_at - time.monotonic(), 0))
+        while time.monotonic() < stop_at:
+            with self._transcripts_lock:
+                _number, transcript = next(self._transcripts)
+            try:
+                self._play(transcript, stop_at)
+            except Exception:
+                _logger.exception("Error reproduciendo una conversación")
+                self.stats.count('errors')
+
+    def _play(self, transcript, stop_at):
+        with self.registry.cursor() as cr:
+            env = self._env(cr)
+            visitor = env['res.partner'].create({'name': f"Visitante replay {next(self._visitors)}"})
+            channel = env['discuss.channel'].create({
+                'name': visitor.name,
+                'channel_type': 'livechat',
+                'livechat_channel_id': self.livechat_id,
+                'livechat_operator_id': self.operator_id,
+                'channel_member_ids': [(0, 0, {'partner_id': visitor.id})],
+            })
+            visitor_id, channel_id = visitor.id, channel.id
+        self.stats.count('conversations')
+
+        for index, message in enumerate(transcript):
+            time.sleep(message.get('delay', self.args.think_time if index else 0.0))
+            if time.monotonic() >= stop_at:
+                break
+            body = message['body']
+            started = time.monotonic()
+            with self.registry.cursor() as cr:
+                env = self._env(cr)
+                posted_message = env['discuss.channel'].browse(channel_id).message_post(
+                    body=body, author_id=visitor_id, message_type='comment', subtype_xmlid='mail.mt_comment')
+                message_id = posted_message.id
+            posted = time.monotonic()
+
+            state = self._dispatch(channel_id) if self.args.mode == 'inline' else self._wait_reply(channel_id, message_id)
+            finished = time.monotonic()
+            self.stats.record(
+                intent=intent_router.route(body).intent or 'help',
+                at=finished,
+                post=posted - started,
+                handler=finished - posted,
+                lag=finished - started,
+                state=state,
+            )
+
+    def _dispatch(self, channel_id):
+        """Despacha en este hilo los trabajos pendientes del canal, como haría el cron"""
+        try:
+            with self.registry.cursor() as cr:
+                env = self._env(cr)
+                jobs = env['livechat.ai.queue'].search([('channel_id', '=', channel_id), ('state', '=', 'pending')])
+                if not jobs:
+                    return 'missing'
+                jobs._process_channel(jobs.channel_id)
+                return jobs[-1].state
+        except Exception:
+            _logger.exception("Error despachando el canal %s", channel_id)
+            self.stats.count('errors')
+            return 'error'
+
+    def _wait_reply(self, channel_id, message_id):
+        """Espera a que el bot publique un mensaje posterior al del visitante"""
+        deadline = time.monotonic() + self.args.reply_timeout
+        with self.registry.cursor() as cr:
+            while time.monotonic() < deadline:
+                cr.execute("""
+                    SELECT 1 FROM mail_message
+                     WHERE model = 'discuss.channel' AND res_id = %s AND author_id = %s AND id > %s
+                     LIMIT 1
+                """, [channel_id, self.bot_partner_id, message_id])
+                if cr.fetchone():
+                    return 'done'
+                cr.rollback()
+                time.sleep(REPLY_POLL_INTERVAL)
+        return 'timeout'
+
+    def _monitor_locks(self, stop):
+        """Muestrea sesiones esperando bloqueos y relaciones bloqueadas"""
+        with self.registry.cursor() as cr:
+            while not stop.wait(LOCK_SAMPLE_INTERVAL):
+                cr.execute("""
+                    SELECT count(*) FILTER (WHERE wait_event_type = 'Lock'),
+                           count(*) FILTER (WHERE state = 'active')
+                      FROM pg_stat_activity
+                     WHERE datname = current_database()
+                """)
+                waiting, active = cr.fetchone()
+                cr.execute("""
+                    SELECT COALESCE(c.relname, l.locktype), count(*)
+                      FROM pg_locks l
+                 LEFT JOIN pg_class c ON c.oid = l.relation
+                     WHERE NOT l.granted
+                  GROUP BY 1
+                """)
+                blocked = cr.fetchall()
+                # pg_stat_activity es una instantánea por transacción
+                cr.rollback()
+                self.stats.lock_samples.append({
+                    'waiting': waiting, 'active': active, 'ungranted': sum(count for _name, count in blocked)})
+                self.stats.blocked_relations.update(dict(blocked))
+
+    # -- informe ------------------------------------------------------------
+
+    def _build_report(self, stages, stage_starts, start, duration):
+        samples = self.stats.samples
+        by_intent = collections.defaultdict(list)
+        for sample in samples:
+            by_intent[sample['intent']].append(sample['handler'])
+
+        stage_reports = []
+        for (workers, seconds), stage_start in zip(stages, stage_starts):
+            count = sum(1 for sample in samples if stage_start <= sample['at'] < stage_start + seconds)
+            stage_reports.append({'workers': workers, 'seconds': seconds, 'messages': count, 'throughput': count / seconds})
+
+        lock_samples = self.stats.lock_samples
+        return {
+            'database': self.dbname,
+            'mode': self.args.mode,
+            'duration': duration,
+            'conversations': self.stats.counters['conversations'],
+            'messages': len(samples),
+            'errors': self.stats.counters['errors'],
+            'throughput': len(samples) / duration if duration else 0.0,
+            'states': dict(collections.Counter(sample['state'] for sample in samples)),
+            'intents': {intent: summarize(values) for intent, values in sorted(by_intent.items())},
+            'post': summarize([sample['post'] for sample in samples]),
+            'reply_lag': summarize([sample['lag'] for sample in samples]),
+            'stages': stage_reports,
+            'locks': {
+                'samples': len(lock_samples),
+                'max_waiting': max((sample['waiting'] for sample in lock_samples), default=0),
+                'mean_waiting': sum(sample['waiting'] for sample in lock_samples) / len(lock_samples) if lock_samples else 0.0,
+                'max_ungranted': max((sample['ungranted'] for sample in lock_samples), default=0),
+                'blocked_relations': dict(self.stats.blocked_relations.most_common(10)),
+            },
+        }
+
+    def _print_report(self, report):
+        print(f"\nBase de datos {report['database']} ({report['mode']}): {report['messages']} mensajes, "
+              f"{report['conversations']} conversaciones, {report['errors']} errores en {report['duration']:.1f}s "
+              f"({report['throughput']:.2f} msg/s)")
+        print(f"Estados: {report['states']}")
+        print(f"\n{'intención':<22}{'n':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        rows = list(report['intents'].items()) + [('(publicar)', report['post']), ('(demora bot)', report['reply_lag'])]
+        for name, row in rows:
+            print(f"{name:<22}{row['count']:>7}{row['p50']:>10.1f}{row['p90']:>10.1f}{row['p99']:>10.1f}{row['max']:>10.1f}")
+        print("\nEtapas:")
+        for stage in report['stages']:
+            print(f"  {stage['workers']:>3} hilos x {stage['seconds']:.0f}s: {stage['throughput']:.2f} msg/s")
+        locks = report['locks']
+        print(f"\nBloqueos: máx. {locks['max_waiting']} sesiones esperando (media {locks['mean_waiting']:.2f}), "
+              f"máx. {locks['max_ungranted']} bloqueos no concedidos; relaciones: {locks['blocked_relations']}")
+        diff = report.get('baseline_diff')
+        if diff:
+            print("\nComparación con la base:")
+            for row in diff['rows']:
+                print(f"  {row['name']:<22}{row['metric']:<12}{row['baseline']:>10.1f}{row['current']:>10.1f}{row['change']:>+9.1f}%")
+            for regression in diff['regressions']:
+                print(f"  REGRESIÓN {regression}")
@@ -1,21 +1,20 @@
-# from odoo import http
+from odoo import http
+from odoo.http import request
+import hmac
 
 
-# class Modulo(http.Controller):
-#     @http.route('/modulo/modulo', auth='public')
-#     def index(self, **kw):
-#         return "Hello, world"
+class ModuloMetrics(http.Controller):
 
-#     @http.route('/modulo/modulo/objects', auth='public')
-#     def list(self, **kw):
-#         return http.request.render('modulo.listing', {
-#             'root': '/modulo/modulo',
-#             'objects': http.request.env['modulo.modulo'].search([]),
-#         })
-
-#     @http.route('/modulo/modulo/objects/<model("modulo.modulo"):obj>', auth='public')
-#     def object(self, obj, **kw):
-#         return http.request.render('modulo.object', {
-#             'object': obj
-#         })
+    @http.route('/modulo/metrics', type='http', auth='public', methods=['GET'], csrf=False)
+    def metrics(self, token=None, **kw):
+        """Métricas IA de todos los workers en formato de texto Prometheus"""
+        # Sin token configurado el endpoint está cerrado: detrás de un proxy inverso en la
+        # misma máquina todas las peticiones llegarían desde 127.0.0.1
+        expected = request.env['ir.config_parameter'].sudo().get_param('modulo.metrics_token')
+        header = request.httprequest.headers.get('Authorization', '')
+        provided = header.removeprefix('Bearer ').strip() or token or ''
+        if not expected or not hmac.compare_digest(provided.encode(), expected.encode()):
+            return request.make_response("Forbidden\n", status=403)
 
+        body = request.env['ai.metric'].sudo()._render_prometheus()
+        return request.make_response(body, headers=[('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
@@ -3,4 +3,14 @@ from . import ai_actions
 from . import ai_crm_actions
 from . import res_config_settings
 from . import livechat_integration
-from . import livechat_message_handler
\ No newline at end of file
+from . import livechat_message_handler
+from . import livechat_ai_queue
+from . import ai_inventory_snapshot
+from . import ai_product_search
+from . import ai_tool_cache
+from . import ai_pipeline_aggregate
+from . import ai_semantic_index
+from . import ai_metric
+from . import ai_interaction_log
+from . import ai_channel_context
+from . import ai_lead_search
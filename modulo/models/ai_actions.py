@@ -1,58 +1,332 @@
-from odoo import models, api
+from odoo import models, api, fields, tools
+from odoo.tools import SQL
+
+from .ai_product_search import NAME_EXPR
+from .ai_tool_cache import cached_tool
+from ..tools import metrics, semantic_index, tool_results
+
+# Productos devueltos como máximo por cada referencia de get_stock_batch
+PRODUCTS_PER_REFERENCE = 3
+# Estados de movimientos que cuentan para el stock pronosticado (como virtual_available)
+FORECAST_MOVE_STATES = ['waiting', 'confirmed', 'assigned', 'partially_available']
+# Palabras ignoradas al comparar nombres de categoría ("Material de oficina" = "material oficina")
+CATEGORY_STOPWORDS = frozenset({'de', 'del', 'la', 'las', 'el', 'los', 'y', 'e', 'of', 'the', 'and'})
 
 class AIInventoryActions(models.AbstractModel):
     _name = "ai.inventory.actions"
     _description = "Acciones IA Inventario"
 
     @api.model
-    def get_stock(self, product_name):
-        """Obtiene información del stock de productos"""
-        products = self.env['product.product'].sudo().search([
+    def _get_quantities(self, products):
+        """Stock disponible por producto: del snapshot si está activo, si no en vivo"""
+        if self.env['ai.inventory.snapshot']._is_enabled():
+            snapshots = self.env['ai.inventory.snapshot'].sudo().search_fetch(
+                [('product_id', 'in', products.ids)], ['product_id', 'qty_available'])
+            return {s.product_id.id: s.qty_available for s in snapshots}
+        return dict(zip(products.ids, products.mapped('qty_available')))
+
+    @api.model
+    def _get_token_budget(self, structured=True):
+        """Presupuesto aproximado de tokens de una respuesta estructurada (0 = sin límite)"""
+        if structured == tool_results.FULL:
+            return 0
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'modulo.ai_tool_token_budget', tool_results.DEFAULT_TOKEN_BUDGET))
+
+    @api.model
+    @metrics.instrumented
+    @cached_tool('stock')
+    def get_stock(self, product_name, structured=False, limit=5, cursor=None):
+        """Obtiene información del stock de productos (JSON compacto si ``structured``)"""
+        data = self._get_stock_data(product_name, offset=tool_results.decode_cursor(cursor), limit=limit)
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_stock(data)
+
+    @api.model
+    def _get_stock_data(self, product_name, offset=0, limit=5):
+        Product = self.env['product.product'].sudo()
+        products = Product.search([
             ('name', 'ilike', product_name)
-        ], limit=5)
+        ], offset=offset, limit=limit + 1)
+        if not products and not offset:
+            products = Product.browse(self.env['ai.semantic.index']._search_product_ids(product_name, limit=limit))
+
+        quantities = self._get_quantities(products[:limit])
+        return {
+            'tool': 'get_stock',
+            'query': product_name,
+            'offset': offset,
+            'more': len(products) > limit,
+            'rows': [
+                {'id': p.id, 'name': p.name, 'qty': quantities.get(p.id, 0.0), 'price': p.list_price}
+                for p in products[:limit]
+            ],
+        }
 
-        if not products:
-            return f"No se encontraron productos llamados '{product_name}'."
+    @api.model
+    def _render_stock(self, data):
+        if not data['rows']:
+            return f"No se encontraron productos llamados '{data['query']}'."
 
         result = []
-        for p in products:
-            status = "✅ Disponible" if p.qty_available > 0 else "❌ Sin stock"
+        for row in data['rows']:
+            status = "✅ Disponible" if row['qty'] > 0 else "❌ Sin stock"
             result.append(
-                f"📦 {p.name}\n"
-                f"  • Stock: {int(p.qty_available)} unidades\n"
-                f"  • Precio: ${p.list_price}\n"
+                f"📦 {row['name']}\n"
+                f"  • Stock: {int(row['qty'])} unidades\n"
+                f"  • Precio: ${row['price']}\n"
                 f"  • Estado: {status}"
             )
         
         return "\n\n".join(result)
 
     @api.model
-    def search_products_detailed(self, search_term):
+    @metrics.instrumented
+    @cached_tool('stock')
+    def get_stock_batch(self, references, warehouse=None, structured=False):
+        """Stock disponible, reservado y pronosticado por almacén de varios productos a la vez
+
+        ``references`` admite nombres, referencias internas y códigos de barras;
+        ``warehouse`` (nombre o código) limita el desglose a esos almacenes.
+        """
+        if isinstance(references, str):
+            references = [references]
+        references = [ref.strip() for ref in references if ref and ref.strip()]
+        warehouses = self.env['stock.warehouse'].sudo()
+        if warehouse:
+            warehouses = warehouses.search(['|', ('name', 'ilike', warehouse), ('code', '=ilike', warehouse)])
+
+        matches = self._resolve_product_references(references)
+        products = self.env['product.product'].sudo().browse(
+            list(dict.fromkeys(product_id for ids in matches.values() for product_id in ids)))
+        stock = self._read_warehouse_stock(products.ids, warehouses.ids if warehouse else None)
+        stock_warehouses = self.env['stock.warehouse'].sudo().browse(
+            sorted({warehouse_id for _product_id, warehouse_id in stock}))
+        warehouse_names = dict(zip(stock_warehouses.ids, stock_warehouses.mapped('name')))
+        products.fetch(['name', 'default_code'])
+
+        rows = []
+        for ref in references:
+            for product in products.browse(matches.get(ref, [])):
+                groups = [
+                    dict(values, id=warehouse_id, name=warehouse_names[warehouse_id])
+                    for (product_id, warehouse_id), values in sorted(stock.items())
+                    if product_id == product.id
+                ]
+                rows.append({
+                    'ref': ref,
+                    'id': product.id,
+                    'name': product.name,
+                    'code': product.default_code or False,
+                    'on_hand': sum(group['on_hand'] for group in groups),
+                    'reserved': sum(group['reserved'] for group in groups),
+                    'forecast': sum(group['forecast'] for group in groups),
+                    'warehouses': groups,
+                })
+
+        data = {
+            'tool': 'get_stock_batch',
+            'warehouse': warehouse or False,
+            'warehouse_found': bool(warehouses) if warehouse else True,
+            'missing': [ref for ref in references if not matches.get(ref)],
+            'rows': rows,
+        }
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_stock_batch(data)
+
+    @api.model
+    def _resolve_product_references(self, references, per_reference=PRODUCTS_PER_REFERENCE):
+        """{referencia: [ids de producto]} resolviendo todas las referencias en una consulta
+
+        Una referencia coincide por referencia interna o código de barras exactos
+        (que van primero) o por nombre sin acentos. Cada condición va en su propia
+        rama para que use su índice: el nombre, el índice trigram de búsqueda.
+        """
+        if not references:
+            return {}
+        self.env['product.product'].flush_model(['active', 'product_tmpl_id', 'default_code', 'barcode'])
+        self.env['product.template'].flush_model(['name', 'active'])
+        patterns = [
+            '%' + ref.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            for ref in references
+        ]
+        self.env.cr.execute(SQL("""
+            SELECT r.ref, m.id
+              FROM unnest(%(refs)s::text[], %(patterns)s::text[]) WITH ORDINALITY AS r(ref, pattern, pos)
+        CROSS JOIN LATERAL (
+                SELECT c.id
+                  FROM (
+                        SELECT pp.id, TRUE AS exact
+                          FROM product_product pp
+                          JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                         WHERE pp.active AND pt.active AND (pp.default_code = r.ref OR pp.barcode = r.ref)
+                     UNION ALL
+                        SELECT pp.id, FALSE
+                          FROM product_template pt
+                          JOIN product_product pp ON pp.product_tmpl_id = pt.id
+                         WHERE pp.active AND pt.active AND %(name)s ILIKE modulo_unaccent(r.pattern)
+                       ) c
+              GROUP BY c.id
+              ORDER BY bool_or(c.exact) DESC, c.id
+                 LIMIT %(per_reference)s
+              ) m
+          ORDER BY r.pos
+        """, refs=references, patterns=patterns, per_reference=per_reference, name=SQL(NAME_EXPR)))
+        matches = {}
+        for ref, product_id in self.env.cr.fetchall():
+            matches.setdefault(ref, []).append(product_id)
+        return matches
+
+    @api.model
+    def _read_warehouse_stock(self, product_ids, warehouse_ids=None):
+        """{(producto, almacén): {'on_hand', 'reserved', 'forecast'}} en ubicaciones internas
+
+        Misma semántica que ``qty_available``/``virtual_available`` con
+        ``with_context(warehouse=...)``, pero para todos los productos y
+        almacenes a la vez: una lectura agrupada de stock.quant y otra de los
+        movimientos pendientes.
+        """
+        if not product_ids:
+            return {}
+        company_ids = self.env.companies.ids
+        location_domain = [('warehouse_id', 'in', warehouse_ids)] if warehouse_ids else [('warehouse_id', '!=', False)]
+        locations = self.env['stock.location'].sudo().search(
+            [('usage', '=', 'internal')] + location_domain)
+        warehouse_of = {location.id: location.warehouse_id.id for location in locations}
+
+        stock = {}
+
+        def bucket(product, warehouse_id):
+            return stock.setdefault((product.id, warehouse_id), {'on_hand': 0.0, 'reserved': 0.0, 'forecast': 0.0})
+
+        for product, location, quantity, reserved in self.env['stock.quant'].sudo()._read_group(
+                [('product_id', 'in', product_ids), ('location_id', 'in', locations.ids),
+                 ('company_id', 'in', company_ids)],
+                ['product_id', 'location_id'], ['quantity:sum', 'reserved_quantity:sum']):
+            values = bucket(product, warehouse_of[location.id])
+            values['on_hand'] += quantity
+            values['reserved'] += reserved
+            values['forecast'] += quantity
+
+        # Entradas y salidas pendientes entre almacenes distintos (o con el exterior)
+        for product, source, destination, quantity in self.env['stock.move'].sudo()._read_group(
+                [('product_id', 'in', product_ids), ('state', 'in', FORECAST_MOVE_STATES),
+                 ('company_id', 'in', company_ids),
+                 '|', ('location_id', 'in', locations.ids), ('location_dest_id', 'in', locations.ids)],
+                ['product_id', 'location_id', 'location_dest_id'], ['product_qty:sum']):
+            source_warehouse = warehouse_of.get(source.id)
+            destination_warehouse = warehouse_of.get(destination.id)
+            if source_warehouse == destination_warehouse:
+                continue
+            if destination_warehouse:
+                bucket(product, destination_warehouse)['forecast'] += quantity
+            if source_warehouse:
+                bucket(product, source_warehouse)['forecast'] -= quantity
+        return stock
+
+    @api.model
+    def _render_stock_batch(self, data):
+        if not data['warehouse_found']:
+            return f"❌ No se encontró el almacén '{data['warehouse']}'."
+        if not data['rows']:
+            return f"No se encontraron productos para: {', '.join(data['missing'])}."
+
+        where = f" en {data['warehouse']}" if data['warehouse'] else ""
+        result = [f"📦 Stock de {len(data['rows'])} producto(s){where}:"]
+        for row in data['rows']:
+            code = f" [{row['code']}]" if row['code'] else ""
+            lines = [
+                f"📦 **{row['name']}**{code}",
+                f"  • Disponible: {int(row['on_hand'])} | Reservado: {int(row['reserved'])} | "
+                f"Pronosticado: {int(row['forecast'])}",
+            ]
+            for group in row['warehouses']:
+                lines.append(
+                    f"  • 🏬 {group['name']}: {int(group['on_hand'])} disponibles, "
+                    f"{int(group['reserved'])} reservados, {int(group['forecast'])} pronosticados"
+                )
+            result.append("\n".join(lines))
+
+        if data['missing']:
+            result.append(f"❓ Sin coincidencias: {', '.join(data['missing'])}")
+        return "\n\n".join(result)
+
+    @api.model
+    @metrics.instrumented
+    @cached_tool('stock')
+    def search_products_detailed(self, search_term, structured=False, limit=10, cursor=None):
         """Busca productos de forma inteligente y devuelve información detallada"""
-        # Buscar en nombre, descripción y categoría
-        products = self.env['product.product'].sudo().search([
-            '|', '|', 
-            ('name', 'ilike', search_term),
-            ('description', 'ilike', search_term),
-            ('categ_id.name', 'ilike', search_term)
-        ], limit=10)
-
-        if not products:
-            return f"❌ No se encontraron productos relacionados con '{search_term}'."
-
-        result = [f"🔍 Encontré {len(products)} producto(s) relacionado(s) con '{search_term}':\n"]
+        offset = tool_results.decode_cursor(cursor)
+        # Buscar los términos significativos en nombre, descripción y categoría, por relevancia
+        products = self.env['ai.product.search'].sudo()._find_products(search_term, limit=offset + limit + 1)
+        page = products[offset:offset + limit]
+        quantities = self._get_quantities(page)
+        data = {
+            'tool': 'search_products_detailed',
+            'query': search_term,
+            'offset': offset,
+            'more': len(products) > offset + limit,
+            'rows': [
+                {
+                    'id': p.id,
+                    'name': p.name,
+                    'categ': p.categ_id.name or False,
+                    'qty': quantities.get(p.id, 0.0),
+                    'price': p.list_price,
+                }
+                for p in page
+            ],
+        }
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_products_detailed(data)
+
+    @api.model
+    def _describe_products(self, product_ids, query, in_stock=None):
+        """Datos de ``search_products_detailed`` para productos ya conocidos, sin volver a buscar
+
+        ``in_stock`` filtra los que tienen (True) o no tienen (False) stock.
+        """
+        products = self.env['product.product'].sudo().browse(product_ids).exists()
+        products.fetch(['name', 'categ_id', 'list_price'])
+        quantities = self._get_quantities(products)
+        if in_stock is not None:
+            products = products.filtered(lambda p: (quantities.get(p.id, 0.0) > 0) == in_stock)
+        return {
+            'tool': 'search_products_detailed',
+            'query': query,
+            'rows': [
+                {
+                    'id': p.id,
+                    'name': p.name,
+                    'categ': p.categ_id.name or False,
+                    'qty': quantities.get(p.id, 0.0),
+                    'price': p.list_price,
+                }
+                for p in products
+            ],
+        }
+
+    @api.model
+    def _render_products_detailed(self, data):
+        if not data['rows']:
+            return f"❌ No se encontraron productos relacionados con '{data['query']}'."
+
+        result = [f"🔍 Encontré {len(data['rows'])} producto(s) relacionado(s) con '{data['query']}':\n"]
         
-        for p in products:
-            stock_qty = int(p.qty_available)
+        for row in data['rows']:
+            stock_qty = int(row['qty'])
             status = "✅ Disponible" if stock_qty > 0 else "❌ Sin stock"
-            category = p.categ_id.name if p.categ_id else "Sin categoría"
+            category = row['categ'] or "Sin categoría"
             
             result.append(
-                f"📦 **{p.name}**\n"
+                f"📦 **{row['name']}**\n"
                 f"  • Categoría: {category}\n"
                 f"  • Stock disponible: {stock_qty} unidades\n"
-                f"  • Precio unitario: ${p.list_price:,.2f}\n"
-                f"  • Valor total en inventario: ${stock_qty * p.list_price:,.2f}\n"
+                f"  • Precio unitario: ${row['price']:,.2f}\n"
+                f"  • Valor total en inventario: ${stock_qty * row['price']:,.2f}\n"
                 f"  • Estado: {status}"
             )
             
@@ -63,54 +337,421 @@ class AIInventoryActions(models.AbstractModel):
         return "\n\n".join(result)
 
     @api.model
-    def check_low_stock(self, threshold=10):
-        """Verifica productos con stock bajo"""
-        products = self.env['product.product'].sudo().search([
-            ('qty_available', '<', threshold)
-        ], limit=10)
-        
-        if not products:
+    @metrics.instrumented
+    @cached_tool('stock')
+    def check_low_stock(self, threshold=None, offset=0, limit=10, structured=False, cursor=None):
+        """Verifica productos con stock bajo, ordenados por déficit y paginados"""
+        if threshold is None:
+            threshold = float(self.env['ir.config_parameter'].sudo().get_param('modulo.low_stock_threshold', 10))
+        if cursor:
+            offset = tool_results.decode_cursor(cursor)
+        lines, total = self._find_low_stock(threshold, offset=offset, limit=limit)
+        data = {
+            'tool': 'check_low_stock',
+            'threshold': threshold,
+            'total': total,
+            'offset': offset,
+            'more': offset + len(lines) < total,
+            'rows': [
+                {'id': product_id, 'name': name, 'qty': float(qty), 'min': float(minimum)}
+                for product_id, name, qty, minimum in lines
+            ],
+        }
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_low_stock(data, limit)
+
+    @api.model
+    def _render_low_stock(self, data, limit=10):
+        offset = data['offset']
+        if not data['rows']:
+            if offset:
+                return "✅ No hay más productos con stock bajo."
             return "✅ Todos los productos tienen stock suficiente."
         
-        result = ["⚠️ Productos con stock bajo:"]
-        for p in products:
-            result.append(f"  • {p.name}: {int(p.qty_available)} unidades")
+        result = [f"⚠️ Productos con stock bajo ({offset + 1}-{offset + len(data['rows'])} de {data['total']}):"]
+        for row in data['rows']:
+            result.append(f"  • {row['name']}: {int(row['qty'])} unidades (mínimo {int(row['min'])})")
+
+        if data['more']:
+            next_page = offset // limit + 2
+            result.append(f"\n➡️ Escribe 'stock bajo página {next_page}' para ver más.")
         
         return "\n".join(result)
 
     @api.model
-    def get_inventory_summary(self):
-        """Obtiene un resumen del inventario"""
-        products = self.env['product.product'].sudo().search([])
-        
-        total_products = len(products)
-        products_in_stock = len(products.filtered(lambda p: p.qty_available > 0))
-        total_value = sum(p.qty_available * p.list_price for p in products)
-        
-        return f"""📊 Resumen de Inventario:
-  • Total de productos: {total_products}
-  • Productos disponibles: {products_in_stock}
-  • Valor total: ${total_value:,.2f}"""
+    def _find_low_stock(self, threshold, offset=0, limit=10):
+        """Productos almacenables bajo su mínimo: [(id, nombre, stock, mínimo)] y el total
+
+        El mínimo es la suma de las reglas de reabastecimiento del producto o,
+        si no tiene, el umbral indicado. Se ordena por déficit (mínimo - stock).
+        En modo snapshot el stock sale de ai.inventory.snapshot y el resto de
+        la consulta (reglas, almacenables) es el mismo.
+        """
+        company_ids = self.env.companies.ids
+        if self.env['ai.inventory.snapshot']._is_enabled():
+            self.env['ai.inventory.snapshot'].flush_model(['product_id', 'qty_available'])
+            stock = SQL("SELECT product_id, qty_available AS qty FROM ai_inventory_snapshot")
+        else:
+            self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity', 'company_id'])
+            stock = SQL("""
+                SELECT q.product_id, SUM(q.quantity) AS qty
+                  FROM stock_quant q
+                  JOIN stock_location l ON l.id = q.location_id AND l.usage = 'internal'
+                 WHERE q.company_id = ANY(%s)
+              GROUP BY q.product_id
+            """, company_ids)
+        self.env['stock.warehouse.orderpoint'].flush_model(['product_id', 'product_min_qty', 'active', 'company_id'])
+        self.env['product.product'].flush_model(['active', 'product_tmpl_id'])
+        self.env['product.template'].flush_model(['is_storable'])
+        self.env.cr.execute(SQL("""
+            WITH stock AS (%(stock)s), rules AS (
+                SELECT product_id, SUM(product_min_qty) AS min_qty
+                  FROM stock_warehouse_orderpoint
+                 WHERE active AND company_id = ANY(%(company_ids)s)
+              GROUP BY product_id
+            )
+            SELECT pp.id,
+                   COALESCE(s.qty, 0),
+                   COALESCE(r.min_qty, %(threshold)s) AS minimum,
+                   COUNT(*) OVER ()
+              FROM product_product pp
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+         LEFT JOIN stock s ON s.product_id = pp.id
+         LEFT JOIN rules r ON r.product_id = pp.id
+             WHERE pp.active
+               AND pt.is_storable
+               AND COALESCE(s.qty, 0) < COALESCE(r.min_qty, %(threshold)s)
+          ORDER BY COALESCE(r.min_qty, %(threshold)s) - COALESCE(s.qty, 0) DESC, pp.id
+             LIMIT %(limit)s OFFSET %(offset)s
+        """, stock=stock, company_ids=company_ids, threshold=threshold, limit=limit, offset=offset))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return [], 0
+
+        products = self.env['product.product'].sudo().browse([row[0] for row in rows])
+        names = dict(zip(products.ids, products.mapped('name')))
+        return [(product_id, names[product_id], qty, minimum) for product_id, qty, minimum, _total in rows], rows[0][3]
 
     @api.model
-    def search_product_by_category(self, category_name):
-        """Busca productos por categoría"""
-        categories = self.env['product.category'].sudo().search([
-            ('name', 'ilike', category_name)
-        ])
-        
-        if not categories:
-            return f"No se encontraron categorías llamadas '{category_name}'."
-        
-        products = self.env['product.product'].sudo().search([
-            ('categ_id', 'in', categories.ids)
-        ], limit=10)
-        
-        if not products:
+    @metrics.instrumented
+    @cached_tool('stock')
+    def get_inventory_summary(self, by_warehouse=False, by_category=False, structured=False):
+        """Obtiene un resumen del inventario agregado en SQL (opcionalmente por almacén y categoría)"""
+        rows = self._read_inventory_totals(by_warehouse=by_warehouse, by_category=by_category)
+        total_products, totals = rows.pop(('total', None))
+        data = {
+            'tool': 'get_inventory_summary',
+            'products': total_products,
+            'in_stock': totals['in_stock'],
+            'value': float(totals['value']),
+        }
+
+        for kind, model, field_name in (('warehouse', 'stock.warehouse', 'name'),
+                                        ('category', 'product.category', 'complete_name')):
+            if not (by_warehouse if kind == 'warehouse' else by_category):
+                continue
+            ids = [key for group_kind, key in rows if group_kind == kind and key]
+            names = dict(zip(ids, self.env[model].sudo().browse(ids).mapped(field_name)))
+            data[f'{kind}s'] = [
+                {'id': key or False, 'name': names.get(key, False), 'in_stock': group['in_stock'], 'value': float(group['value'])}
+                for (group_kind, key), (_total, group) in rows.items()
+                if group_kind == kind
+            ]
+
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_inventory_summary(data)
+
+    @api.model
+    def _render_inventory_summary(self, data):
+        result = [f"""📊 Resumen de Inventario:
+  • Total de productos: {data['products']}
+  • Productos disponibles: {data['in_stock']}
+  • Valor total: ${data['value']:,.2f}"""]
+
+        if 'warehouses' in data:
+            result.append("🏬 Por almacén:")
+            for group in data['warehouses']:
+                result.append(f"  • {group['name'] or 'Sin almacén'}: {group['in_stock']} productos - ${group['value']:,.2f}")
+
+        if 'categories' in data:
+            result.append("🗂️ Por categoría:")
+            for group in data['categories']:
+                result.append(f"  • {group['name'] or 'Sin categoría'}: {group['in_stock']} productos - ${group['value']:,.2f}")
+
+        return "\n".join(result)
+
+    @api.model
+    def _read_inventory_totals(self, by_warehouse=False, by_category=False):
+        """Totales de stock en ubicaciones internas calculados en una sola consulta
+
+        Devuelve ``{(tipo, id): (total_productos, {'in_stock', 'qty', 'value'})}``
+        donde tipo es ``total``, ``warehouse`` o ``category``. Por almacén un
+        producto está en stock si su cantidad en ese almacén es positiva; en
+        el total y por categoría, si lo es la suma de todos los almacenes.
+        """
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity', 'company_id'])
+        self.env['stock.location'].flush_model(['usage', 'warehouse_id'])
+        self.env['product.template'].flush_model(['list_price', 'categ_id'])
+
+        grouping_sets = [SQL("()")]
+        if by_warehouse:
+            grouping_sets.append(SQL("(warehouse_id)"))
+        if by_category:
+            grouping_sets.append(SQL("(categ_id)"))
+
+        self.env.cr.execute(SQL("""
+            WITH per_product AS (
+                SELECT q.product_id, l.warehouse_id, pt.categ_id,
+                       SUM(q.quantity) AS qty,
+                       SUM(SUM(q.quantity)) OVER (PARTITION BY q.product_id) AS product_qty,
+                       SUM(q.quantity) * COALESCE(pt.list_price, 0) AS value
+                  FROM stock_quant q
+                  JOIN stock_location l ON l.id = q.location_id
+                  JOIN product_product pp ON pp.id = q.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                 WHERE l.usage = 'internal'
+                   AND q.company_id = ANY(%(company_ids)s)
+              GROUP BY q.product_id, l.warehouse_id, pt.categ_id, pt.list_price
+            )
+            SELECT GROUPING(warehouse_id), GROUPING(categ_id), warehouse_id, categ_id,
+                   COUNT(DISTINCT product_id) FILTER (WHERE qty > 0),
+                   COUNT(DISTINCT product_id) FILTER (WHERE product_qty > 0),
+                   COALESCE(SUM(qty), 0),
+                   COALESCE(SUM(value), 0),
+                   (SELECT COUNT(*) FROM product_product WHERE active)
+              FROM per_product
+          GROUP BY GROUPING SETS (%(grouping_sets)s)
+        """, company_ids=self.env.companies.ids, grouping_sets=SQL(", ").join(grouping_sets)))
+
+        # El conjunto vacío () siempre devuelve la fila del total, aunque no haya quants
+        rows = {}
+        for (no_warehouse, no_category, warehouse_id, categ_id, in_warehouse, in_stock, qty, value,
+             total) in self.env.cr.fetchall():
+            if no_warehouse and no_category:
+                key = ('total', None)
+            elif no_category:
+                key, in_stock = ('warehouse', warehouse_id), in_warehouse
+            else:
+                key = ('category', categ_id)
+            rows[key] = (total, {'in_stock': in_stock, 'qty': qty, 'value': value})
+        return rows
+
+    @api.model
+    @metrics.instrumented
+    @cached_tool('stock')
+    def search_product_by_category(self, category_name=None, structured=False, limit=10, cursor=None):
+        """Productos de una categoría y de sus subcategorías, con totales por subcategoría
+
+        ``category_name`` admite el nombre o la ruta completa ("Muebles / Oficina"),
+        sin distinguir mayúsculas ni acentos. Sin categoría se listan las
+        categorías principales.
+        """
+        offset = tool_results.decode_cursor(cursor)
+        Category = self.env['product.category'].sudo()
+        index = Category._get_ai_category_index()
+        matched = Category._match_ai_categories(category_name) if category_name else ()
+        data = {
+            'tool': 'search_product_by_category',
+            'query': category_name or False,
+            'categories': [],
+            'offset': offset,
+            'rows': [],
+        }
+        if not matched:
+            data['available'] = [index['names'][category_id] for category_id in index['top']]
+        else:
+            subtree = sorted({category_id for root in matched for category_id in index['subtrees'][root]})
+            totals = self._read_category_totals(subtree)
+
+            def rollup(category_id):
+                products = qty = 0
+                for descendant in index['subtrees'][category_id]:
+                    count, stock = totals.get(descendant, (0, 0.0))
+                    products += count
+                    qty += stock
+                return {'id': category_id, 'name': index['names'][category_id], 'products': products, 'qty': qty}
+
+            data['categories'] = [rollup(root) for root in matched]
+            data['subcategories'] = [
+                group for group in (rollup(category_id) for category_id in subtree if index['parents'][category_id] in matched)
+                if group['products']
+            ]
+            data['total'] = sum(group['products'] for group in data['categories'])
+
+            if self.env['ai.inventory.snapshot']._is_enabled():
+                snapshots = self.env['ai.inventory.snapshot'].sudo().search([
+                    ('categ_id', 'in', subtree)
+                ], offset=offset, limit=limit + 1)
+                lines = [(s.product_id.id, s.product_id.name, s.qty_available) for s in snapshots]
+            else:
+                products = self.env['product.product'].sudo().search([
+                    ('categ_id', 'in', subtree)
+                ], offset=offset, limit=limit + 1)
+                quantities = self._get_quantities(products[:limit])
+                lines = [(p.id, p.name, quantities.get(p.id, 0.0)) for p in products]
+            data['more'] = len(lines) > limit
+            data['rows'] = [{'id': product_id, 'name': name, 'qty': qty} for product_id, name, qty in lines[:limit]]
+
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_product_by_category(data)
+
+    @api.model
+    def _read_category_totals(self, category_ids):
+        """{categoría: (productos, stock)} de esas categorías (sin subcategorías) en una consulta agrupada"""
+        if not category_ids:
+            return {}
+        if self.env['ai.inventory.snapshot']._is_enabled():
+            self.env['ai.inventory.snapshot'].flush_model(['categ_id', 'qty_available'])
+            self.env.cr.execute(SQL("""
+                SELECT categ_id, COUNT(*), COALESCE(SUM(qty_available), 0)
+                  FROM ai_inventory_snapshot
+                 WHERE categ_id = ANY(%s)
+              GROUP BY categ_id
+            """, category_ids))
+            return {categ_id: (count, qty) for categ_id, count, qty in self.env.cr.fetchall()}
+
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity', 'company_id'])
+        self.env['stock.location'].flush_model(['usage'])
+        self.env['product.product'].flush_model(['active', 'product_tmpl_id'])
+        self.env['product.template'].flush_model(['categ_id', 'active'])
+        self.env.cr.execute(SQL("""
+            SELECT pt.categ_id, COUNT(DISTINCT pp.id), COALESCE(SUM(q.quantity), 0)
+              FROM product_template pt
+              JOIN product_product pp ON pp.product_tmpl_id = pt.id AND pp.active
+         LEFT JOIN stock_quant q ON q.product_id = pp.id
+                                AND q.company_id = ANY(%(company_ids)s)
+                                AND q.location_id IN (SELECT id FROM stock_location WHERE usage = 'internal')
+             WHERE pt.active AND pt.categ_id = ANY(%(category_ids)s)
+          GROUP BY pt.categ_id
+        """, company_ids=self.env.companies.ids, category_ids=category_ids))
+        return {categ_id: (count, qty) for categ_id, count, qty in self.env.cr.fetchall()}
+
+    @api.model
+    def _render_product_by_category(self, data):
+        category_name = data['query']
+        if not data['categories']:
+            available = ', '.join(data['available'])
+            if not category_name:
+                return f"🗂️ Categorías disponibles: {available}.\nEscribe 'productos de la categoría <nombre>'."
+            return f"No se encontraron categorías llamadas '{category_name}'. Categorías disponibles: {available}."
+
+        if not data['rows']:
             return f"No hay productos en la categoría '{category_name}'."
-        
-        result = [f"Productos en '{category_name}':"]
-        for p in products:
-            result.append(f"  • {p.name}: {int(p.qty_available)} unidades")
-        
-        return "\n".join(result)
\ No newline at end of file
+
+        names = ', '.join(group['name'] for group in data['categories'])
+        qty = sum(group['qty'] for group in data['categories'])
+        result = [f"Productos en '{names}' ({data['total']} productos, {int(qty)} unidades en stock):"]
+        if data['subcategories']:
+            result.append("🗂️ Subcategorías: " + ', '.join(
+                f"{group['name']} ({group['products']})" for group in data['subcategories']))
+        for row in data['rows']:
+            result.append(f"  • {row['name']}: {int(row['qty'])} unidades")
+        if data['more']:
+            result.append("\n➡️ Escribe 'ver más' para ver más productos.")
+
+        return "\n".join(result)
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    # Las búsquedas por categoría filtran product_template por categ_id
+    categ_id = fields.Many2one(index=True)
+
+
+class ProductCategory(models.Model):
+    _inherit = 'product.category'
+
+    @api.model
+    @tools.ormcache()
+    def _get_ai_category_index(self):
+        """Índice de categorías construido desde ``parent_path``
+
+        ``keys``: nombre y rutas normalizados (sin acentos ni palabras vacías)
+        -> ids; ``subtrees``: id -> ids de la categoría y sus
+        descendientes; ``parents``, ``names`` (ruta completa) y ``top``, las
+        categorías principales (las hijas de la raíz si solo hay una).
+        """
+        self.flush_model(['name', 'complete_name', 'parent_id', 'parent_path'])
+        self.env.cr.execute("SELECT id, name, complete_name, parent_path FROM product_category ORDER BY complete_name, id")
+        keys, subtrees, parents, names = {}, {}, {}, {}
+        for category_id, name, complete_name, parent_path in self.env.cr.fetchall():
+            names[category_id] = complete_name or name
+            # Nombre, ruta completa y cada ruta parcial hasta la hoja ("Muebles / Oficina" sin "All / ")
+            segments = (complete_name or name).split('/')
+            for key in {_category_key(name)} | {_category_key('/'.join(segments[i:])) for i in range(len(segments))}:
+                if key:
+                    keys.setdefault(key, []).append(category_id)
+            ancestors = [int(ancestor) for ancestor in (parent_path or f"{category_id}/").strip('/').split('/')]
+            parents[category_id] = ancestors[-2] if len(ancestors) > 1 else False
+            for ancestor in ancestors:
+                subtrees.setdefault(ancestor, []).append(category_id)
+        roots = [category_id for category_id, parent_id in parents.items() if not parent_id]
+        top = roots
+        if len(roots) == 1:
+            top = [category_id for category_id, parent_id in parents.items() if parent_id == roots[0]] or roots
+        return {
+            'keys': {key: tuple(ids) for key, ids in keys.items()},
+            'subtrees': {category_id: tuple(ids) for category_id, ids in subtrees.items()},
+            'parents': parents,
+            'names': names,
+            'top': tuple(top),
+        }
+
+    @api.model
+    def _match_ai_categories(self, text):
+        """Ids de las categorías nombradas en ``text`` (sin las descendientes de otra coincidencia)
+
+        Primero por nombre o ruta exactos, acortando el texto por el final
+        ("muebles de oficina por favor" -> "muebles oficina"); si no, por
+        coincidencia parcial.
+        """
+        index = self._get_ai_category_index()
+        words = _category_key(text).split()
+        matched = ()
+        for size in range(len(words), 0, -1):
+            matched = index['keys'].get(' '.join(words[:size]), ())
+            if matched:
+                break
+        if not matched and words:
+            key = ' '.join(words)
+            matched = [category_id for name, ids in index['keys'].items() if key in name for category_id in ids]
+        matched = set(matched)
+        return tuple(sorted(
+            (category_id for category_id in matched if not _has_ancestor(index, category_id, matched)),
+            key=lambda category_id: index['names'][category_id],
+        ))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env.registry.clear_cache()
+        self.env['ai.tool.cache']._invalidate('stock')
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if 'name' in vals or 'parent_id' in vals:
+            self.env.registry.clear_cache()
+            self.env['ai.tool.cache']._invalidate('stock')
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        self.env['ai.tool.cache']._invalidate('stock')
+        return super().unlink()
+
+
+def _category_key(text):
+    """Nombre o ruta de categoría en minúsculas, sin acentos, separadores ni palabras vacías"""
+    return ' '.join(word for word in semantic_index.normalize(text) if word not in CATEGORY_STOPWORDS)
+
+
+def _has_ancestor(index, category_id, candidates):
+    parent_id = index['parents'][category_id]
+    while parent_id:
+        if parent_id in candidates:
+            return True
+        parent_id = index['parents'][parent_id]
+    return False
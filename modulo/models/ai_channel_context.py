@@ -0,0 +1,97 @@
+from odoo import models, api, fields
+from odoo.tools import SQL
+from datetime import timedelta
+import json
+
+DEFAULT_TTL = 900
+# Ids guardados como máximo por canal y contextos conservados en la tabla
+MAX_CONTEXT_IDS = 50
+MAX_CONTEXTS = 10000
+QUERY_MAX_LENGTH = 200
+
+
+class AIChannelContext(models.Model):
+    """Último resultado de listado de cada canal de livechat
+
+    Guarda la intención, la herramienta y su argumento, los ids mostrados y
+    el cursor de la página siguiente, para que las preguntas de seguimiento
+    ("ver más", "el segundo", "¿cuáles de esos tienen stock?") trabajen
+    sobre esos ids en lugar de repetir la búsqueda. Una fila por canal que
+    caduca a los ``modulo.ai_context_ttl`` segundos.
+    """
+    _name = "ai.channel.context"
+    _description = "Contexto de conversación IA por canal"
+    _log_access = False
+
+    channel_id = fields.Many2one('discuss.channel', string="Canal", required=True, ondelete='cascade')
+    intent = fields.Char(string="Intención")
+    tool = fields.Char(string="Herramienta")
+    query = fields.Char(string="Consulta")
+    res_model = fields.Char(string="Modelo")
+    # Ids del resultado en orden de aparición
+    res_ids = fields.Json(string="Ids")
+    cursor = fields.Char(string="Cursor")
+    expires_at = fields.Datetime(string="Expira", required=True, index=True)
+
+    _channel_uniq = models.Constraint('UNIQUE(channel_id)', "Solo puede existir un contexto por canal.")
+
+    @api.model
+    def _get_ttl(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('modulo.ai_context_ttl', DEFAULT_TTL) or 0)
+
+    @api.model
+    def _remember(self, channel, intent, tool, query, res_model, ids, cursor=None):
+        """Sustituye el contexto del canal por este resultado"""
+        ttl = self._get_ttl()
+        if ttl <= 0:
+            return
+        self.env.cr.execute(SQL("""
+            INSERT INTO ai_channel_context (channel_id, intent, tool, query, res_model, res_ids, cursor, expires_at)
+                 VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s, %s)
+            ON CONFLICT (channel_id) DO UPDATE
+                    SET intent = EXCLUDED.intent,
+                        tool = EXCLUDED.tool,
+                        query = EXCLUDED.query,
+                        res_model = EXCLUDED.res_model,
+                        res_ids = EXCLUDED.res_ids,
+                        cursor = EXCLUDED.cursor,
+                        expires_at = EXCLUDED.expires_at
+        """, channel.id, intent, tool, query and query[:QUERY_MAX_LENGTH], res_model,
+            json.dumps(list(dict.fromkeys(ids))[:MAX_CONTEXT_IDS]), cursor or None,
+            fields.Datetime.now() + timedelta(seconds=ttl)))
+        self.invalidate_model()
+
+    @api.model
+    def _recall(self, channel):
+        """Contexto vigente del canal como dict, o None"""
+        if self._get_ttl() <= 0:
+            return None
+        self.env.cr.execute(SQL("""
+            SELECT intent, tool, query, res_model, COALESCE(res_ids, '[]'), cursor
+              FROM ai_channel_context
+             WHERE channel_id = %s AND expires_at > %s
+        """, channel.id, fields.Datetime.now()))
+        row = self.env.cr.fetchone()
+        if not row:
+            return None
+        return dict(zip(('intent', 'tool', 'query', 'res_model', 'ids', 'cursor'), row))
+
+    @api.model
+    def _narrow(self, channel, ids):
+        """Reduce el contexto a un subconjunto de sus ids (ya no hay página siguiente)"""
+        self.env.cr.execute(SQL("""
+            UPDATE ai_channel_context
+               SET res_ids = %s::jsonb, cursor = NULL, expires_at = %s
+             WHERE channel_id = %s
+        """, json.dumps(list(ids)[:MAX_CONTEXT_IDS]), fields.Datetime.now() + timedelta(seconds=self._get_ttl()), channel.id))
+        self.invalidate_model()
+
+    @api.autovacuum
+    def _gc_contexts(self):
+        """Elimina los contextos caducados y, por encima de MAX_CONTEXTS, los que caducan antes"""
+        self.env.cr.execute(SQL("DELETE FROM ai_channel_context WHERE expires_at <= %s", fields.Datetime.now()))
+        self.env.cr.execute(SQL("""
+            DELETE FROM ai_channel_context
+             WHERE id IN (SELECT id FROM ai_channel_context ORDER BY expires_at DESC OFFSET %s)
+        """, MAX_CONTEXTS))
+        self.invalidate_model()
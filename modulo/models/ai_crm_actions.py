@@ -1,98 +1,202 @@
-from odoo import models, api
+from odoo import models, api, tools
+from odoo.tools import email_normalize
+import time
+
+from .ai_tool_cache import cached_tool
+from ..tools import metrics, tool_results
+
+# Máximo de productos candidatos en la búsqueda de cotizaciones
+QUOTATION_PRODUCT_LIMIT = 50
+# Diferencia de cantidad que se considera cubierta al asignar stock
+FILL_TOLERANCE = 1e-6
+
+
+class CrmStage(models.Model):
+    _inherit = 'crm.stage'
+
+    @api.model
+    @tools.ormcache('self.env.lang')
+    def _get_ai_stage_map(self):
+        """Mapa nombre de etapa en minúsculas -> id, en orden de secuencia"""
+        stage_map = {}
+        for stage in self.sudo().search_fetch([], ['name']):
+            stage_map.setdefault(stage.name.lower(), stage.id)
+        return stage_map
+
+    @api.model
+    def _match_ai_stage(self, stage_map, stage_name):
+        """Id de etapa por nombre exacto o, si no hay, por coincidencia parcial"""
+        if not stage_name:
+            return False
+        key = stage_name.strip().lower()
+        if key in stage_map:
+            return stage_map[key]
+        return next((stage_id for name, stage_id in stage_map.items() if key in name), False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env.registry.clear_cache()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if 'name' in vals or 'sequence' in vals:
+            self.env.registry.clear_cache()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super().unlink()
+
 
 class AICrmActions(models.AbstractModel):
     _name = "ai.crm.actions"
     _description = "Acciones IA CRM"
 
     @api.model
-    def get_lead_info(self, lead_name):
-        """Obtiene información de leads u oportunidades por nombre"""
-        leads = self.env['crm.lead'].sudo().search([
-            ('name', 'ilike', lead_name)
-        ], limit=5)
+    @metrics.instrumented
+    @cached_tool('crm')
+    def get_lead_info(self, lead_name, structured=False, limit=5, cursor=None):
+        """Leads u oportunidades por nombre, cliente, correo o teléfono, por relevancia
+
+        Usa el índice de texto completo de crm_lead (ver ``ai.lead.search``);
+        un correo o teléfono completo se resuelve por igualdad.
+        """
+        offset = tool_results.decode_cursor(cursor)
+        lead_ids = self.env['ai.lead.search']._find_lead_ids(lead_name, offset=offset, limit=limit + 1)
+        leads = self.env['crm.lead'].sudo().browse(lead_ids[:limit])
+        data = {
+            'tool': 'get_lead_info',
+            'query': lead_name,
+            'offset': offset,
+            'more': len(lead_ids) > limit,
+            'rows': self._lead_rows(leads),
+        }
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_lead_info(data)
 
-        if not leads:
-            return f"No se encontraron leads u oportunidades llamadas '{lead_name}'."
+    @api.model
+    def _describe_leads(self, lead_ids, query, stage=None):
+        """Datos de ``get_lead_info`` para leads ya conocidos, sin volver a buscar
+
+        ``stage`` se queda con los que están en una etapa con ese nombre.
+        """
+        leads = self.env['crm.lead'].sudo().browse(lead_ids).exists()
+        if stage:
+            leads = leads.filtered(lambda l: stage.lower() in (l.stage_id.name or '').lower())
+        return {'tool': 'get_lead_info', 'query': query, 'rows': self._lead_rows(leads)}
+
+    @api.model
+    def _lead_rows(self, leads):
+        leads.fetch(['name', 'type', 'stage_id', 'partner_id', 'user_id', 'probability', 'expected_revenue'])
+        return [
+            {
+                'id': l.id,
+                'name': l.name,
+                'type': l.type,
+                'stage': l.stage_id.name or False,
+                'partner': l.partner_id.display_name or False,
+                'user': l.user_id.name or False,
+                'prob': l.probability,
+                'revenue': l.expected_revenue,
+            }
+            for l in leads
+        ]
+
+    @api.model
+    def _render_lead_info(self, data):
+        if not data['rows']:
+            return f"No se encontraron leads u oportunidades llamadas '{data['query']}'."
 
         result = []
-        for l in leads:
-            tipo = "Oportunidad" if l.type == "opportunity" else "Lead"
-            stage = l.stage_id.name if l.stage_id else "Sin etapa"
-            cliente = l.partner_id.display_name if l.partner_id else "Sin cliente"
-            vendedor = l.user_id.name if l.user_id else "Sin vendedor"
+        for row in data['rows']:
+            tipo = "Oportunidad" if row['type'] == "opportunity" else "Lead"
             result.append(
-                f"🧩 {l.name}\n"
+                f"🧩 {row['name']}\n"
                 f"  • Tipo: {tipo}\n"
-                f"  • Etapa: {stage}\n"
-                f"  • Cliente: {cliente}\n"
-                f"  • Vendedor: {vendedor}\n"
-                f"  • Probabilidad: {l.probability}%\n"
-                f"  • Ingreso esperado: ${l.expected_revenue:,.2f}"
+                f"  • Etapa: {row['stage'] or 'Sin etapa'}\n"
+                f"  • Cliente: {row['partner'] or 'Sin cliente'}\n"
+                f"  • Vendedor: {row['user'] or 'Sin vendedor'}\n"
+                f"  • Probabilidad: {row['prob']}%\n"
+                f"  • Ingreso esperado: ${row['revenue']:,.2f}"
             )
 
         return "\n\n".join(result)
 
     @api.model
-    def list_open_opportunities(self, limit=10):
+    def _get_token_budget(self, structured=True):
+        return self.env['ai.inventory.actions']._get_token_budget(structured)
+
+    @api.model
+    @metrics.instrumented
+    @cached_tool('crm')
+    def list_open_opportunities(self, limit=10, structured=False, cursor=None):
         """Lista oportunidades abiertas"""
+        offset = tool_results.decode_cursor(cursor)
         opportunities = self.env['crm.lead'].sudo().search([
             ('type', '=', 'opportunity'),
             ('active', '=', True),
             ('probability', '<', 100),
-        ], limit=limit, order="probability desc, expected_revenue desc")
+        ], offset=offset, limit=limit + 1, order="probability desc, expected_revenue desc")
+        data = {
+            'tool': 'list_open_opportunities',
+            'offset': offset,
+            'more': len(opportunities) > limit,
+            'rows': [
+                {
+                    'id': o.id,
+                    'name': o.name,
+                    'stage': o.stage_id.name or False,
+                    'prob': o.probability,
+                    'revenue': o.expected_revenue,
+                }
+                for o in opportunities[:limit]
+            ],
+        }
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_open_opportunities(data)
 
-        if not opportunities:
+    @api.model
+    def _render_open_opportunities(self, data):
+        if not data['rows']:
             return "✅ No hay oportunidades abiertas."
 
         result = ["📌 Oportunidades abiertas:"]
-        for o in opportunities:
-            stage = o.stage_id.name if o.stage_id else "Sin etapa"
+        for row in data['rows']:
             result.append(
-                f"  • {o.name} ({stage}) - {o.probability}% - ${o.expected_revenue:,.2f}"
+                f"  • {row['name']} ({row['stage'] or 'Sin etapa'}) - {row['prob']}% - ${row['revenue']:,.2f}"
             )
 
         return "\n".join(result)
 
     @api.model
-    def create_opportunity(self, name, customer_name=None, email=None, phone=None, stage_name=None, expected_revenue=0.0):
+    @metrics.instrumented
+    def create_opportunity(self, name, customer_name=None, email=None, phone=None, stage_name=None, expected_revenue=0.0,
+                           structured=False):
         """Crea una oportunidad con los campos indicados"""
         if not name:
             return "❌ El nombre de la oportunidad es obligatorio."
 
-        partner = False
-        if customer_name or email or phone:
-            domain = []
-            if email:
-                domain = ['|', ('email', '=', email), ('name', 'ilike', customer_name or '')]
-            elif phone:
-                domain = ['|', ('phone', '=', phone), ('name', 'ilike', customer_name or '')]
-            else:
-                domain = [('name', 'ilike', customer_name)]
-            partner = self.env['res.partner'].sudo().search(domain, limit=1)
-            if not partner and customer_name:
-                partner = self.env['res.partner'].sudo().create({
-                    'name': customer_name,
-                    'email': email,
-                    'phone': phone,
-                })
-
-        stage_id = False
-        if stage_name:
-            stage = self.env['crm.stage'].sudo().search([('name', 'ilike', stage_name)], limit=1)
-            stage_id = stage.id if stage else False
-
-        opportunity_vals = {
+        _results, opportunity = self._create_leads([{
             'name': name,
-            'partner_id': partner.id if partner else False,
-            'email_from': email,
+            'customer_name': customer_name,
+            'email': email,
             'phone': phone,
-            'expected_revenue': expected_revenue or 0.0,
+            'stage_name': stage_name,
+            'expected_revenue': expected_revenue,
             'type': 'opportunity',
-        }
-        if stage_id:
-            opportunity_vals['stage_id'] = stage_id
-
-        opportunity = self.env['crm.lead'].sudo().create(opportunity_vals)
+        }])
+
+        if structured:
+            return tool_results.dump({
+                'tool': 'create_opportunity',
+                'id': opportunity.id,
+                'name': opportunity.name,
+                'partner_id': opportunity.partner_id.id,
+                'stage': opportunity.stage_id.name or False,
+                'revenue': opportunity.expected_revenue,
+            })
 
         stage_label = opportunity.stage_id.name if opportunity.stage_id else "Sin etapa"
         return (
@@ -105,94 +209,149 @@ class AICrmActions(models.AbstractModel):
         )
 
     @api.model
-    def get_pipeline_summary(self):
-        """Resumen del pipeline por etapa (compatible Odoo 19)"""
-        opportunities = self.env['crm.lead'].sudo().search([
-            ('type', '=', 'opportunity'),
-            ('active', '=', True),
-        ])
+    @metrics.instrumented
+    @cached_tool('crm')
+    def get_pipeline_summary(self, by_salesperson=False, structured=False):
+        """Resumen del pipeline por etapa (y opcionalmente por vendedor) con ingreso ponderado"""
+        # Los grupos llegan ordenados por la secuencia de la etapa
+        stage_data = {}
+        user_data = {}
+        for stage, user, count, revenue, weighted in self._read_pipeline_groups():
+            for totals_by_key, key in ((stage_data, stage), (user_data, user)):
+                totals = totals_by_key.setdefault(key, [0, 0.0, 0.0])
+                totals[0] += count
+                totals[1] += revenue
+                totals[2] += weighted
+
+        data = {
+            'tool': 'get_pipeline_summary',
+            'stages': [
+                {'id': stage.id, 'name': stage.name or False, 'count': count, 'revenue': revenue, 'weighted': weighted}
+                for stage, (count, revenue, weighted) in stage_data.items()
+            ],
+        }
+        if by_salesperson:
+            data['users'] = [
+                {'id': user.id, 'name': user.name or False, 'count': count, 'revenue': revenue, 'weighted': weighted}
+                for user, (count, revenue, weighted) in sorted(user_data.items(), key=lambda item: -item[1][2])
+            ]
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_pipeline_summary(data)
 
-        if not opportunities:
+    @api.model
+    def _render_pipeline_summary(self, data):
+        if not data['stages']:
             return "✅ No hay datos en el pipeline."
 
-        stage_data = {}
-        for opp in opportunities:
-            stage_name = opp.stage_id.name if opp.stage_id else "Sin etapa"
-            if stage_name not in stage_data:
-                stage_data[stage_name] = {'count': 0, 'revenue': 0.0}
-            stage_data[stage_name]['count'] += 1
-            stage_data[stage_name]['revenue'] += opp.expected_revenue
-
         result = ["📊 Resumen del pipeline por etapa:"]
-        for stage, data in stage_data.items():
-            result.append(f"  • {stage}: {data['count']} oportunidades - ${data['revenue']:,.2f}")
+        for group in data['stages']:
+            result.append(
+                f"  • {group['name'] or 'Sin etapa'}: {group['count']} oportunidades - ${group['revenue']:,.2f} "
+                f"(ponderado ${group['weighted']:,.2f})"
+            )
+
+        if 'users' in data:
+            result.append("\n👤 Por vendedor:")
+            for group in data['users']:
+                result.append(
+                    f"  • {group['name'] or 'Sin vendedor'}: {group['count']} oportunidades - ${group['revenue']:,.2f} "
+                    f"(ponderado ${group['weighted']:,.2f})"
+                )
 
         return "\n".join(result)
 
     @api.model
-    def search_leads_by_stage(self, stage_name):
+    def _read_pipeline_groups(self):
+        """[(etapa, vendedor, conteo, ingreso, ingreso ponderado)] ordenado por etapa
+
+        Lee la tabla de agregados si está activa (O(etapas × vendedores));
+        si no, agrupa crm.lead en una sola consulta.
+        """
+        Aggregate = self.env['ai.pipeline.aggregate'].sudo()
+        if Aggregate._is_enabled():
+            groups = Aggregate._read_group(
+                [('lead_count', '!=', 0)], ['stage_id', 'user_id'],
+                ['lead_count:sum', 'expected_revenue:sum', 'weighted_revenue:sum'],
+            )
+        else:
+            groups = self.env['crm.lead'].sudo()._read_group(
+                [('type', '=', 'opportunity'), ('active', '=', True)], ['stage_id', 'user_id'],
+                ['__count', 'expected_revenue:sum', 'prorated_revenue:sum'],
+            )
+        return [(stage, user, count, revenue or 0.0, weighted or 0.0) for stage, user, count, revenue, weighted in groups]
+
+    @api.model
+    @metrics.instrumented
+    @cached_tool('crm')
+    def search_leads_by_stage(self, stage_name, structured=False, limit=10, cursor=None):
         """Busca leads u oportunidades por etapa"""
+        offset = tool_results.decode_cursor(cursor)
         stages = self.env['crm.stage'].sudo().search([
             ('name', 'ilike', stage_name)
         ])
+        data = {
+            'tool': 'search_leads_by_stage',
+            'query': stage_name,
+            'stages': stages.ids,
+            'offset': offset,
+            'rows': [],
+        }
 
-        if not stages:
-            return f"No se encontraron etapas llamadas '{stage_name}'."
+        if stages:
+            leads = self.env['crm.lead'].sudo().search([
+                ('stage_id', 'in', stages.ids)
+            ], offset=offset, limit=limit + 1)
+            data['more'] = len(leads) > limit
+            data['rows'] = [{'id': l.id, 'name': l.name, 'type': l.type} for l in leads[:limit]]
 
-        leads = self.env['crm.lead'].sudo().search([
-            ('stage_id', 'in', stages.ids)
-        ], limit=10)
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_leads_by_stage(data)
 
-        if not leads:
+    @api.model
+    def _render_leads_by_stage(self, data):
+        stage_name = data['query']
+        if not data['stages']:
+            return f"No se encontraron etapas llamadas '{stage_name}'."
+
+        if not data['rows']:
             return f"No hay leads u oportunidades en la etapa '{stage_name}'."
 
         result = [f"Leads/Oportunidades en '{stage_name}':"]
-        for l in leads:
-            tipo = "Oportunidad" if l.type == "opportunity" else "Lead"
-            result.append(f"  • {l.name} ({tipo})")
+        for row in data['rows']:
+            tipo = "Oportunidad" if row['type'] == "opportunity" else "Lead"
+            result.append(f"  • {row['name']} ({tipo})")
 
         return "\n".join(result)
     
     @api.model
-    def create_lead(self, name, customer_name=None, email=None, phone=None, stage_name=None, expected_revenue=0.0):
+    @metrics.instrumented
+    def create_lead(self, name, customer_name=None, email=None, phone=None, stage_name=None, expected_revenue=0.0,
+                    structured=False):
         """Crea un lead con los campos indicados"""
         if not name:
             return "❌ El nombre del lead es obligatorio."
 
-        partner = False
-        if customer_name or email or phone:
-            domain = []
-            if email:
-                domain = ['|', ('email', '=', email), ('name', 'ilike', customer_name or '')]
-            elif phone:
-                domain = ['|', ('phone', '=', phone), ('name', 'ilike', customer_name or '')]
-            else:
-                domain = [('name', 'ilike', customer_name)]
-            partner = self.env['res.partner'].sudo().search(domain, limit=1)
-            if not partner and customer_name:
-                partner = self.env['res.partner'].sudo().create({
-                    'name': customer_name,
-                    'email': email,
-                    'phone': phone,
-                })
-
-        stage_id = False
-        if stage_name:
-            stage = self.env['crm.stage'].sudo().search([('name', 'ilike', stage_name)], limit=1)
-            stage_id = stage.id if stage else False
-
-        lead_vals = {
+        _results, lead = self._create_leads([{
             'name': name,
-            'partner_id': partner.id if partner else False,
-            'email_from': email,
+            'customer_name': customer_name,
+            'email': email,
             'phone': phone,
-            'expected_revenue': expected_revenue or 0.0,
+            'stage_name': stage_name,
+            'expected_revenue': expected_revenue,
             'type': 'lead',
-        }
-        if stage_id:
-            lead_vals['stage_id'] = stage_id
-
-        lead = self.env['crm.lead'].sudo().create(lead_vals)
+        }])
+
+        if structured:
+            return tool_results.dump({
+                'tool': 'create_lead',
+                'id': lead.id,
+                'name': lead.name,
+                'partner_id': lead.partner_id.id,
+                'stage': lead.stage_id.name or False,
+                'revenue': lead.expected_revenue,
+            })
 
         stage_label = lead.stage_id.name if lead.stage_id else "Sin etapa"
         return (
@@ -204,64 +363,269 @@ class AICrmActions(models.AbstractModel):
             f"  • Ingreso esperado: ${lead.expected_revenue:,.2f}"
         )
     @api.model
-    def search_quotations_with_stock(self, product_name):
-        """Busca cotizaciones que contengan un producto y muestra stock disponible"""
-        # Buscar productos relacionados
-        products = self.env['product.product'].sudo().search([
-            '|', '|',
-            ('name', 'ilike', product_name),
-            ('description', 'ilike', product_name),
-            ('categ_id.name', 'ilike', product_name)
-        ])
+    @metrics.instrumented
+    def create_leads_batch(self, leads):
+        """Crea leads u oportunidades en bloque
+
+        ``leads`` es una lista de dicts con ``name``, ``customer_name``,
+        ``email``, ``phone``, ``stage_name``, ``expected_revenue`` y ``type``
+        ('lead' u 'opportunity', por defecto 'lead'). Devuelve el resultado de
+        cada fila y el rendimiento de la importación.
+        """
+        start = time.perf_counter()
+        results, records = self._create_leads(leads)
+        elapsed = time.perf_counter() - start
+        return {
+            'results': results,
+            'created': len(records),
+            'errors': sum(1 for row in results if row['status'] == 'error'),
+            'elapsed': elapsed,
+            'throughput': len(leads) / elapsed if elapsed else 0.0,
+        }
 
-        if not products:
-            return f"❌ No se encontraron productos relacionados con '{product_name}'."
+    @api.model
+    def _create_leads(self, rows):
+        """Valida las filas, resuelve clientes y etapas de las válidas y crea los leads con un único create"""
+        results = [
+            {'row': index, 'status': 'created'} if row.get('name')
+            else {'row': index, 'status': 'error', 'message': "El nombre es obligatorio."}
+            for index, row in enumerate(rows)
+        ]
+        valid = [(result, row) for result, row in zip(results, rows) if result['status'] == 'created']
+        # Solo las filas válidas crean clientes: una fila rechazada no deja un res.partner huérfano
+        partners = self._resolve_partners([row for _result, row in valid])
+        stage_map = self.env['crm.stage']._get_ai_stage_map()
+
+        vals_list = []
+        for (_result, row), partner in zip(valid, partners):
+            vals = {
+                'name': row['name'],
+                'partner_id': partner.id,
+                'email_from': row.get('email'),
+                'phone': row.get('phone'),
+                'expected_revenue': row.get('expected_revenue') or 0.0,
+                'type': 'opportunity' if row.get('type') == 'opportunity' else 'lead',
+            }
+            stage_id = self.env['crm.stage']._match_ai_stage(stage_map, row.get('stage_name'))
+            if stage_id:
+                vals['stage_id'] = stage_id
+            vals_list.append(vals)
+
+        records = self.env['crm.lead'].sudo().create(vals_list)
+        for (result, _row), record in zip(valid, records):
+            result.update(id=record.id, partner_id=record.partner_id.id, type=record.type)
+        return results, records
+
+    @api.model
+    def _resolve_partners(self, rows):
+        """Cliente de cada fila: por email o teléfono exactos, luego por nombre; crea los que falten
+
+        Una sola búsqueda para todas las filas y un único create para los nuevos.
+        """
+        Partner = self.env['res.partner'].sudo()
+        keys = []
+        for row in rows:
+            email = email_normalize(row.get('email') or '') or False
+            phone = (row.get('phone') or '').strip() or False
+            name = (row.get('customer_name') or '').strip() or False
+            keys.append((email, phone, name))
+
+        emails = list({email for email, _phone, _name in keys if email})
+        phones = list({phone for _email, phone, _name in keys if phone})
+        names = list({name for _email, _phone, name in keys if name})
+        by_email, by_phone, by_name = {}, {}, {}
+        if emails or phones or names:
+            domain = ['|', '|',
+                      ('email_normalized', 'in', emails),
+                      ('phone', 'in', phones),
+                      ('name', 'in', names)]
+            for partner in Partner.search_fetch(domain, ['email_normalized', 'phone', 'name'], order='id'):
+                by_email.setdefault(partner.email_normalized, partner)
+                by_phone.setdefault(partner.phone, partner)
+                by_name.setdefault(partner.name, partner)
+
+        matches = [
+            (email and by_email.get(email)) or (phone and by_phone.get(phone)) or (name and by_name.get(name)) or Partner
+            for email, phone, name in keys
+        ]
+
+        # Crear una sola vez cada cliente nuevo, aunque aparezca en varias filas
+        to_create = {}
+        for (email, phone, name), partner, row in zip(keys, matches, rows):
+            if not partner and name:
+                to_create.setdefault(email or phone or name, {
+                    'name': name,
+                    'email': row.get('email'),
+                    'phone': row.get('phone'),
+                })
+        if to_create:
+            created = dict(zip(to_create, Partner.create(list(to_create.values()))))
+            matches = [
+                partner or (name and created.get(email or phone or name)) or Partner
+                for (email, phone, name), partner in zip(keys, matches)
+            ]
+        return matches
+
+    @api.model
+    @metrics.instrumented
+    @cached_tool('mixed')
+    def search_quotations_with_stock(self, product_name, structured=False, limit=10, cursor=None):
+        """Busca cotizaciones que contengan un producto y muestra qué parte puede servirse
+
+        El stock libre se reparte entre todas las cotizaciones abiertas de los
+        productos en orden de prioridad, de modo que dos cotizaciones no cuentan
+        las mismas unidades. Número de consultas constante: productos,
+        cotizaciones, líneas, stock y nombres se leen en bloque.
+        """
+        offset = tool_results.decode_cursor(cursor)
+        data = {'tool': 'search_quotations_with_stock', 'query': product_name, 'offset': offset, 'rows': []}
+
+        # Buscar productos relacionados (los más relevantes)
+        products = self.env['ai.product.search'].sudo()._find_products(product_name, limit=QUOTATION_PRODUCT_LIMIT)
+        data['products'] = products[:3].mapped('name')
+        if products:
+            # Cotizaciones (sale.order en estado draft o sent) con alguna línea de esos productos,
+            # en el orden en que reciben el stock
+            allocation = self._allocate_quotation_stock(products)
+            order_ids = list(dict.fromkeys(allocation['lines'].order_id.ids))
+            data['more'] = len(order_ids) > offset + limit
+            quotations = self.env['sale.order'].sudo().browse(order_ids[offset:offset + limit])
+            data['rows'] = self._read_quotation_rows(quotations, allocation)
+
+        if structured:
+            return tool_results.dump(data, self._get_token_budget(structured))
+        return self._render_quotations_with_stock(data)
 
-        # Buscar cotizaciones (sale.order en estado draft o sent)
-        quotations = self.env['sale.order'].sudo().search([
-            ('state', 'in', ['draft', 'sent']),
-            ('order_line.product_id', 'in', products.ids)
-        ], limit=10)
+    @api.model
+    def _allocate_quotation_stock(self, products):
+        """Reparte el stock de los productos entre todas sus cotizaciones abiertas
+
+        Las líneas se leen de una vez y se recorren en orden de prioridad
+        (fecha de la cotización o importe, según ``modulo.quotation_priority``);
+        cada una toma lo que pide, convertido a la unidad del producto, de lo
+        que queda libre (``free_qty``) o pronosticado (``virtual_available``).
+        Devuelve las líneas ordenadas, ``fill`` por línea y el stock inicial.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        priority = params.get_param('modulo.quotation_priority', 'date')
+        stock_field = 'virtual_available' if params.get_param('modulo.quotation_stock_basis') == 'forecast' else 'free_qty'
+
+        lines = self.env['sale.order.line'].sudo().search_fetch(
+            [('order_id.state', 'in', ['draft', 'sent']), ('product_id', 'in', products.ids)],
+            ['order_id', 'product_id', 'product_uom_id', 'product_uom_qty', 'price_unit', 'price_subtotal'],
+        )
+        lines.order_id.fetch(['name', 'partner_id', 'state', 'date_order', 'amount_total'])
+        if priority == 'amount':
+            lines = lines.sorted(lambda line: (-line.order_id.amount_total, line.order_id.date_order, line.order_id.id, line.id))
+        else:
+            lines = lines.sorted(lambda line: (line.order_id.date_order, line.order_id.id, line.id))
+
+        stock_products = lines.product_id
+        stock = dict(zip(stock_products.ids, stock_products.mapped(stock_field)))
+        remaining = {product_id: max(qty, 0.0) for product_id, qty in stock.items()}
+        fill = {}
+        for line in lines:
+            product = line.product_id
+            requested = line.product_uom_qty
+            if line.product_uom_id and line.product_uom_id != product.uom_id:
+                requested = line.product_uom_id._compute_quantity(requested, product.uom_id, round=False)
+            allocated = min(remaining[product.id], requested)
+            remaining[product.id] -= allocated
+            if allocated >= requested - FILL_TOLERANCE:
+                status = 'full'
+            elif allocated > FILL_TOLERANCE:
+                status = 'partial'
+            else:
+                status = 'none'
+            fill[line.id] = {'requested': requested, 'allocated': allocated, 'status': status}
+        return {'lines': lines, 'fill': fill, 'stock': stock}
 
+    @api.model
+    def _read_quotation_rows(self, quotations, allocation):
+        """Cotizaciones con sus líneas de esos productos y el stock asignado a cada una"""
         if not quotations:
-            product_names = ', '.join(products.mapped('name')[:3])
+            return []
+        lines_by_order = allocation['lines'].grouped('order_id')
+        products = allocation['lines'].product_id
+        product_names = dict(zip(products.ids, products.mapped('name')))
+        uoms = allocation['lines'].product_uom_id | products.uom_id
+        uom_names = dict(zip(uoms.ids, uoms.mapped('name')))
+        customers = dict(zip(quotations.partner_id.ids, quotations.partner_id.mapped('display_name')))
+
+        return [
+            {
+                'id': quote.id,
+                'name': quote.name,
+                'partner': customers.get(quote.partner_id.id, False),
+                'state': quote.state,
+                'date': quote.date_order.date().isoformat(),
+                'total': quote.amount_total,
+                'lines': [
+                    {
+                        'product_id': line.product_id.id,
+                        'product': product_names[line.product_id.id],
+                        'qty': line.product_uom_qty,
+                        'uom': uom_names.get(line.product_uom_id.id, False),
+                        'price': line.price_unit,
+                        'subtotal': line.price_subtotal,
+                        'requested': allocation['fill'][line.id]['requested'],
+                        'allocated': allocation['fill'][line.id]['allocated'],
+                        'fill': allocation['fill'][line.id]['status'],
+                        'stock': allocation['stock'][line.product_id.id],
+                        'stock_uom': uom_names.get(line.product_id.uom_id.id, False),
+                    }
+                    for line in lines_by_order[quote]
+                ],
+            }
+            for quote in quotations
+        ]
+
+    @api.model
+    def _render_quotations_with_stock(self, data):
+        product_name = data['query']
+        if not data['products']:
+            return f"❌ No se encontraron productos relacionados con '{product_name}'."
+
+        if not data['rows']:
+            product_names = ', '.join(data['products'])
             return f"📋 No se encontraron cotizaciones activas para productos relacionados con '{product_name}' ({product_names})."
 
-        result = [f"📋 Encontré {len(quotations)} cotización(es) para productos relacionados con '{product_name}':\n"]
+        result = [f"📋 Encontré {len(data['rows'])} cotización(es) para productos relacionados con '{product_name}':\n"]
 
-        for quote in quotations:
-            customer = quote.partner_id.display_name if quote.partner_id else "Sin cliente"
-            state_label = "Borrador" if quote.state == 'draft' else "Enviada"
+        for quote in data['rows']:
+            state_label = "Borrador" if quote['state'] == 'draft' else "Enviada"
+            date_order = '/'.join(reversed(quote['date'].split('-')))
             
             result.append(
-                f"📄 **Cotización {quote.name}**\n"
-                f"  • Cliente: {customer}\n"
+                f"📄 **Cotización {quote['name']}**\n"
+                f"  • Cliente: {quote['partner'] or 'Sin cliente'}\n"
                 f"  • Estado: {state_label}\n"
-                f"  • Fecha: {quote.date_order.strftime('%d/%m/%Y')}\n"
-                f"  • Total: ${quote.amount_total:,.2f}\n"
+                f"  • Fecha: {date_order}\n"
+                f"  • Total: ${quote['total']:,.2f}\n"
                 f"  • Productos:"
             )
 
             # Listar productos de la cotización que coincidan con la búsqueda
-            for line in quote.order_line.filtered(lambda l: l.product_id in products):
-                product = line.product_id
-                qty_quoted = int(line.product_uom_qty)
-                stock_available = int(product.qty_available)
+            for line in quote['lines']:
+                uom = line['stock_uom'] or 'unidades'
+                requested = f"{line['requested']:,.2f}".rstrip('0').rstrip('.')
+                allocated = f"{line['allocated']:,.2f}".rstrip('0').rstrip('.')
                 
-                # Verificar si hay suficiente stock
-                if stock_available >= qty_quoted:
-                    stock_status = f"✅ Stock suficiente ({stock_available} disponibles)"
-                elif stock_available > 0:
-                    stock_status = f"⚠️ Stock parcial ({stock_available} disponibles de {qty_quoted} requeridos)"
+                # Parte de la línea cubierta por el stock que dejan las cotizaciones con más prioridad
+                if line['fill'] == 'full':
+                    stock_status = f"✅ Stock suficiente ({allocated} {uom} asignados)"
+                elif line['fill'] == 'partial':
+                    stock_status = f"⚠️ Stock parcial ({allocated} de {requested} {uom} asignados)"
                 else:
-                    stock_status = f"❌ Sin stock ({qty_quoted} requeridos)"
+                    stock_status = f"❌ Sin stock libre ({requested} {uom} requeridos)"
 
                 result.append(
-                    f"    - {product.name}\n"
-                    f"      • Cantidad cotizada: {qty_quoted} unidades\n"
-                    f"      • Precio unitario: ${line.price_unit:,.2f}\n"
-                    f"      • Subtotal: ${line.price_subtotal:,.2f}\n"
-                    f"      • {stock_status}"
+                    f"    - {line['product']}\n"
+                    f"      • Cantidad cotizada: {line['qty']:g} {line['uom'] or 'unidades'}\n"
+                    f"      • Precio unitario: ${line['price']:,.2f}\n"
+                    f"      • Subtotal: ${line['subtotal']:,.2f}\n"
+                    f"      • {stock_status}\n"
+                    f"      • Stock del producto antes de asignar: {int(line['stock'])} {uom}"
                 )
 
-        return "\n\n".join(result)
\ No newline at end of file
+        return "\n\n".join(result)
@@ -0,0 +1,216 @@
+from odoo import models, api, fields, SUPERUSER_ID
+from odoo.modules.registry import Registry
+from odoo.tools import SQL
+from datetime import timedelta
+import atexit
+import functools
+import logging
+
+from ..tools import interaction_buffer
+
+_logger = logging.getLogger(__name__)
+
+PROMPT_MAX_LENGTH = 500
+RETENTION_BATCH = 10000
+ROLLUP_RETENTION_DAYS = 400
+
+
+def _flush_database(dbname):
+    """Vuelca el buffer de ``dbname`` fuera de una petición (hilo de volcado o salida del proceso)"""
+    with Registry(dbname).cursor() as cr:
+        api.Environment(cr, SUPERUSER_ID, {})['ai.interaction.log']._flush_buffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    """Vuelca lo pendiente al terminar el proceso (p. ej. al reciclar un worker por limit_request)"""
+    for dbname, buffer in interaction_buffer.buffers().items():
+        if not buffer.has_pending():
+            continue
+        pending = buffer.stats()['pending']
+        try:
+            _flush_database(dbname)
+        except Exception:
+            _logger.warning("Se pierden %s interacciones IA pendientes de %s al salir", pending, dbname, exc_info=True)
+
+
+class AIInteractionLog(models.Model):
+    """Registro de auditoría de las interacciones del agente IA
+
+    Las filas no se escriben en la transacción del mensaje: ``_log`` las deja
+    en el buffer del proceso y ``_flush_buffer`` las inserta en bloque, junto
+    con los agregados diarios, en su propia transacción.
+    """
+    _name = "ai.interaction.log"
+    _description = "Registro de interacciones IA"
+    _order = "logged_at desc, id desc"
+    _log_access = False
+
+    logged_at = fields.Datetime(string="Fecha", required=True, index=True)
+    # Sin clave foránea: el volcado en bloque no falla si el canal ya no existe
+    channel_ref = fields.Integer(string="ID de canal", index='btree_not_null')
+    prompt = fields.Text(string="Mensaje")
+    intent = fields.Char(string="Intención")
+    tool = fields.Char(string="Herramienta")
+    latency = fields.Float(string="Latencia (s)", digits=(16, 4))
+    reply_size = fields.Integer(string="Tamaño de respuesta (bytes)")
+    state = fields.Selection([
+        ('done', 'Respondido'),
+        ('error', 'Error'),
+        ('shed', 'Descartado por carga'),
+    ], string="Estado", required=True, default='done')
+
+    def init(self):
+        # La retención borra a diario: que autovacuum recupere el espacio sin esperar al 20% por defecto
+        self.env.cr.execute("""
+            ALTER TABLE ai_interaction_log
+              SET (autovacuum_vacuum_scale_factor = 0.02, autovacuum_analyze_scale_factor = 0.02)
+        """)
+
+    @api.model
+    def _log(self, prompt, intent=None, tool=None, latency=0.0, reply=None, state='done', channel=None):
+        """Anota una interacción en el buffer del proceso; vuelca si toca"""
+        buffer = interaction_buffer.get_buffer(self.env.cr.dbname)
+        pending = buffer.append((
+            fields.Datetime.now(),
+            channel.id if channel else None,
+            (prompt or '')[:PROMPT_MAX_LENGTH] or None,
+            intent or None,
+            tool or None,
+            latency,
+            len(reply.encode()) if reply else 0,
+            state,
+        ))
+        # En pruebas el volcado compartiría el cursor y alteraría los conteos de consultas
+        if self.env.registry.in_test_mode():
+            return
+        buffer.start_flusher(functools.partial(_flush_database, self.env.cr.dbname))
+        if buffer.flush_due(pending):
+            self._flush_buffer()
+
+    @api.model
+    def _flush_buffer(self):
+        """Inserta lo acumulado en el buffer y suma los agregados diarios, en su propia transacción
+
+        Devuelve el número de filas escritas. Si la escritura falla las filas
+        se cuentan como descartadas y se reportan en el siguiente volcado.
+        """
+        buffer = interaction_buffer.get_buffer(self.env.cr.dbname)
+        if not buffer.flushing():
+            return 0
+        items, dropped = buffer.drain()
+        written = 0
+        try:
+            if items or dropped:
+                with self.env.registry.cursor() as cr:
+                    if items:
+                        cr.execute(SQL("""
+                            INSERT INTO ai_interaction_log
+                                   (logged_at, channel_ref, prompt, intent, tool, latency, reply_size, state)
+                            VALUES %s
+                        """, SQL(", ").join(SQL("(%s, %s, %s, %s, %s, %s, %s, %s)", *item) for item in items)))
+                    self.env(cr=cr)['ai.interaction.rollup']._add(items, dropped)
+                written = len(items)
+        except Exception:
+            # El registro nunca debe romper la respuesta al visitante
+            buffer.lost(len(items) + dropped)
+            _logger.warning("No se pudieron volcar %s interacciones IA", len(items), exc_info=True)
+        finally:
+            buffer.done_flushing(written)
+        return written
+
+    @api.model
+    def _cron_retention(self):
+        """Borra por lotes las interacciones más antiguas que la retención configurada
+
+        Cada lote se confirma por separado para no mantener bloqueos largos ni
+        un único DELETE enorme.
+        """
+        self._flush_buffer()
+        days = int(self.env['ir.config_parameter'].sudo().get_param('modulo.interaction_log_days', 30) or 30)
+        limit_date = fields.Datetime.now() - timedelta(days=days)
+        total = 0
+        while True:
+            self.env.cr.execute(SQL("""
+                DELETE FROM ai_interaction_log
+                 WHERE id IN (SELECT id FROM ai_interaction_log WHERE logged_at < %s ORDER BY id LIMIT %s)
+            """, limit_date, RETENTION_BATCH))
+            deleted = self.env.cr.rowcount
+            total += deleted
+            self.env.cr.commit()
+            if deleted < RETENTION_BATCH:
+                break
+        self.env['ai.interaction.rollup']._gc_rollups()
+        self.invalidate_model()
+        if total:
+            _logger.info("🧹 %s interacciones IA eliminadas por retención (%s días)", total, days)
+
+    @api.model
+    def get_log_stats(self):
+        """Pendientes, descartados y escritos por este proceso"""
+        return interaction_buffer.get_buffer(self.env.cr.dbname).stats()
+
+
+class AIInteractionRollup(models.Model):
+    _name = "ai.interaction.rollup"
+    _description = "Agregados diarios de interacciones IA"
+    _order = "day desc, intent, tool"
+    _log_access = False
+
+    day = fields.Date(string="Día", required=True, index=True)
+    intent = fields.Char(string="Intención")
+    tool = fields.Char(string="Herramienta")
+    count = fields.Integer(string="Interacciones")
+    error_count = fields.Integer(string="Errores")
+    shed_count = fields.Integer(string="Descartadas por carga")
+    latency_sum = fields.Float(string="Latencia total (s)")
+    latency_max = fields.Float(string="Latencia máxima (s)")
+    reply_bytes = fields.Integer(string="Bytes de respuesta")
+    dropped = fields.Integer(string="Registros perdidos")
+
+    def init(self):
+        # Una fila por (día, intención, herramienta); los vacíos cuentan como '' para el upsert
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ai_interaction_rollup_day_intent_tool_uniq
+                ON ai_interaction_rollup (day, (COALESCE(intent, '')), (COALESCE(tool, '')))
+        """)
+
+    @api.model
+    def _add(self, items, dropped=0):
+        """Suma al agregado diario las filas del buffer y los registros descartados, en un solo upsert"""
+        today = fields.Date.today()
+        rollups = {}
+        for logged_at, _channel, _prompt, intent, tool, latency, reply_size, state in items:
+            bucket = rollups.setdefault((logged_at.date(), intent, tool), [0, 0, 0, 0.0, 0.0, 0, 0])
+            bucket[0] += 1
+            bucket[1] += state == 'error'
+            bucket[2] += state == 'shed'
+            bucket[3] += latency
+            bucket[4] = max(bucket[4], latency)
+            bucket[5] += reply_size
+        if dropped:
+            rollups.setdefault((today, None, None), [0, 0, 0, 0.0, 0.0, 0, 0])[6] += dropped
+        if not rollups:
+            return
+        self.env.cr.execute(SQL("""
+            INSERT INTO ai_interaction_rollup AS r
+                   (day, intent, tool, count, error_count, shed_count, latency_sum, latency_max, reply_bytes, dropped)
+            VALUES %s
+            ON CONFLICT (day, (COALESCE(intent, '')), (COALESCE(tool, ''))) DO UPDATE
+                   SET count = r.count + EXCLUDED.count,
+                       error_count = r.error_count + EXCLUDED.error_count,
+                       shed_count = r.shed_count + EXCLUDED.shed_count,
+                       latency_sum = r.latency_sum + EXCLUDED.latency_sum,
+                       latency_max = GREATEST(r.latency_max, EXCLUDED.latency_max),
+                       reply_bytes = r.reply_bytes + EXCLUDED.reply_bytes,
+                       dropped = r.dropped + EXCLUDED.dropped
+        """, SQL(", ").join(
+            SQL("(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", day, intent, tool, *bucket)
+            for (day, intent, tool), bucket in sorted(rollups.items(), key=lambda item: tuple(map(str, item[0])))
+        )))
+        self.invalidate_model()
+
+    @api.model
+    def _gc_rollups(self):
+        limit_date = fields.Date.today() - timedelta(days=ROLLUP_RETENTION_DAYS)
+        self.env.cr.execute(SQL("DELETE FROM ai_interaction_rollup WHERE day < %s", limit_date))
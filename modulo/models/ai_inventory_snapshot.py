@@ -0,0 +1,163 @@
+from odoo import models, api, fields
+from odoo.tools import SQL
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Campos de producto copiados al snapshot o que deciden si el producto tiene fila
+SNAPSHOT_FIELDS = {'categ_id', 'list_price', 'active', 'product_tmpl_id'}
+
+
+class AIInventorySnapshot(models.Model):
+    _name = "ai.inventory.snapshot"
+    _description = "Snapshot de Inventario IA"
+    _order = "product_id"
+
+    product_id = fields.Many2one('product.product', string="Producto", required=True, ondelete='cascade', index=True)
+    categ_id = fields.Many2one('product.category', string="Categoría", index=True)
+    qty_available = fields.Float(string="Stock disponible", index=True)
+    list_price = fields.Float(string="Precio", digits='Product Price')
+    value = fields.Float(string="Valor")
+    low_stock = fields.Boolean(string="Stock bajo", index=True)
+
+    _product_uniq = models.Constraint('UNIQUE(product_id)', "Solo puede existir un snapshot por producto.")
+
+    @api.model
+    def _is_enabled(self):
+        """Indica si las herramientas de inventario deben leer del snapshot"""
+        return self.env['ir.config_parameter'].sudo().get_param('modulo.inventory_mode', 'live') == 'snapshot'
+
+    @api.model
+    def _refresh(self, product_ids=None):
+        """Recalcula las filas de los productos indicados (o de todos) con un único upsert"""
+        threshold = float(self.env['ir.config_parameter'].sudo().get_param('modulo.low_stock_threshold', 10))
+        self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity'])
+        self.env['stock.location'].flush_model(['usage'])
+        self.env['stock.warehouse.orderpoint'].flush_model(['product_id', 'product_min_qty', 'active'])
+        self.env['product.template'].flush_model(['list_price', 'categ_id'])
+        self.env['product.product'].flush_model(['active', 'product_tmpl_id'])
+
+        product_filter = SQL("TRUE")
+        if product_ids is not None:
+            if not product_ids:
+                return
+            product_filter = SQL("pp.id = ANY(%s)", list(product_ids))
+
+        self.env.cr.execute(SQL("""
+            INSERT INTO ai_inventory_snapshot
+                   (product_id, categ_id, qty_available, list_price, value, low_stock,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT pp.id, pt.categ_id, COALESCE(q.qty, 0), pt.list_price,
+                   COALESCE(q.qty, 0) * COALESCE(pt.list_price, 0),
+                   COALESCE(q.qty, 0) < COALESCE(r.min_qty, %(threshold)s),
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM product_product pp
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+         LEFT JOIN (
+                SELECT q.product_id, SUM(q.quantity) AS qty
+                  FROM stock_quant q
+                  JOIN stock_location l ON l.id = q.location_id AND l.usage = 'internal'
+              GROUP BY q.product_id
+              ) q ON q.product_id = pp.id
+         LEFT JOIN (
+                SELECT product_id, SUM(product_min_qty) AS min_qty
+                  FROM stock_warehouse_orderpoint
+                 WHERE active
+              GROUP BY product_id
+              ) r ON r.product_id = pp.id
+             WHERE pp.active AND %(product_filter)s
+       ON CONFLICT (product_id) DO UPDATE
+               SET categ_id = EXCLUDED.categ_id,
+                   qty_available = EXCLUDED.qty_available,
+                   list_price = EXCLUDED.list_price,
+                   value = EXCLUDED.value,
+                   low_stock = EXCLUDED.low_stock,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, threshold=threshold, uid=self.env.uid, product_filter=product_filter))
+
+        # Productos archivados o eliminados
+        self.env.cr.execute(SQL("""
+            DELETE FROM ai_inventory_snapshot s
+             WHERE NOT EXISTS (SELECT 1 FROM product_product pp WHERE pp.id = s.product_id AND pp.active)
+               AND %s
+        """, SQL("TRUE") if product_ids is None else SQL("s.product_id = ANY(%s)", list(product_ids))))
+        self.invalidate_model()
+
+    @api.model
+    def _refresh_products(self, products):
+        """Actualización incremental tras movimientos de stock o cambios de producto y reglas"""
+        if products and self._is_enabled():
+            self.sudo()._refresh(products.ids)
+
+    @api.model
+    def _cron_reconcile(self):
+        """Reconciliación completa del snapshot con los quants"""
+        if not self._is_enabled():
+            return
+        self._refresh()
+        _logger.info("📸 Snapshot de inventario reconciliado (%s productos)", self.search_count([]))
+
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    def _action_done(self, cancel_backorder=False):
+        moves = super()._action_done(cancel_backorder=cancel_backorder)
+        self.env['ai.inventory.snapshot']._refresh_products(moves.product_id)
+        return moves
+
+    def _action_cancel(self):
+        res = super()._action_cancel()
+        self.env['ai.inventory.snapshot']._refresh_products(self.product_id)
+        return res
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        products = super().create(vals_list)
+        self.env['ai.inventory.snapshot']._refresh_products(products)
+        return products
+
+    def write(self, vals):
+        res = super().write(vals)
+        if SNAPSHOT_FIELDS.intersection(vals):
+            self.env['ai.inventory.snapshot']._refresh_products(self)
+        return res
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if SNAPSHOT_FIELDS.intersection(vals):
+            self.env['ai.inventory.snapshot']._refresh_products(
+                self.with_context(active_test=False).product_variant_ids)
+        return res
+
+
+class StockWarehouseOrderpoint(models.Model):
+    _inherit = 'stock.warehouse.orderpoint'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        orderpoints = super().create(vals_list)
+        self.env['ai.inventory.snapshot']._refresh_products(orderpoints.product_id)
+        return orderpoints
+
+    def write(self, vals):
+        products = self.product_id
+        res = super().write(vals)
+        if {'product_id', 'product_min_qty', 'active'}.intersection(vals):
+            self.env['ai.inventory.snapshot']._refresh_products(products | self.product_id)
+        return res
+
+    def unlink(self):
+        products = self.product_id
+        res = super().unlink()
+        self.env['ai.inventory.snapshot']._refresh_products(products)
+        return res
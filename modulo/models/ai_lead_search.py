@@ -0,0 +1,99 @@
+from odoo import models, api, tools
+from odoo.tools import SQL
+import re
+
+# Documento de búsqueda de cada lead: columna generada (la mantiene PostgreSQL
+# en cada INSERT/UPDATE) con índice GIN. Cada texto se indexa con el
+# diccionario español (raíces: "oportunidades" -> "oportun") y con 'simple'
+# (palabras exactas, números y correos); el peso ordena nombre > cliente >
+# contacto > descripción. La descripción es HTML: se indexa sin etiquetas.
+SEARCH_COLUMN = 'modulo_search_vector'
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple'::regconfig, COALESCE(name, '')), 'A')
+    || setweight(to_tsvector('spanish'::regconfig, COALESCE(name, '')), 'A')
+    || setweight(to_tsvector('simple'::regconfig, COALESCE(partner_name, '') || ' ' || COALESCE(contact_name, '')), 'B')
+    || setweight(to_tsvector('spanish'::regconfig, COALESCE(partner_name, '') || ' ' || COALESCE(contact_name, '')), 'B')
+    || setweight(to_tsvector('simple'::regconfig, COALESCE(email_from, '') || ' ' || COALESCE(phone, '')), 'C')
+    || setweight(to_tsvector('spanish'::regconfig,
+                 regexp_replace(COALESCE(description, ''), '<[^>]*>', ' ', 'g')), 'D')
+"""
+SEARCH_FIELDS = ['name', 'partner_name', 'contact_name', 'email_from', 'phone', 'description', 'active']
+
+# Con términos muy comunes se puntúan como mucho las coincidencias más recientes
+RANK_CANDIDATES = 2000
+PHONE_RE = re.compile(r'\+?[\d\s().-]{7,}')
+
+
+class AILeadSearch(models.AbstractModel):
+    _name = "ai.lead.search"
+    _description = "Búsqueda de leads IA"
+
+    def init(self):
+        """Crea la columna tsvector generada de crm_lead y su índice GIN"""
+        cr = self.env.cr
+        cr.execute(SQL(
+            "ALTER TABLE crm_lead ADD COLUMN IF NOT EXISTS %s tsvector GENERATED ALWAYS AS (%s) STORED",
+            SQL.identifier(SEARCH_COLUMN), SQL(SEARCH_VECTOR),
+        ))
+        cr.execute(SQL(
+            "CREATE INDEX IF NOT EXISTS modulo_crm_lead_search_vector_idx ON crm_lead USING gin (%s)",
+            SQL.identifier(SEARCH_COLUMN),
+        ))
+
+    @api.model
+    def _find_lead_ids(self, text, offset=0, limit=5):
+        """Ids de leads activos para un nombre, cliente, correo o teléfono, por relevancia
+
+        Un correo o teléfono completo se busca primero por igualdad en sus
+        columnas normalizadas; si no hay coincidencias exactas se usa el
+        índice de texto completo.
+        """
+        text = (text or '').strip()
+        if not text:
+            return []
+        Lead = self.env['crm.lead'].sudo()
+        email = tools.email_normalize(text)
+        domain = None
+        if email:
+            domain = [('email_normalized', '=', email)]
+        elif PHONE_RE.fullmatch(text):
+            phone = Lead._phone_format(number=text, country=self.env.company.country_id, raise_exception=False)
+            if phone:
+                domain = [('phone_sanitized', '=', phone)]
+        if domain:
+            lead_ids = Lead.search(domain, offset=offset, limit=limit, order='id desc').ids
+            if lead_ids or offset:
+                return lead_ids
+        return self._ranked_lead_ids(text, offset, limit)
+
+    @api.model
+    def _ranked_lead_ids(self, text, offset, limit):
+        """Leads cuyo documento contiene todos los términos (o, si no hay, alguno), por ts_rank
+
+        Con términos muy comunes solo se puntúan las RANK_CANDIDATES
+        coincidencias más recientes (por id), para que el coste de ts_rank no
+        crezca con la tabla y el resultado no dependa del orden físico.
+        """
+        self.env['crm.lead'].flush_model(SEARCH_FIELDS)
+        for query in (
+            SQL("websearch_to_tsquery('spanish', %(text)s) || websearch_to_tsquery('simple', %(text)s)", text=text),
+            SQL("replace(plainto_tsquery('spanish', %(text)s)::text, '&', '|')::tsquery", text=text),
+        ):
+            self.env.cr.execute(SQL("""
+                WITH candidates AS (
+                    SELECT id, %(column)s AS vector
+                      FROM crm_lead
+                     WHERE active AND %(column)s @@ %(query)s
+                  ORDER BY id DESC
+                     LIMIT %(candidates)s
+                )
+                SELECT id
+                  FROM candidates
+              ORDER BY ts_rank(vector, %(query)s) DESC, id DESC
+                 LIMIT %(limit)s OFFSET %(offset)s
+            """, column=SQL.identifier(SEARCH_COLUMN), query=query, candidates=RANK_CANDIDATES,
+                limit=limit, offset=offset))
+            lead_ids = [row[0] for row in self.env.cr.fetchall()]
+            if lead_ids or offset:
+                return lead_ids
+        return []
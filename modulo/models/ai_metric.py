@@ -0,0 +1,83 @@
+from odoo import models, api, fields
+from odoo.tools import SQL, config
+import json
+import logging
+import os
+
+from ..tools import metrics
+
+_logger = logging.getLogger(__name__)
+
+
+class AIMetric(models.Model):
+    _name = "ai.metric"
+    _description = "Métricas de rendimiento IA"
+    _order = "name"
+    _log_access = False
+
+    name = fields.Char(string="Operación", required=True)
+    count = fields.Integer(string="Llamadas")
+    wall_sum = fields.Float(string="Tiempo total (s)")
+    sql_sum = fields.Integer(string="Consultas SQL")
+    rows_sum = fields.Integer(string="Filas")
+    # Cubos del histograma de tiempo: se suman elemento a elemento en el upsert
+    buckets = fields.Json(string="Cubos")
+
+    _name_uniq = models.Constraint('UNIQUE(name)', "Solo puede existir una fila por operación.")
+
+    @api.model
+    def _flush_process_metrics(self):
+        """Suma a la tabla lo medido por este proceso desde el último volcado, en su propia transacción"""
+        dbname = self.env.cr.dbname
+        deltas, totals = metrics.pending(dbname)
+        try:
+            with self.env.registry.cursor() as cr:
+                if deltas:
+                    cr.execute(SQL("""
+                        INSERT INTO ai_metric AS m (name, count, wall_sum, sql_sum, rows_sum, buckets)
+                        VALUES %s
+                        ON CONFLICT (name) DO UPDATE
+                           SET count = m.count + EXCLUDED.count,
+                               wall_sum = m.wall_sum + EXCLUDED.wall_sum,
+                               sql_sum = m.sql_sum + EXCLUDED.sql_sum,
+                               rows_sum = m.rows_sum + EXCLUDED.rows_sum,
+                               buckets = (
+                                   SELECT jsonb_agg(COALESCE(a.value::integer, 0) + COALESCE(b.value::integer, 0)
+                                                    ORDER BY COALESCE(a.position, b.position))
+                                     FROM jsonb_array_elements_text(COALESCE(m.buckets, '[]')) WITH ORDINALITY AS a(value, position)
+                                FULL JOIN jsonb_array_elements_text(EXCLUDED.buckets) WITH ORDINALITY AS b(value, position)
+                                       ON a.position = b.position
+                               )
+                    """, SQL(", ").join(
+                        SQL("(%s, %s, %s, %s, %s, %s::jsonb)",
+                            name, *delta[:metrics.HISTOGRAM], json.dumps(delta[metrics.HISTOGRAM]))
+                        for name, delta in sorted(deltas.items())
+                    )))
+                params = self.env(cr=cr)['ir.config_parameter'].sudo()
+                metrics.configure_profiling(
+                    dbname,
+                    rate=float(params.get_param('modulo.metrics_profile_rate', 0) or 0),
+                    keep=int(params.get_param('modulo.metrics_profile_keep', 10) or 10),
+                    directory=os.path.join(config.filestore(dbname), 'modulo_profiles'),
+                )
+        except Exception:
+            # Las métricas nunca deben romper la petición que las mide
+            _logger.warning("No se pudieron volcar las métricas IA", exc_info=True)
+            return
+        metrics.mark_flushed(dbname, totals)
+
+    @api.model
+    def _render_prometheus(self):
+        """Métricas de todos los workers en formato de texto Prometheus"""
+        self._flush_process_metrics()
+        self.env.cr.execute("""
+            SELECT name, count, wall_sum, sql_sum, rows_sum, COALESCE(buckets, '[]')
+              FROM ai_metric
+          ORDER BY name
+        """)
+        return metrics.render_prometheus(self.env.cr.fetchall())
+
+    @api.model
+    def get_slowest_profiles(self):
+        """Volcados cProfile conservados por este proceso: [(segundos, ruta)]"""
+        return metrics.slowest_profiles(self.env.cr.dbname)
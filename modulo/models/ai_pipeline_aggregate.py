@@ -0,0 +1,120 @@
+from odoo import models, api, fields
+from odoo.tools import SQL
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Campos de crm.lead que alteran los agregados
+PIPELINE_FIELDS = {'stage_id', 'user_id', 'expected_revenue', 'probability', 'type', 'active'}
+
+
+class AIPipelineAggregate(models.Model):
+    _name = "ai.pipeline.aggregate"
+    _description = "Agregados del pipeline por etapa y vendedor"
+    _order = "stage_id, user_id"
+    _log_access = False
+
+    stage_id = fields.Many2one('crm.stage', string="Etapa", ondelete='cascade')
+    user_id = fields.Many2one('res.users', string="Vendedor", ondelete='set null')
+    lead_count = fields.Integer(string="Oportunidades")
+    expected_revenue = fields.Float(string="Ingreso esperado")
+    weighted_revenue = fields.Float(string="Ingreso ponderado")
+
+    def init(self):
+        # Una fila por (etapa, vendedor); los vacíos cuentan como 0 para el upsert
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ai_pipeline_aggregate_stage_user_uniq
+                ON ai_pipeline_aggregate ((COALESCE(stage_id, 0)), (COALESCE(user_id, 0)))
+        """)
+
+    @api.model
+    def _is_enabled(self):
+        return self.env['ir.config_parameter'].sudo().get_param('modulo.pipeline_aggregates') == 'True'
+
+    @api.model
+    def _apply_deltas(self, deltas):
+        """Suma los deltas {(etapa, vendedor): [conteo, ingreso, ponderado]} en un solo upsert"""
+        values = [
+            SQL("(%s, %s, %s, %s, %s)", stage_id or None, user_id or None, count, revenue, weighted)
+            for (stage_id, user_id), (count, revenue, weighted) in deltas.items()
+            if count or revenue or weighted
+        ]
+        if not values:
+            return
+        self.env.cr.execute(SQL("""
+            INSERT INTO ai_pipeline_aggregate (stage_id, user_id, lead_count, expected_revenue, weighted_revenue)
+                 VALUES %s
+            ON CONFLICT ((COALESCE(stage_id, 0)), (COALESCE(user_id, 0))) DO UPDATE
+                    SET lead_count = ai_pipeline_aggregate.lead_count + EXCLUDED.lead_count,
+                        expected_revenue = ai_pipeline_aggregate.expected_revenue + EXCLUDED.expected_revenue,
+                        weighted_revenue = ai_pipeline_aggregate.weighted_revenue + EXCLUDED.weighted_revenue
+        """, SQL(", ").join(values)))
+        self.invalidate_model()
+
+    @api.model
+    def _rebuild(self):
+        """Recalcula la tabla completa desde crm.lead"""
+        self.env['crm.lead'].flush_model(['stage_id', 'user_id', 'expected_revenue', 'prorated_revenue', 'type', 'active'])
+        self.env.cr.execute("DELETE FROM ai_pipeline_aggregate")
+        self.env.cr.execute("""
+            INSERT INTO ai_pipeline_aggregate (stage_id, user_id, lead_count, expected_revenue, weighted_revenue)
+                 SELECT stage_id, user_id, COUNT(*),
+                        COALESCE(SUM(expected_revenue), 0), COALESCE(SUM(prorated_revenue), 0)
+                   FROM crm_lead
+                  WHERE type = 'opportunity' AND active
+               GROUP BY stage_id, user_id
+        """)
+        self.invalidate_model()
+
+    @api.model
+    def _cron_rebuild(self):
+        """Corrige cualquier deriva de los agregados incrementales"""
+        if self._is_enabled():
+            self._rebuild()
+            _logger.info("📊 Agregados del pipeline reconstruidos")
+
+
+class CrmLead(models.Model):
+    _inherit = 'crm.lead'
+
+    def _pipeline_contributions(self, sign=1):
+        """Aporte de estos registros a los agregados: {(etapa, vendedor): [conteo, ingreso, ponderado]}"""
+        contributions = {}
+        for lead in self:
+            if lead.type != 'opportunity' or not lead.active:
+                continue
+            bucket = contributions.setdefault((lead.stage_id.id, lead.user_id.id), [0, 0.0, 0.0])
+            bucket[0] += sign
+            bucket[1] += sign * lead.expected_revenue
+            bucket[2] += sign * lead.prorated_revenue
+        return contributions
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        leads = super().create(vals_list)
+        Aggregate = self.env['ai.pipeline.aggregate'].sudo()
+        if Aggregate._is_enabled():
+            Aggregate._apply_deltas(leads._pipeline_contributions())
+        return leads
+
+    def write(self, vals):
+        Aggregate = self.env['ai.pipeline.aggregate'].sudo()
+        if not (PIPELINE_FIELDS.intersection(vals) and Aggregate._is_enabled()):
+            return super().write(vals)
+        deltas = self._pipeline_contributions(sign=-1)
+        res = super().write(vals)
+        for key, (count, revenue, weighted) in self._pipeline_contributions().items():
+            bucket = deltas.setdefault(key, [0, 0.0, 0.0])
+            bucket[0] += count
+            bucket[1] += revenue
+            bucket[2] += weighted
+        Aggregate._apply_deltas(deltas)
+        return res
+
+    def unlink(self):
+        Aggregate = self.env['ai.pipeline.aggregate'].sudo()
+        deltas = self._pipeline_contributions(sign=-1) if Aggregate._is_enabled() else {}
+        res = super().unlink()
+        if deltas:
+            Aggregate._apply_deltas(deltas)
+        return res
@@ -0,0 +1,142 @@
+from odoo import models, api
+from odoo.tools import SQL
+import logging
+
+from ..tools import intent_router
+
+_logger = logging.getLogger(__name__)
+
+# Textos en los que buscamos y su índice GIN trigram. Las consultas usan
+# exactamente estas expresiones para que PostgreSQL pueda usar los índices.
+# modulo_unaccent es inmutable (condición para indexar): quita acentos si la
+# extensión unaccent está disponible al crearla y si no devuelve el texto.
+NAME_EXPR = "modulo_unaccent(jsonb_path_query_array(pt.name, '$.*')::text)"
+DESCRIPTION_EXPR = "modulo_unaccent(jsonb_path_query_array(pt.description, '$.*')::text)"
+CATEGORY_EXPR = "modulo_unaccent(pc.complete_name)"
+TRIGRAM_INDEXES = {
+    'modulo_product_template_name_unaccent_trgm_idx': ('product_template', NAME_EXPR.replace('pt.', '')),
+    'modulo_product_template_description_unaccent_trgm_idx': (
+        'product_template', DESCRIPTION_EXPR.replace('pt.', '')),
+    'modulo_product_category_complete_name_unaccent_trgm_idx': ('product_category', CATEGORY_EXPR.replace('pc.', '')),
+}
+
+# Peso de cada campo en la puntuación
+NAME_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.6
+DESCRIPTION_WEIGHT = 0.4
+
+
+class AIProductSearch(models.AbstractModel):
+    _name = "ai.product.search"
+    _description = "Búsqueda de productos IA"
+
+    def init(self):
+        """Crea modulo_unaccent, pg_trgm (si hay permisos) y los índices trigram de búsqueda"""
+        cr = self.env.cr
+        cr.execute("SELECT 1 FROM pg_proc WHERE proname = 'modulo_unaccent'")
+        if not cr.fetchone():
+            # No se redefine nunca: cambiarla dejaría los índices desalineados con las consultas
+            cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'unaccent'")
+            body = "SELECT public.unaccent('public.unaccent'::regdictionary, $1)" if cr.fetchone() else "SELECT $1"
+            cr.execute(f"""
+                CREATE FUNCTION modulo_unaccent(text) RETURNS text
+                    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS $func${body}$func$
+            """)
+        if not self._has_trigram():
+            try:
+                with cr.savepoint(flush=False):
+                    cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            except Exception as e:
+                _logger.warning("No se pudo activar pg_trgm, la búsqueda usará ILIKE: %s", e)
+                return
+        for index_name, (table, expression) in TRIGRAM_INDEXES.items():
+            cr.execute(SQL(
+                "CREATE INDEX IF NOT EXISTS %s ON %s USING gin ((%s) gin_trgm_ops)",
+                SQL.identifier(index_name), SQL.identifier(table), SQL(expression),
+            ))
+
+    @api.model
+    def _has_trigram(self):
+        self.env.cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _find_products(self, search_term, limit=10):
+        """Productos ordenados por relevancia para los términos significativos del texto"""
+        terms = intent_router.extract_search_terms(search_term)
+        if not terms:
+            return self.env['product.product']
+        product_ids = self._ranked_product_ids(terms, limit, self.env.registry.has_trigram)
+        if len(product_ids) < limit:
+            # Completar con productos parecidos en significado ("balón" -> "Pelota")
+            semantic_ids = self.env['ai.semantic.index']._search_product_ids(search_term, limit=limit)
+            product_ids += [product_id for product_id in semantic_ids if product_id not in product_ids]
+            product_ids = product_ids[:limit]
+        return self.env['product.product'].browse(product_ids)
+
+    @api.model
+    def _ranked_product_ids(self, terms, limit, has_trigram):
+        """Ids de productos que contienen (o se parecen a) algún término, por puntuación
+
+        Los candidatos salen de la unión de una consulta por tabla (plantillas
+        por nombre o descripción, categorías por ruta), cada una resoluble
+        con sus índices trigram; solo esos candidatos se puntúan. Un OR entre
+        columnas de tablas distintas obligaría a recorrer todos los productos.
+
+        La consulta se arma como texto porque los operadores de pg_trgm
+        (``<%``) contienen ``%``, que ``odoo.tools.SQL`` no permite escapar.
+        """
+        self.env['product.template'].flush_model(['name', 'description', 'categ_id', 'active'])
+        self.env['product.product'].flush_model(['active', 'product_tmpl_id'])
+        self.env['product.category'].flush_model(['complete_name'])
+
+        def matches(expressions):
+            conditions, params = [], []
+            for term in terms:
+                for expression in expressions:
+                    conditions.append(f"{expression} ILIKE modulo_unaccent(%s)")
+                    params.append(f"%{term}%")
+                    if has_trigram:
+                        conditions.append(f"modulo_unaccent(%s) <%% {expression}")
+                        params.append(term)
+            return ' OR '.join(conditions), params
+
+        template_conditions, template_params = matches([NAME_EXPR, DESCRIPTION_EXPR])
+        category_conditions, category_params = matches([CATEGORY_EXPR])
+
+        scores, score_params = [], []
+        for term in terms:
+            for expression, weight in ((NAME_EXPR, NAME_WEIGHT), (CATEGORY_EXPR, CATEGORY_WEIGHT),
+                                       (DESCRIPTION_EXPR, DESCRIPTION_WEIGHT)):
+                if has_trigram:
+                    scores.append(f"word_similarity(modulo_unaccent(%s), COALESCE({expression}, '')) * {weight}")
+                    score_params.append(term)
+                else:
+                    scores.append(f"(COALESCE({expression}, '') ILIKE modulo_unaccent(%s))::int * {weight}")
+                    score_params.append(f"%{term}%")
+
+        query = f"""
+            WITH candidates AS (
+                SELECT pt.id
+                  FROM product_template pt
+                 WHERE {template_conditions}
+                 UNION
+                SELECT pt.id
+                  FROM product_category pc
+                  JOIN product_template pt ON pt.categ_id = pc.id
+                 WHERE {category_conditions}
+            )
+            SELECT pp.id
+              FROM candidates
+              JOIN product_template pt ON pt.id = candidates.id
+              JOIN product_product pp ON pp.product_tmpl_id = pt.id
+         LEFT JOIN product_category pc ON pc.id = pt.categ_id
+             WHERE pp.active AND pt.active
+          ORDER BY {' + '.join(scores)} DESC, pp.id
+        """
+        params = template_params + category_params + score_params
+        if limit:
+            query += " LIMIT %s"
+            params.append(limit)
+        self.env.cr.execute(query, params)
+        return [row[0] for row in self.env.cr.fetchall()]
@@ -0,0 +1,141 @@
+from odoo import models, api, SUPERUSER_ID
+from odoo.tools import SQL, config
+import logging
+import os
+
+from ..tools import semantic_index
+
+_logger = logging.getLogger(__name__)
+
+# Campos que cambian el vector de un producto
+INDEXED_FIELDS = {'name', 'description', 'categ_id', 'active', 'product_tmpl_id'}
+
+
+class AISemanticIndex(models.AbstractModel):
+    _name = "ai.semantic.index"
+    _description = "Índice semántico de productos IA"
+
+    @api.model
+    def _is_enabled(self):
+        if not semantic_index.is_available():
+            return False
+        return self.env['ir.config_parameter'].sudo().get_param('modulo.semantic_search') == 'True'
+
+    @api.model
+    def _get_index(self):
+        """Índice en el filestore de la base de datos, compartido por los workers del servidor"""
+        return semantic_index.get_index(os.path.join(config.filestore(self.env.cr.dbname), 'modulo_semantic_index'))
+
+    @api.model
+    def _search_product_ids(self, text, limit=10):
+        """Ids de productos semánticamente cercanos al texto, de mayor a menor similitud"""
+        if not self._is_enabled():
+            return []
+        [hits] = self._get_index().search([text], limit=limit)
+        return [product_id for product_id, _score in hits]
+
+    @api.model
+    def _read_documents(self, last_id=0, limit=semantic_index.BUILD_BATCH_SIZE, product_ids=None, lang='en_US'):
+        """[(id, (nombre, categoría, descripción))] de productos activos, por id"""
+        self.env['product.template'].flush_model(['name', 'description', 'categ_id', 'active'])
+        self.env['product.product'].flush_model(['active', 'product_tmpl_id'])
+        self.env['product.category'].flush_model(['complete_name'])
+        product_filter = SQL("pp.id > %s", last_id) if product_ids is None else SQL("pp.id = ANY(%s)", product_ids)
+        self.env.cr.execute(SQL("""
+            SELECT pp.id,
+                   COALESCE(pt.name->>%(lang)s, pt.name->>'en_US'),
+                   pc.complete_name,
+                   COALESCE(pt.description->>%(lang)s, pt.description->>'en_US')
+              FROM product_product pp
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+         LEFT JOIN product_category pc ON pc.id = pt.categ_id
+             WHERE pp.active AND pt.active AND %(product_filter)s
+          ORDER BY pp.id
+             LIMIT %(limit)s
+        """, lang=lang, product_filter=product_filter, limit=limit))
+        return [(row[0], row[1:]) for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _rebuild(self):
+        """Construye el índice completo por bloques de productos"""
+        lang = self.env.lang or 'en_US'
+
+        def batches():
+            last_id = 0
+            while rows := self._read_documents(last_id, lang=lang):
+                last_id = rows[-1][0]
+                yield [product_id for product_id, _doc in rows], [doc for _id, doc in rows]
+
+        count = self._get_index().build(batches(), lang=lang)
+        _logger.info("🧭 Índice semántico de productos construido (%s productos)", count)
+        return count
+
+    @api.model
+    def _schedule_update(self, product_ids):
+        """Revectoriza los productos cuando la transacción confirme"""
+        if not product_ids or not self._is_enabled():
+            return
+        postcommit = self.env.cr.postcommit
+        pending = postcommit.data.get('modulo.ai_semantic_index.ids')
+        if pending is None:
+            pending = postcommit.data['modulo.ai_semantic_index.ids'] = set()
+            registry = self.env.registry
+            index = self._get_index()
+
+            @postcommit.add
+            def update():
+                manifest = index.stats()
+                if not manifest:
+                    return
+                ids = sorted(pending)
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    documents = dict(env['ai.semantic.index']._read_documents(
+                        product_ids=ids, limit=len(ids), lang=manifest['lang']))
+                # Los productos archivados o eliminados se anexan como vector nulo
+                index.update(ids, [documents.get(product_id) for product_id in ids])
+
+        pending.update(product_ids)
+
+    @api.model
+    def _cron_compact(self):
+        """Fusiona las actualizaciones incrementales, o construye el índice si aún no existe"""
+        if not self._is_enabled():
+            return
+        index = self._get_index()
+        if not index.stats():
+            self._rebuild()
+            return
+        rows = index.compact()
+        _logger.info("🧭 Índice semántico de productos compactado (%s productos)", rows)
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        products = super().create(vals_list)
+        self.env['ai.semantic.index']._schedule_update(products.ids)
+        return products
+
+    def write(self, vals):
+        res = super().write(vals)
+        if INDEXED_FIELDS.intersection(vals):
+            self.env['ai.semantic.index']._schedule_update(self.ids)
+        return res
+
+    def unlink(self):
+        self.env['ai.semantic.index']._schedule_update(self.ids)
+        return super().unlink()
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if INDEXED_FIELDS.intersection(vals):
+            self.env['ai.semantic.index']._schedule_update(
+                self.with_context(active_test=False).product_variant_ids.ids)
+        return res
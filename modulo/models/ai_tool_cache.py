@@ -0,0 +1,326 @@
+from odoo import models, api, fields
+from odoo.tools import SQL
+import functools
+import hashlib
+import json
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+# Contadores del proceso (cada worker de Odoo lleva los suyos)
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+# Cada cuántas inserciones se recorta la tabla al tamaño máximo
+EVICTION_INTERVAL = 50
+# No actualizar last_hit más de una vez por este intervalo (segundos)
+TOUCH_INTERVAL = 60
+
+# Al invalidar un ámbito también caen las entradas que dependen de ambos
+INVALIDATION_SCOPES = {
+    'stock': ['stock', 'mixed'],
+    'crm': ['crm', 'mixed'],
+}
+SCOPES = [('stock', 'Inventario'), ('crm', 'CRM'), ('mixed', 'Inventario y CRM')]
+# Campos de producto que aparecen en las respuestas de las herramientas
+PRODUCT_FIELDS = {'name', 'default_code', 'barcode', 'list_price', 'categ_id', 'active', 'is_storable'}
+# Campos de stock.quant que cambian las cantidades; las reservas cambian el estado de los movimientos
+QUANT_FIELDS = {'quantity', 'inventory_quantity', 'product_id', 'location_id'}
+
+
+def _count(counter, amount=1):
+    with _stats_lock:
+        _stats[counter] += amount
+
+
+def _normalize(value):
+    """Normaliza argumentos de texto para que 'Desks ' y 'desks' compartan entrada"""
+    if isinstance(value, str):
+        return ' '.join(value.lower().split())
+    return value
+
+
+def cached_tool(scope):
+    """Cachea en ai.tool.cache el resultado de una herramienta IA de solo lectura"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            return self.env['ai.tool.cache']._get_or_compute(
+                scope, f"{self._name}.{method.__name__}", args, kwargs,
+                lambda: method(self, *args, **kwargs),
+            )
+        return wrapper
+    return decorator
+
+
+class AIToolCache(models.Model):
+    """Resultados de herramientas IA de solo lectura compartidos entre procesos
+
+    Cada entrada guarda la generación de su ámbito con la que se calculó y
+    solo se sirve mientras esa generación siga vigente: una invalidación
+    confirmada descarta también los resultados que se estaban calculando con
+    datos anteriores. Las escrituras van en su propia transacción, así que
+    la lectura no bloquea a otros procesos ni falla con cursores de solo
+    lectura.
+    """
+    _name = "ai.tool.cache"
+    _description = "Caché de resultados de herramientas IA"
+    _log_access = False
+
+    key = fields.Char(string="Clave", required=True)
+    scope = fields.Selection(SCOPES, string="Ámbito", required=True, index=True)
+    generation = fields.Integer(string="Generación", required=True, default=0)
+    tool = fields.Char(string="Herramienta")
+    result = fields.Text(string="Resultado")
+    expires_at = fields.Datetime(string="Expira", index=True)
+    last_hit = fields.Datetime(string="Último uso", index=True)
+
+    _key_uniq = models.Constraint('UNIQUE(key)', "La clave de caché debe ser única.")
+
+    @api.model
+    def _get_or_compute(self, scope, tool, args, kwargs, compute):
+        """Devuelve el resultado cacheado o lo calcula y lo guarda"""
+        params = self.env['ir.config_parameter'].sudo()
+        ttl = int(params.get_param('modulo.ai_cache_ttl', 300))
+        # Esta transacción ya modificó datos del ámbito: la caché aún no lo refleja
+        if ttl <= 0 or scope in self.env.cr.postcommit.data.get('modulo.ai_tool_cache.scopes', ()):
+            return compute()
+
+        key = hashlib.sha1(json.dumps([
+            tool,
+            [_normalize(arg) for arg in args],
+            {name: _normalize(value) for name, value in kwargs.items()},
+            sorted(self.env.companies.ids),
+            self.env.lang,
+        ], sort_keys=True, default=str).encode()).hexdigest()
+
+        # La generación se lee con la misma instantánea que usará el cálculo
+        self.env.cr.execute(SQL("""
+            SELECT g.generation, c.id, c.result, c.last_hit < NOW() AT TIME ZONE 'UTC' - make_interval(secs => %s)
+              FROM ai_tool_cache_generation g
+         LEFT JOIN ai_tool_cache c
+                ON c.key = %s AND c.generation = g.generation AND c.expires_at > NOW() AT TIME ZONE 'UTC'
+             WHERE g.scope = %s
+        """, TOUCH_INTERVAL, key, scope))
+        row = self.env.cr.fetchone()
+        if not row:
+            return compute()
+        generation, entry_id, result, stale_hit = row
+        if entry_id:
+            if stale_hit:
+                self._write_entry(SQL(
+                    "UPDATE ai_tool_cache SET last_hit = NOW() AT TIME ZONE 'UTC' WHERE id = %s", entry_id))
+            _count('hits')
+            return result
+
+        _count('misses')
+        result = compute()
+        if not isinstance(result, str):
+            return result
+
+        evict_size = None
+        if _stats['misses'] % EVICTION_INTERVAL == 0:
+            evict_size = int(params.get_param('modulo.ai_cache_size', 1000))
+        # Si el ámbito se invalidó durante el cálculo la generación ya no coincide y no se inserta
+        self._write_entry(SQL("""
+            INSERT INTO ai_tool_cache (key, scope, generation, tool, result, expires_at, last_hit)
+                 SELECT %(key)s, %(scope)s, generation, %(tool)s, %(result)s,
+                        NOW() AT TIME ZONE 'UTC' + make_interval(secs => %(ttl)s), NOW() AT TIME ZONE 'UTC'
+                   FROM ai_tool_cache_generation
+                  WHERE scope = %(scope)s AND generation = %(generation)s
+            ON CONFLICT (key) DO UPDATE
+               SET result = EXCLUDED.result, generation = EXCLUDED.generation,
+                   expires_at = EXCLUDED.expires_at, last_hit = EXCLUDED.last_hit
+        """, key=key, scope=scope, generation=generation, tool=tool, result=result, ttl=ttl), evict_size)
+        return result
+
+    @api.model
+    def _write_entry(self, query, evict_size=None):
+        """Ejecuta la escritura en su propia transacción; un fallo solo cuesta la entrada"""
+        try:
+            with self.env.registry.cursor() as cr:
+                cr.execute(query)
+                if evict_size is not None:
+                    self.env(cr=cr)['ai.tool.cache']._evict(evict_size)
+        except Exception:
+            _logger.debug("No se pudo escribir en la caché IA", exc_info=True)
+
+    @api.model
+    def _evict(self, size):
+        """Elimina entradas expiradas o de generaciones invalidadas y las menos usadas por encima del tamaño máximo"""
+        cr = self.env.cr
+        cr.execute("""
+            DELETE FROM ai_tool_cache c
+             USING ai_tool_cache_generation g
+             WHERE c.scope = g.scope
+               AND (c.expires_at <= NOW() AT TIME ZONE 'UTC' OR c.generation <> g.generation)
+        """)
+        evicted = cr.rowcount
+        cr.execute(SQL("""
+            DELETE FROM ai_tool_cache
+             WHERE id IN (SELECT id FROM ai_tool_cache ORDER BY last_hit DESC OFFSET %s)
+        """, size))
+        evicted += cr.rowcount
+        if evicted:
+            _count('evictions', evicted)
+
+    @api.model
+    def _invalidate(self, scope):
+        """Vacía las entradas del ámbito cuando la transacción actual confirme"""
+        postcommit = self.env.cr.postcommit
+        scopes = postcommit.data.get('modulo.ai_tool_cache.scopes')
+        if scopes is None:
+            scopes = postcommit.data['modulo.ai_tool_cache.scopes'] = set()
+            registry = self.env.registry
+
+            @postcommit.add
+            def purge():
+                # Los datos ya están confirmados: un fallo aquí no debe hacer fallar la petición
+                try:
+                    with registry.cursor() as cr:
+                        # En READ COMMITTED dos invalidaciones concurrentes esperan la fila en lugar
+                        # de fallar por serialización
+                        cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+                        cr.execute(SQL("""
+                            UPDATE ai_tool_cache_generation SET generation = generation + 1 WHERE scope = ANY(%s)
+                        """, sorted(scopes)))
+                        cr.execute(SQL("DELETE FROM ai_tool_cache WHERE scope = ANY(%s)", sorted(scopes)))
+                except Exception:
+                    _logger.exception("No se pudo invalidar la caché IA (%s)", ", ".join(sorted(scopes)))
+
+        scopes.update(INVALIDATION_SCOPES[scope])
+
+    @api.model
+    def get_cache_stats(self):
+        """Contadores de aciertos, fallos y desalojos de este proceso y tamaño actual"""
+        with _stats_lock:
+            stats = dict(_stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['entries'] = self.sudo().search_count([])
+        return stats
+
+    @api.autovacuum
+    def _gc_expired_entries(self):
+        self._evict(int(self.env['ir.config_parameter'].sudo().get_param('modulo.ai_cache_size', 1000)))
+
+
+class AIToolCacheGeneration(models.Model):
+    """Contador de invalidaciones de cada ámbito de la caché IA"""
+    _name = "ai.tool.cache.generation"
+    _description = "Generación de la caché de herramientas IA"
+    _log_access = False
+
+    scope = fields.Selection(SCOPES, string="Ámbito", required=True)
+    generation = fields.Integer(string="Generación", required=True, default=0)
+
+    _scope_uniq = models.Constraint('UNIQUE(scope)', "Solo puede existir una generación por ámbito.")
+
+    def init(self):
+        self.env.cr.execute(SQL("""
+            INSERT INTO ai_tool_cache_generation (scope, generation)
+                 SELECT scope, 0 FROM unnest(%s::varchar[]) scope
+            ON CONFLICT (scope) DO NOTHING
+        """, [scope for scope, _label in SCOPES]))
+
+
+class StockQuant(models.Model):
+    _inherit = 'stock.quant'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ai.tool.cache']._invalidate('stock')
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if QUANT_FIELDS.intersection(vals):
+            self.env['ai.tool.cache']._invalidate('stock')
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['ai.tool.cache']._invalidate('stock')
+        return super().unlink()
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ai.tool.cache']._invalidate('stock')
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if PRODUCT_FIELDS.intersection(vals):
+            self.env['ai.tool.cache']._invalidate('stock')
+        return super().write(vals)
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        if PRODUCT_FIELDS.intersection(vals):
+            self.env['ai.tool.cache']._invalidate('stock')
+        return super().write(vals)
+
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    def write(self, vals):
+        if 'state' in vals or 'quantity' in vals:
+            self.env['ai.tool.cache']._invalidate('stock')
+        return super().write(vals)
+
+
+class CrmLead(models.Model):
+    _inherit = 'crm.lead'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().unlink()
+
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().unlink()
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().write(vals)
+
+    def unlink(self):
+        self.env['ai.tool.cache']._invalidate('crm')
+        return super().unlink()
@@ -0,0 +1,183 @@
+from odoo import models, api, fields
+from datetime import timedelta
+import logging
+
+from ..tools import flow_control
+
+_logger = logging.getLogger(__name__)
+
+# Reintentos: 30s, 60s, 120s, 240s... hasta MAX_ATTEMPTS
+RETRY_BASE_SECONDS = 30
+MAX_ATTEMPTS = 5
+# Un visitante que no deja de escribir se responde como mucho tras esta cantidad de ventanas
+MAX_DEBOUNCE_WINDOWS = 4
+
+SHED_REPLY = (
+    "⏳ Estamos recibiendo muchas consultas en este momento. "
+    "En breve te responderemos; mientras tanto puedes seguir escribiendo tu pregunta."
+)
+
+
+class LivechatAIQueue(models.Model):
+    _name = "livechat.ai.queue"
+    _description = "Cola de respuestas IA para Livechat"
+    _order = "id"
+
+    channel_id = fields.Many2one('discuss.channel', string="Canal", required=True, ondelete='cascade', index=True)
+    livechat_channel_id = fields.Many2one('im_livechat.channel', string="Canal Livechat", ondelete='set null')
+    message_id = fields.Many2one('mail.message', string="Mensaje", required=True, ondelete='cascade')
+    author_id = fields.Many2one('res.partner', string="Autor", ondelete='set null')
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('done', 'Respondido'),
+        ('shed', 'Descartado por carga'),
+        ('failed', 'Fallido'),
+    ], string="Estado", default='pending', required=True, index=True)
+    attempts = fields.Integer(string="Intentos", default=0)
+    next_attempt_date = fields.Datetime(string="Próximo intento", default=fields.Datetime.now, index=True)
+    processed_date = fields.Datetime(string="Fecha de respuesta")
+    reply_delay = fields.Float(string="Demora de respuesta (s)", digits=(16, 3))
+    error = fields.Text(string="Último error")
+
+    @api.model
+    def _enqueue(self, vals_list):
+        """Encola mensajes de livechat y despierta al despachador
+
+        Con una ventana de agrupación el nuevo trabajo vence al final de la
+        ventana; el despachador espera a que venza el último trabajo del canal
+        para responder todos juntos (ver ``_debounced_channels``). Aquí solo se
+        inserta: la transacción del visitante no toca filas que el despachador
+        pueda estar procesando.
+        """
+        due = fields.Datetime.now() + timedelta(seconds=self._get_debounce_window())
+        jobs = self.sudo().create([dict(vals, next_attempt_date=due) for vals in vals_list])
+        cron = self.env.ref('modulo.ir_cron_livechat_ai_queue', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger(at=due)
+        return jobs
+
+    @api.model
+    def _cron_process_queue(self, limit=200):
+        """Procesa los mensajes pendientes agrupados por canal, cada canal en su propia transacción"""
+        jobs = self.search([
+            ('state', '=', 'pending'),
+            ('next_attempt_date', '<=', fields.Datetime.now()),
+        ], limit=limit)
+        debounced = jobs._debounced_channels()
+
+        for channel, channel_jobs in jobs.grouped('channel_id').items():
+            if channel in debounced:
+                # El visitante sigue escribiendo: se responde cuando venza su último mensaje
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    channel_jobs._process_channel(channel)
+            except Exception as e:
+                _logger.warning("Error respondiendo en canal %s, se reintentará: %s", channel.id, e)
+                channel_jobs._schedule_retry(str(e))
+            self.env.cr.commit()
+
+        if len(jobs) == limit and jobs.channel_id - debounced:
+            # Quedan mensajes: volver a ejecutar sin esperar al siguiente intervalo
+            self.env.ref('modulo.ir_cron_livechat_ai_queue')._trigger()
+
+    @api.model
+    def _get_debounce_window(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('modulo.ai_debounce_seconds', 3) or 0)
+
+    def _debounced_channels(self):
+        """Canales de estos trabajos vencidos con un mensaje más reciente aún dentro de su ventana
+
+        Un canal deja de esperar cuando su primer mensaje pendiente supera
+        MAX_DEBOUNCE_WINDOWS ventanas, para que un visitante que no deja de
+        escribir también reciba respuesta.
+        """
+        window = self._get_debounce_window()
+        if window <= 0 or not self:
+            return self.env['discuss.channel']
+        now = fields.Datetime.now()
+        waiting = self.search([
+            ('channel_id', 'in', self.channel_id.ids),
+            ('state', '=', 'pending'),
+            ('attempts', '=', 0),
+            ('next_attempt_date', '>', now),
+        ]).channel_id
+        oldest = now - timedelta(seconds=window * MAX_DEBOUNCE_WINDOWS)
+        overdue = self.filtered(lambda job: job.create_date <= oldest).channel_id
+        return waiting - overdue
+
+    @api.model
+    def _get_flow_limits(self):
+        params = self.env['ir.config_parameter'].sudo()
+        return {
+            'visitor_rate': int(params.get_param('modulo.ai_visitor_rate', 6)),
+            'channel_rate': int(params.get_param('modulo.ai_channel_rate', 60)),
+        }
+
+    def _process_channel(self, channel):
+        """Responde con un único mensaje los pendientes del canal, o con la respuesta de carga
+
+        Los mensajes seguidos del visitante se combinan en un solo prompt. Antes
+        de llamar a la IA se consume una ficha del visitante y otra del canal de
+        livechat. No hace falta limitar respuestas simultáneas: el despachador
+        es un único cron que atiende los canales de uno en uno.
+        """
+        jobs = self.sorted('id')
+        last = jobs[-1]
+        limits = self._get_flow_limits()
+        controller = flow_control.get_controller(self.env.cr.dbname)
+        handler = self.env['mail.message']
+
+        state = 'shed'
+        if controller.admit(last.author_id.id, last.livechat_channel_id.id,
+                            limits['visitor_rate'], limits['channel_rate']):
+            handler._process_livechat_ai_response(channel, jobs.message_id, last.livechat_channel_id.id)
+            state = 'done'
+        if state == 'done':
+            controller.count('processed', len(jobs))
+            controller.count('coalesced', len(jobs) - 1)
+        else:
+            handler._post_bot_reply(channel, SHED_REPLY)
+            controller.count('shed', len(jobs))
+            self.env['ai.interaction.log'].sudo()._log(None, reply=SHED_REPLY, state='shed', channel=channel)
+
+        now = fields.Datetime.now()
+        for job in jobs:
+            job.write({
+                'state': state,
+                'attempts': job.attempts + 1,
+                'processed_date': now,
+                'reply_delay': (now - job.create_date).total_seconds(),
+                'error': False,
+            })
+        _logger.info("⏱️ Respuesta IA (%s) en canal %s a %s mensaje(s) tras %.2fs en cola",
+                     state, channel.id, len(jobs), jobs[0].reply_delay)
+
+    @api.model
+    def get_flow_stats(self):
+        """Mensajes procesados, agrupados y descartados por este proceso y estados de la última hora"""
+        stats = flow_control.get_controller(self.env.cr.dbname).stats()
+        since = fields.Datetime.now() - timedelta(hours=1)
+        stats['last_hour'] = dict(self.sudo()._read_group(
+            [('create_date', '>=', since)], ['state'], ['__count']))
+        return stats
+
+    def _schedule_retry(self, error):
+        """Reprograma los trabajos con backoff exponencial o los marca como fallidos"""
+        now = fields.Datetime.now()
+        for job in self:
+            attempts = job.attempts + 1
+            if attempts >= MAX_ATTEMPTS:
+                job.write({'state': 'failed', 'attempts': attempts, 'error': error})
+            else:
+                job.write({
+                    'attempts': attempts,
+                    'next_attempt_date': now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1)),
+                    'error': error,
+                })
+
+    @api.autovacuum
+    def _gc_processed_jobs(self):
+        """Elimina trabajos respondidos hace más de 7 días"""
+        limit_date = fields.Datetime.now() - timedelta(days=7)
+        self.search([('state', 'in', ('done', 'shed')), ('processed_date', '<', limit_date)]).unlink()
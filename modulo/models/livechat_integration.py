@@ -1,9 +1,57 @@
-from odoo import models, api, fields
+from odoo import models, api, fields, tools
 import logging
 import re
+import time
+
+from ..tools import intent_router, llm_client, metrics, tool_results
 
 _logger = logging.getLogger(__name__)
 
+# Herramienta que ejecuta cada intención, para el registro de interacciones
+INTENT_TOOLS = {
+    'quotation': 'search_quotations_with_stock',
+    'low_stock': 'check_low_stock',
+    'inventory_summary': 'get_inventory_summary',
+    'category': 'search_product_by_category',
+    'create_opportunity': 'create_opportunity',
+    'stage': 'search_leads_by_stage',
+    'pipeline': 'get_pipeline_summary',
+    'list_opportunities': 'list_open_opportunities',
+    'lead_info': 'get_lead_info',
+    'stock_batch': 'get_stock_batch',
+    'product_search': 'search_products_detailed',
+}
+
+# Herramientas de listado: modelo, formateador y modelo de los ids que devuelven.
+# Sus resultados se guardan en el contexto del canal para las preguntas de seguimiento.
+LIST_TOOLS = {
+    'search_quotations_with_stock': ('ai.crm.actions', '_render_quotations_with_stock', 'sale.order'),
+    'check_low_stock': ('ai.inventory.actions', '_render_low_stock', 'product.product'),
+    'search_product_by_category': ('ai.inventory.actions', '_render_product_by_category', 'product.product'),
+    'search_leads_by_stage': ('ai.crm.actions', '_render_leads_by_stage', 'crm.lead'),
+    'list_open_opportunities': ('ai.crm.actions', '_render_open_opportunities', 'crm.lead'),
+    'get_lead_info': ('ai.crm.actions', '_render_lead_info', 'crm.lead'),
+    'get_stock_batch': ('ai.inventory.actions', '_render_stock_batch', 'product.product'),
+    'search_products_detailed': ('ai.inventory.actions', '_render_products_detailed', 'product.product'),
+}
+
+HELP_REPLY = (
+    "👋 Hola, soy tu asistente de IA. Puedo ayudarte con:\n\n"
+    "📦 **Inventario:**\n"
+    "  • Consultar stock de productos (ej: 'stock de desks')\n"
+    "  • Stock de varios productos por almacén (ej: 'stock de desks, sillas y lámparas en el almacén Norte')\n"
+    "  • Ver productos por categoría (ej: 'productos de la categoría muebles')\n"
+    "  • Resumen del inventario (ej: 'resumen de inventario')\n"
+    "  • Detectar stock bajo (ej: '¿hay productos con stock bajo?')\n\n"
+    "💼 **CRM:**\n"
+    "  • Listar oportunidades abiertas (ej: 'muéstrame las oportunidades')\n"
+    "  • Buscar leads por etapa (ej: 'leads en qualified')\n"
+    "  • Ver resumen del pipeline (ej: 'resumen del pipeline')\n"
+    "  • Crear nuevas oportunidades (ej: 'crear oportunidad para cliente X')\n"
+    "  • Consultar cotizaciones (ej: 'cotizaciones de pelotas')\n\n"
+    "¿En qué puedo ayudarte?"
+)
+
 class LivechatIntegration(models.Model):
     _name = "livechat.ai.integration"
     _description = "Integración IA con Livechat"
@@ -19,126 +67,295 @@ class LivechatIntegration(models.Model):
     )
 
     @api.model
-    def _call_ai_agent(self, ai_agent, prompt):
-        """Llama al agente IA y obtiene respuesta ejecutando acciones directamente"""
+    @tools.ormcache()
+    def _get_routing_table(self):
+        """{id de canal livechat (False = por defecto): (id integración, id agente)}
+
+        Se construye una vez por registro y se invalida al modificar integraciones.
+        """
+        table = {}
+        for integration in self.sudo().search([('ai_agent_id', '!=', False)], order='id'):
+            table.setdefault(integration.livechat_channel_id.id or False, (integration.id, integration.ai_agent_id.id))
+        return table
+
+    @api.model
+    def _route_livechat_channel(self, livechat_channel_id):
+        """Integración y agente para un canal livechat, o la integración por defecto"""
+        table = self._get_routing_table()
+        route = table.get(livechat_channel_id) or table.get(False)
+        if not route:
+            return self.browse(), self.env['ai.agent']
+        integration_id, agent_id = route
+        return self.browse(integration_id), self.env['ai.agent'].browse(agent_id)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env.registry.clear_cache()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if {'active', 'ai_agent_id', 'livechat_channel_id'}.intersection(vals):
+            self.env.registry.clear_cache()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super().unlink()
+
+    @api.model
+    def _call_ai_agent(self, ai_agent, prompt, channel=None):
+        """Llama al agente IA y obtiene respuesta ejecutando acciones directamente
+
+        Cada llamada queda en el registro de interacciones (``ai.interaction.log``).
+        Con ``channel``, las preguntas de seguimiento se resuelven sobre el
+        resultado anterior del canal (``ai.channel.context``).
+        """
+        start = time.perf_counter()
+        intent = tool = None
+        state = 'done'
         try:
-            prompt_lower = prompt.lower()
-            
-            # 1. COTIZACIONES - Máxima prioridad
-            if re.search(r'cotizacion|cotización|presupuesto|quote', prompt_lower):
-                product_name = self._extract_product_from_prompt(prompt)
-                _logger.info(f"🔍 Detectado: Búsqueda de cotizaciones para '{product_name}'")
-                return self.env['ai.crm.actions'].search_quotations_with_stock(product_name)
-            
-            # 2. STOCK BAJO
-            elif re.search(r'stock\s+bajo|poco\s+stock|bajo\s+inventario|inventory\s+low', prompt_lower):
-                _logger.info(f"🔍 Detectado: Stock bajo")
-                return self.env['ai.inventory.actions'].check_low_stock(threshold=10)
-            
-            # 3. RESUMEN DE INVENTARIO
-            elif re.search(r'resumen\s+inventario|inventario\s+completo|estado\s+inventario|inventory\s+summary', prompt_lower):
-                _logger.info(f"🔍 Detectado: Resumen de inventario")
-                return self.env['ai.inventory.actions'].get_inventory_summary()
-            
-            # 4. BÚSQUEDA POR CATEGORÍA
-            elif re.search(r'categoría|categoria|categor|by\s+category', prompt_lower):
-                category_name = self._extract_category_from_prompt(prompt)
-                _logger.info(f"🔍 Detectado: Productos por categoría '{category_name}'")
-                return self.env['ai.inventory.actions'].search_product_by_category(category_name or 'All')
-            
-            # 5. CREAR OPORTUNIDAD
-            elif re.search(r'crear.*oportunidad|nueva.*oportunidad|create.*opportunity|new.*opportunity', prompt_lower):
-                opportunity_data = self._extract_opportunity_data(prompt)
-                _logger.info(f"🔍 Detectado: Crear oportunidad '{opportunity_data['name']}'")
-                return self.env['ai.crm.actions'].create_opportunity(
-                    name=opportunity_data['name'],
-                    customer_name=opportunity_data['customer_name'],
-                    email=opportunity_data['email'],
-                    phone=opportunity_data['phone'],
-                    stage_name=opportunity_data['stage_name'],
-                    expected_revenue=opportunity_data['expected_revenue']
-                )
-            
-            # 6. BÚSQUEDA POR ETAPA (CRM)
-            elif re.search(r'etapa\s+(qualified|proposition|won|new)|leads?\s+en\s+(qualified|proposition|won|new)', prompt_lower):
-                stage_name = self._extract_stage_from_prompt(prompt)
-                _logger.info(f"🔍 Detectado: Búsqueda por etapa '{stage_name}'")
-                return self.env['ai.crm.actions'].search_leads_by_stage(stage_name)
-            
-            # 7. RESUMEN DEL PIPELINE
-            elif re.search(r'pipeline|resumen\s+ventas|sales\s+summary|pipeline\s+summary', prompt_lower):
-                _logger.info(f"🔍 Detectado: Resumen del pipeline")
-                return self.env['ai.crm.actions'].get_pipeline_summary()
-            
-            # 8. LISTAR OPORTUNIDADES
-            elif re.search(r'oportunidad|opportunity|lead', prompt_lower) and re.search(r'list|listar|mostrar|show|todas|abiertas|abierto', prompt_lower):
-                _logger.info(f"🔍 Detectado: Listar oportunidades abiertas")
-                return self.env['ai.crm.actions'].list_open_opportunities(limit=10)
-            
-            # 9. INFORMACIÓN DE LEAD/OPORTUNIDAD ESPECÍFICA
-            elif re.search(r'información|info|detalles|details|dame|tell\s+me', prompt_lower) and re.search(r'lead|oportunidad|opportunity', prompt_lower):
-                lead_name = self._extract_lead_name_from_prompt(prompt)
-                _logger.info(f"🔍 Detectado: Información de lead/oportunidad '{lead_name}'")
-                return self.env['ai.crm.actions'].get_lead_info(lead_name)
-            
-            # 10. BÚSQUEDA DE PRODUCTOS
-            elif re.search(r'busco|search|productos|products|stock|inventario', prompt_lower):
-                _logger.info(f"🔍 Detectado: Búsqueda general de productos")
-                return self.env['ai.inventory.actions'].search_products_detailed(prompt)
-            
-            else:
-                _logger.info(f"🔍 No se detectó intención clara, mostrando menú de ayuda")
-                return (
-                    "👋 Hola, soy tu asistente de IA. Puedo ayudarte con:\n\n"
-                    "📦 **Inventario:**\n"
-                    "  • Consultar stock de productos (ej: 'stock de desks')\n"
-                    "  • Ver productos por categoría (ej: 'productos de la categoría muebles')\n"
-                    "  • Resumen del inventario (ej: 'resumen de inventario')\n"
-                    "  • Detectar stock bajo (ej: '¿hay productos con stock bajo?')\n\n"
-                    "💼 **CRM:**\n"
-                    "  • Listar oportunidades abiertas (ej: 'muéstrame las oportunidades')\n"
-                    "  • Buscar leads por etapa (ej: 'leads en qualified')\n"
-                    "  • Ver resumen del pipeline (ej: 'resumen del pipeline')\n"
-                    "  • Crear nuevas oportunidades (ej: 'crear oportunidad para cliente X')\n"
-                    "  • Consultar cotizaciones (ej: 'cotizaciones de pelotas')\n\n"
-                    "¿En qué puedo ayudarte?"
-                )
-                
+            with metrics.timed(self.env, 'intent') as timer:
+                # Un único escaneo del prompt: intención de mayor prioridad + entidades
+                with metrics.timed(self.env, 'route'):
+                    match = intent_router.route(prompt)
+                    follow_up = intent_router.follow_up(prompt) if channel else None
+                context = follow_up and self.env['ai.channel.context'].sudo()._recall(channel)
+                resolved = context and self._resolve_follow_up(channel, context, follow_up, match)
+                if resolved:
+                    intent = 'follow_up'
+                    tool, response = resolved
+                else:
+                    intent = match.intent
+                timer.name = f"intent:{intent or 'none'}"
+                if not resolved:
+                    response = self._run_intent(ai_agent, prompt, match, channel=channel)
         except Exception as e:
-            _logger.error(f"❌ Error llamando agente IA: {e}", exc_info=True)
-            return f"❌ Disculpa, ocurrió un error: {str(e)}"
+            _logger.error("❌ Error llamando agente IA: %s", e, exc_info=True)
+            state = 'error'
+            response = f"❌ Disculpa, ocurrió un error: {str(e)}"
+        if not tool:
+            if intent:
+                tool = INTENT_TOOLS.get(intent)
+            else:
+                tool = 'help' if response == HELP_REPLY else 'llm'
+        self.env['ai.interaction.log'].sudo()._log(
+            prompt, intent=intent, tool=tool, latency=time.perf_counter() - start,
+            reply=response, state=state, channel=channel)
+        return response
 
     @api.model
-    def _extract_product_from_prompt(self, prompt):
-        """Extrae nombre de producto del prompt usando regex con límites de palabra"""
-        # Patrón regex para eliminar palabras COMPLETAS (con \b = límites de palabra)
-        stopwords_pattern = r'\b(existe|hay|alguna|algún|muéstrame|dame|verifica|para|con|en|el|la|los|las|de|del|cotización|cotizacion|cotizaciones|presupuesto|presupuestos|quote|quotes)\b'
+    def _run_list_tool(self, channel, intent, *args, cursor=None, **kwargs):
+        """Ejecuta la herramienta de listado de la intención y guarda los ids mostrados en el contexto del canal"""
+        tool = INTENT_TOOLS[intent]
+        model, renderer, res_model = LIST_TOOLS[tool]
+        actions = self.env[model]
+        if cursor is not None:
+            kwargs['cursor'] = cursor
+        data = tool_results.load(
+            getattr(actions, tool)(*args, structured=tool_results.FULL, **kwargs),
+            tool_results.decode_cursor(cursor),
+        )
+        if channel:
+            query = args[0] if args and isinstance(args[0], str) else None
+            self.env['ai.channel.context'].sudo()._remember(
+                channel, intent, tool, query, res_model, [row['id'] for row in data['rows']], data.get('next'))
+        return getattr(actions, renderer)(data)
+
+    @api.model
+    def _resolve_follow_up(self, channel, context, follow_up, match):
+        """(herramienta, respuesta) para una pregunta sobre el resultado anterior del canal, o None si no aplica
+
+        "ver más" continúa la herramienta anterior desde su cursor; "el segundo"
+        y "¿cuáles de esos tienen stock?" leen o filtran los ids guardados sin
+        volver a buscar.
+        """
+        kind = follow_up.kind
+        if kind == 'more':
+            # "más productos" tras una búsqueda de productos; otra intención es una consulta nueva
+            if match.intent not in (None, context['intent']):
+                return None
+            if not context['cursor']:
+                return 'context:more', "No hay más resultados de la consulta anterior."
+            _logger.info("🔍 Detectado: Siguiente página de '%s'", context['tool'])
+            args = (context['query'],) if context['query'] else ()
+            return context['tool'], self._run_list_tool(channel, context['intent'], *args, cursor=context['cursor'])
+
+        # "dame info del lead First Solutions", "crear oportunidad para estos clientes": el ordinal
+        # o "estos" forman parte de una consulta nueva
+        if follow_up.extra_words or match.entities or (
+                match.intent not in (None, context['intent']) and not match.tokens <= intent_router.FOLLOW_UP_TOKENS):
+            return None
+        ids = context['ids']
+        if context['res_model'] not in ('product.product', 'crm.lead') or not ids:
+            return None
+        if kind == 'select':
+            if follow_up.position > len(ids):
+                return 'context:select', f"Solo hay {len(ids)} resultado(s) en la consulta anterior."
+            position = follow_up.position - 1 if follow_up.position > 0 else follow_up.position
+            ids = [ids[position]]
+            filters = {}
+        elif context['res_model'] == 'product.product':
+            if follow_up.stage:
+                return None
+            filters = {'in_stock': follow_up.in_stock} if follow_up.in_stock is not None else {}
+        else:
+            # Un filtro de stock sobre leads es otra pregunta
+            if follow_up.in_stock is not None:
+                return None
+            filters = {'stage': follow_up.stage} if follow_up.stage else {}
+        _logger.info("🔍 Detectado: Seguimiento (%s) sobre %s id(s) de '%s'", kind, len(ids), context['tool'])
+
+        label = context['query'] or "la consulta anterior"
+        if context['res_model'] == 'product.product':
+            actions = self.env['ai.inventory.actions']
+            data = actions._describe_products(ids, label, **filters)
+            render = actions._render_products_detailed
+        else:
+            actions = self.env['ai.crm.actions']
+            data = actions._describe_leads(ids, label, **filters)
+            render = actions._render_lead_info
+        if not data['rows']:
+            return f'context:{kind}', "Ninguno de los resultados anteriores cumple esa condición."
+        if filters:
+            # "el segundo" se refiere ahora a la lista filtrada
+            self.env['ai.channel.context'].sudo()._narrow(channel, [row['id'] for row in data['rows']])
+        return f'context:{kind}', render(data)
+
+    @api.model
+    def _run_intent(self, ai_agent, prompt, match, channel=None):
+        """Ejecuta la herramienta de la intención detectada, o el modelo/menú de ayuda"""
+        intent = match.intent
+        entities = match.entities
+
+        # 1. COTIZACIONES - Máxima prioridad
+        if intent == 'quotation':
+            product_name = entities['product']
+            _logger.info("🔍 Detectado: Búsqueda de cotizaciones para '%s'", product_name)
+            return self._run_list_tool(channel, intent, product_name)
+        
+        # 2. STOCK BAJO
+        elif intent == 'low_stock':
+            page = max(entities.get('page', 1), 1)
+            _logger.info("🔍 Detectado: Stock bajo (página %s)", page)
+            offset = (page - 1) * 10
+            return self._run_list_tool(
+                channel, intent, cursor=tool_results.encode_cursor(offset) if offset else None, limit=10)
+        
+        # 3. RESUMEN DE INVENTARIO
+        elif intent == 'inventory_summary':
+            _logger.info("🔍 Detectado: Resumen de inventario")
+            return self.env['ai.inventory.actions'].get_inventory_summary(
+                by_warehouse='warehouse' in match.tokens,
+                by_category='category' in match.tokens,
+            )
         
-        # Limpiar caracteres especiales primero
-        cleaned = re.sub(r'[¿?¡!,;]', '', prompt.lower())
+        # 4. BÚSQUEDA POR CATEGORÍA
+        elif intent == 'category':
+            category_name = entities.get('category')
+            _logger.info("🔍 Detectado: Productos por categoría '%s'", category_name)
+            return self._run_list_tool(channel, intent, category_name)
         
-        # Eliminar stopwords usando regex (palabras completas)
-        cleaned = re.sub(stopwords_pattern, '', cleaned, flags=re.IGNORECASE)
+        # 5. CREAR OPORTUNIDAD
+        elif intent == 'create_opportunity':
+            opportunity_data = self._extract_opportunity_data(prompt, email=entities.get('email', ''))
+            _logger.info("🔍 Detectado: Crear oportunidad '%s'", opportunity_data['name'])
+            return self.env['ai.crm.actions'].create_opportunity(
+                name=opportunity_data['name'],
+                customer_name=opportunity_data['customer_name'],
+                email=opportunity_data['email'],
+                phone=opportunity_data['phone'],
+                stage_name=opportunity_data['stage_name'],
+                expected_revenue=opportunity_data['expected_revenue']
+            )
         
-        # Eliminar espacios múltiples y trim
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+        # 6. BÚSQUEDA POR ETAPA (CRM)
+        elif intent == 'stage':
+            stage_name = entities['stage']
+            _logger.info("🔍 Detectado: Búsqueda por etapa '%s'", stage_name)
+            return self._run_list_tool(channel, intent, stage_name)
         
-        # Tomar las primeras palabras significativas (mínimo 2 caracteres)
-        words = [w for w in cleaned.split() if len(w) > 1]
-        result = ' '.join(words[:5]) if words else 'producto'
+        # 7. RESUMEN DEL PIPELINE
+        elif intent == 'pipeline':
+            _logger.info("🔍 Detectado: Resumen del pipeline")
+            return self.env['ai.crm.actions'].get_pipeline_summary(
+                by_salesperson='salesperson' in match.tokens,
+            )
         
-        _logger.info(f"Producto extraído de '{prompt}': '{result}'")
+        # 8. LISTAR OPORTUNIDADES
+        elif intent == 'list_opportunities':
+            _logger.info("🔍 Detectado: Listar oportunidades abiertas")
+            return self._run_list_tool(channel, intent, limit=10)
+        
+        # 9. INFORMACIÓN DE LEAD/OPORTUNIDAD ESPECÍFICA
+        elif intent == 'lead_info':
+            # Un correo en el mensaje identifica el lead mejor que cualquier nombre
+            lead_name = entities.get('email') or self._extract_lead_name_from_prompt(prompt)
+            _logger.info("🔍 Detectado: Información de lead/oportunidad '%s'", lead_name)
+            return self._run_list_tool(channel, intent, lead_name)
+        
+        # 10. STOCK DE VARIOS PRODUCTOS / POR ALMACÉN
+        elif intent == 'stock_batch':
+            _logger.info("🔍 Detectado: Stock de %s producto(s)", len(entities['products']))
+            return self._run_list_tool(channel, intent, entities['products'], warehouse=entities.get('warehouse'))
+
+        # 11. BÚSQUEDA DE PRODUCTOS
+        elif intent == 'product_search':
+            _logger.info("🔍 Detectado: Búsqueda general de productos")
+            return self._run_list_tool(channel, intent, prompt)
+        
+        else:
+            reply = self._call_llm_fallback(ai_agent, prompt)
+            if reply:
+                return reply
+            _logger.info("🔍 No se detectó intención clara, mostrando menú de ayuda")
+            return HELP_REPLY
+
+    @api.model
+    def _get_llm_client(self):
+        """Cliente Gemini compartido del proceso, o None si no hay API key configurada"""
+        params = self.env['ir.config_parameter'].sudo()
+        api_key = params.get_param('modulo.ai_api_key')
+        if not api_key:
+            return None
+        return llm_client.get_client(
+            base_url=params.get_param('modulo.ai_base_url') or llm_client.DEFAULT_BASE_URL,
+            api_key=api_key,
+            model=params.get_param('modulo.ai_model') or llm_client.DEFAULT_MODEL,
+            timeout=float(params.get_param('modulo.ai_timeout', llm_client.DEFAULT_TIMEOUT)),
+            max_concurrency=int(params.get_param('modulo.ai_max_concurrency', llm_client.DEFAULT_MAX_CONCURRENCY)),
+        )
+
+    @api.model
+    def _call_llm_fallback(self, ai_agent, prompt):
+        """Respuesta del modelo para mensajes sin intención reconocida, o False si no está disponible"""
+        client = self._get_llm_client()
+        if not client:
+            return False
+        try:
+            reply = client.generate(prompt, system_prompt=ai_agent.system_prompt or None)
+        except llm_client.LLMUnavailable as e:
+            _logger.warning("Fallback LLM no disponible, se muestra el menú de ayuda: %s", e)
+            return False
+        _logger.info("🤖 Respuesta generada por el modelo")
+        return reply
+
+    @api.model
+    def get_llm_stats(self):
+        """Latencias p50/p99, rendimiento y estado del circuito del cliente LLM de este proceso"""
+        client = self._get_llm_client()
+        return client.get_stats() if client else {}
+
+    @api.model
+    def _extract_product_from_prompt(self, prompt):
+        """Extrae nombre de producto del prompt usando regex con límites de palabra"""
+        result = intent_router.extract_product(prompt)
+        _logger.debug("Producto extraído de '%s': '%s'", prompt, result)
         return result
 
     @api.model
     def _extract_category_from_prompt(self, prompt):
         """Extrae nombre de categoría del prompt"""
-        match = re.search(r'categoría\s+([a-záéíóú\w]+)|categoria\s+([a-záéíóú\w]+)', prompt, re.IGNORECASE)
-        if match:
-            category = match.group(1) or match.group(2)
-            _logger.info(f"Categoría extraída: '{category}'")
-            return category
-        return 'All'
+        return intent_router.extract_category(prompt)
 
     @api.model
     def _extract_stage_from_prompt(self, prompt):
@@ -151,19 +368,19 @@ class LivechatIntegration(models.Model):
         }
         for stage_key, stage_value in stages.items():
             if stage_key in prompt.lower():
-                _logger.info(f"Etapa extraída: '{stage_value}'")
+                _logger.info("Etapa extraída: '%s'", stage_value)
                 return stage_value
         return 'New'
 
     @api.model
     def _extract_lead_name_from_prompt(self, prompt):
         """Extrae nombre del lead/oportunidad del prompt"""
-        cleaned = re.sub(r'(información|info|detalles|details|dame|tell\s+me|lead|oportunidad|opportunity|del?|de|la)', '', prompt, flags=re.IGNORECASE).strip()
-        _logger.info(f"Lead/Oportunidad extraída: '{cleaned}'")
+        cleaned = intent_router.extract_lead_name(prompt)
+        _logger.info("Lead/Oportunidad extraída: '%s'", cleaned)
         return cleaned or 'lead'
 
     @api.model
-    def _extract_opportunity_data(self, prompt):
+    def _extract_opportunity_data(self, prompt, email=None):
         """Extrae datos para crear oportunidad del prompt"""
         data = {
             'name': '',
@@ -178,9 +395,11 @@ class LivechatIntegration(models.Model):
         if name_match:
             data['name'] = name_match.group(1)
         
-        email_match = re.search(r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', prompt)
-        if email_match:
-            data['email'] = email_match.group(1)
+        if email is None:
+            _positions, entities = intent_router.scan(prompt)
+            email = entities.get('email')
+        if email:
+            data['email'] = email
         
         client_match = re.search(r'(?:cliente|customer|para)\s+"?([^"\n,]+)"?', prompt, re.IGNORECASE)
         if client_match:
@@ -191,5 +410,5 @@ class LivechatIntegration(models.Model):
         elif not data['name']:
             data['name'] = "Nueva Oportunidad"
         
-        _logger.info(f"Datos de oportunidad extraídos: {data}")
+        _logger.info("Datos de oportunidad extraídos: %s", data)
         return data
\ No newline at end of file
@@ -1,73 +1,140 @@
 from odoo import models, api
+from odoo.tools import SQL
 import logging
 import re
 
+from ..tools import metrics
+
 _logger = logging.getLogger(__name__)
 
+
+class DiscussChannel(models.Model):
+    _inherit = 'discuss.channel'
+
+    @api.model
+    def _get_livechat_channel_map(self, channel_ids):
+        """{id de canal: id de canal livechat} para los canales abiertos de livechat
+
+        Se lee de la base de datos (una consulta por clave primaria): un canal
+        cerrado en otro proceso deja de recibir respuestas en el acto.
+        """
+        if not channel_ids:
+            return {}
+        if 'livechat_end_dt' in self._fields:
+            state_field, open_clause = 'livechat_end_dt', SQL("livechat_end_dt IS NULL")
+        elif 'livechat_active' in self._fields:
+            state_field, open_clause = 'livechat_active', SQL("livechat_active")
+        else:
+            state_field, open_clause = None, SQL("TRUE")
+        self.flush_model(['livechat_channel_id'] + ([state_field] if state_field else []))
+        self.env.cr.execute(SQL("""
+            SELECT id, livechat_channel_id
+              FROM discuss_channel
+             WHERE id = ANY(%s) AND livechat_channel_id IS NOT NULL AND %s
+        """, list(channel_ids), open_clause))
+        return dict(self.env.cr.fetchall())
+
+    def message_post(self, **kwargs):
+        if self.channel_type != 'livechat':
+            return super().message_post(**kwargs)
+        with metrics.timed(self.env, 'message_post:livechat'):
+            return super().message_post(**kwargs)
+
+
 class MailMessage(models.Model):
     _inherit = 'mail.message'
 
     @api.model_create_multi
     def create(self, vals_list):
-        """Intercepta creación de mensajes para procesar con IA si es livechat"""
+        """Intercepta creación de mensajes y encola los de livechat para responder con IA
+
+        Camino rápido: sin mensajes de discuss.channel no se hace ningún trabajo
+        adicional; la pertenencia a livechat se resuelve con una sola consulta.
+        """
         records = super().create(vals_list)
-        
-        for record in records:
-            try:
-                # Verificar si es un mensaje de discuss.channel (Odoo 19)
-                if record.model == 'discuss.channel' and record.res_id:
-                    channel = self.env['discuss.channel'].browse(record.res_id)
-                    
-                    # Verificar si el canal tiene livechat_channel_id
-                    if hasattr(channel, 'livechat_channel_id') and channel.livechat_channel_id:
-                        # Solo procesar mensajes de usuarios (no del bot)
-                        bot_partner = self.env.ref('base.partner_root', raise_if_not_found=False)
-                        if record.author_id and (not bot_partner or record.author_id != bot_partner):
-                            self._process_livechat_ai_response(channel, record)
-            except Exception as e:
-                _logger.warning(f"Error procesando mensaje livechat: {e}")
-        
+
+        if not any(vals.get('model') == 'discuss.channel' for vals in vals_list):
+            return records
+
+        candidates = [
+            (record, vals['res_id'])
+            for record, vals in zip(records, vals_list)
+            if vals.get('model') == 'discuss.channel' and vals.get('res_id')
+        ]
+        livechat_map = self.env['discuss.channel']._get_livechat_channel_map({res_id for _record, res_id in candidates})
+        if not livechat_map:
+            return records
+
+        # Solo procesar mensajes de usuarios (no del bot)
+        bot_partner_id = self.env['ir.model.data']._xmlid_to_res_id('base.partner_root', raise_if_not_found=False)
+        jobs = [
+            {
+                'channel_id': res_id,
+                'livechat_channel_id': livechat_map[res_id],
+                'message_id': record.id,
+                'author_id': record.author_id.id,
+            }
+            for record, res_id in candidates
+            if res_id in livechat_map and record.author_id and record.author_id.id != bot_partner_id
+        ]
+
+        # La respuesta se genera fuera de esta transacción (ver livechat.ai.queue)
+        if jobs:
+            self.env['livechat.ai.queue']._enqueue(jobs)
+
         return records
 
     @api.model
-    def _process_livechat_ai_response(self, channel, message):
-        """Procesa el mensaje con IA y envía respuesta automática"""
-        try:
-            # Obtener la integración IA
-            integration = self.env['livechat.ai.integration'].search(
-                [('active', '=', True)],
-                limit=1
-            )
-            
-            if not integration or not integration.ai_agent_id:
-                _logger.info("No hay integración IA activa")
-                return
-
-            # Procesar el mensaje del usuario
-            message_body = message.body or ''
-            
-            # Limpiar HTML
-            if '<' in message_body:
-                message_body = re.sub('<[^<]+?>', '', message_body).strip()
-
-            if not message_body:
-                return
-
-            _logger.info(f"Procesando mensaje de livechat: {message_body[:50]}...")
-
-            # Obtener respuesta del agente IA
-            response = integration._call_ai_agent(integration.ai_agent_id, message_body)
-
-            if response:
-                # Enviar respuesta del bot automáticamente
-                bot_partner = self.env.ref('base.partner_root', raise_if_not_found=False)
-                channel.message_post(
-                    body=response,
-                    message_type='comment',
-                    subtype_xmlid='mail.mt_comment',
-                    author_id=bot_partner.id if bot_partner else False
-                )
-                
-                _logger.info(f"✅ Respuesta IA enviada al canal {channel.name}")
-        except Exception as e:
-            _logger.error(f"❌ Error procesando respuesta IA: {e}", exc_info=True)
\ No newline at end of file
+    def _process_livechat_ai_response(self, channel, message, livechat_channel_id=None):
+        """Procesa el mensaje con IA y envía respuesta automática
+
+        ``message`` puede contener varios mensajes seguidos del visitante: se
+        responden con un único prompt combinado. Se ejecuta desde el
+        despachador de la cola; los errores se propagan para que el trabajo
+        se reintente.
+        """
+        # Obtener la integración IA del canal (tabla de rutas en memoria)
+        if livechat_channel_id is None:
+            livechat_channel_id = channel.livechat_channel_id.id
+        integration, ai_agent = self.env['livechat.ai.integration']._route_livechat_channel(livechat_channel_id)
+
+        if not integration or not ai_agent:
+            _logger.info("No hay integración IA activa")
+            return False
+
+        # Procesar los mensajes del usuario, limpiando HTML
+        bodies = []
+        for body in message.mapped('body'):
+            body = body or ''
+            if '<' in body:
+                body = re.sub('<[^<]+?>', '', body)
+            if body.strip():
+                bodies.append(body.strip())
+        message_body = ' '.join(bodies)
+
+        if not message_body:
+            return False
+
+        _logger.info("Procesando mensaje de livechat: %s...", message_body[:50])
+
+        # Obtener respuesta del agente IA
+        response = integration._call_ai_agent(ai_agent, message_body, channel=channel)
+
+        if not response:
+            return False
+
+        # Enviar respuesta del bot automáticamente
+        self._post_bot_reply(channel, response)
+
+        _logger.info("✅ Respuesta IA enviada al canal %s", channel.name)
+        return True
+
+    @api.model
+    def _post_bot_reply(self, channel, body):
+        bot_partner = self.env.ref('base.partner_root', raise_if_not_found=False)
+        channel.message_post(
+            body=body,
+            message_type='comment',
+            subtype_xmlid='mail.mt_comment',
+            author_id=bot_partner.id if bot_partner else False
+        )
@@ -4,3 +4,62 @@ class ResConfigSettings(models.TransientModel):
     _inherit = 'res.config.settings'
 
     ai_api_key = fields.Char(string="AI API Key", config_parameter='modulo.ai_api_key')
+    ai_model = fields.Char(string="Modelo", default='gemini-1.5-flash', config_parameter='modulo.ai_model')
+    ai_base_url = fields.Char(
+        string="URL del proveedor", default='https://generativelanguage.googleapis.com',
+        config_parameter='modulo.ai_base_url')
+    ai_timeout = fields.Integer(string="Timeout del modelo (s)", default=20, config_parameter='modulo.ai_timeout')
+    ai_max_concurrency = fields.Integer(
+        string="Llamadas simultáneas al modelo", default=4, config_parameter='modulo.ai_max_concurrency')
+    ai_inventory_mode = fields.Selection([
+        ('live', 'En vivo'),
+        ('snapshot', 'Snapshot'),
+    ], string="Modo de inventario IA", default='live', config_parameter='modulo.inventory_mode')
+    ai_low_stock_threshold = fields.Integer(
+        string="Umbral de stock bajo", default=10, config_parameter='modulo.low_stock_threshold')
+    ai_tool_token_budget = fields.Integer(
+        string="Presupuesto de tokens por herramienta", default=600, config_parameter='modulo.ai_tool_token_budget')
+    ai_debounce_seconds = fields.Integer(
+        string="Ventana de agrupación (s)", default=3, config_parameter='modulo.ai_debounce_seconds')
+    ai_visitor_rate = fields.Integer(
+        string="Respuestas por minuto y visitante", default=6, config_parameter='modulo.ai_visitor_rate')
+    ai_channel_rate = fields.Integer(
+        string="Respuestas por minuto y canal", default=60, config_parameter='modulo.ai_channel_rate')
+    ai_context_ttl = fields.Integer(
+        string="Duración del contexto (s)", default=900, config_parameter='modulo.ai_context_ttl')
+    ai_semantic_search = fields.Boolean(
+        string="Búsqueda semántica de productos", config_parameter='modulo.semantic_search')
+    ai_cache_ttl = fields.Integer(
+        string="Duración de la caché IA (s)", default=300, config_parameter='modulo.ai_cache_ttl')
+    ai_cache_size = fields.Integer(
+        string="Entradas máximas de la caché IA", default=1000, config_parameter='modulo.ai_cache_size')
+    ai_quotation_priority = fields.Selection([
+        ('date', 'Fecha de la cotización'),
+        ('amount', 'Importe de la cotización'),
+    ], string="Prioridad de asignación de stock", default='date', config_parameter='modulo.quotation_priority')
+    ai_quotation_stock_basis = fields.Selection([
+        ('free', 'Stock libre'),
+        ('forecast', 'Stock pronosticado'),
+    ], string="Stock a repartir", default='free', config_parameter='modulo.quotation_stock_basis')
+    ai_pipeline_aggregates = fields.Boolean(
+        string="Agregados del pipeline", config_parameter='modulo.pipeline_aggregates')
+    ai_metrics_token = fields.Char(string="Token de métricas", config_parameter='modulo.metrics_token')
+    ai_metrics_profile_rate = fields.Float(
+        string="Fracción perfilada", digits=(16, 3), config_parameter='modulo.metrics_profile_rate')
+    ai_metrics_profile_keep = fields.Integer(
+        string="Perfiles conservados", default=10, config_parameter='modulo.metrics_profile_keep')
+    ai_interaction_log_days = fields.Integer(
+        string="Retención del registro (días)", default=30, config_parameter='modulo.interaction_log_days')
+
+    def set_values(self):
+        pipeline_was_enabled = self.env['ai.pipeline.aggregate']._is_enabled()
+        snapshot_was_enabled = self.env['ai.inventory.snapshot']._is_enabled()
+        super().set_values()
+        if self.ai_pipeline_aggregates and not pipeline_was_enabled:
+            self.env['ai.pipeline.aggregate'].sudo()._rebuild()
+        if self.ai_semantic_search:
+            # Construye el índice si todavía no existe
+            self.env.ref('modulo.ir_cron_ai_semantic_index')._trigger()
+        if self.ai_inventory_mode == 'snapshot' and not snapshot_was_enabled:
+            # Las lecturas pasan al snapshot en cuanto se guarda: debe estar completo antes
+            self.env['ai.inventory.snapshot'].sudo()._refresh()
@@ -0,0 +1,2 @@
+from . import test_ai_actions
+from . import test_ai_benchmarks
@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+from odoo import fields
+from odoo.tests import TransactionCase
+
+_logger = logging.getLogger(__name__)
+
+# Registros creados por llamada a create()
+BATCH_SIZE = 5000
+
+PRODUCT_NOUNS = ['Desk', 'Chair', 'Lamp', 'Pelota', 'Balón', 'Mesa', 'Silla', 'Cable', 'Monitor', 'Teclado']
+PRODUCT_ADJECTIVES = ['Pro', 'Basic', 'Oficina', 'Soccer', 'Premium', 'Mini', 'Plus', 'Eco']
+CATEGORY_ROOTS = ['Muebles', 'Deportes', 'Electrónica', 'Iluminación']
+
+
+def product_name(index):
+    """Nombre del producto sintético ``index`` ("Desk Pro 0000000", "Chair Pro 0000001", ...)"""
+    noun = PRODUCT_NOUNS[index % len(PRODUCT_NOUNS)]
+    adjective = PRODUCT_ADJECTIVES[index // len(PRODUCT_NOUNS) % len(PRODUCT_ADJECTIVES)]
+    return f"{noun} {adjective} {index:07d}"
+
+
+def percentile(values, percent):
+    """Percentil por rango más cercano"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class AIDataGenerator:
+    """Catálogo, stock, CRM y cotizaciones sintéticos proporcionales a ``scale`` productos
+
+    Con la misma semilla genera siempre los mismos datos, de modo que los
+    resultados de dos commits son comparables.
+    """
+
+    def __init__(self, env, scale, seed=42):
+        self.env = env
+        self.scale = scale
+        self.random = random.Random(seed)
+
+    def _create(self, model, vals_list):
+        records = self.env[model].browse()
+        for start in range(0, len(vals_list), BATCH_SIZE):
+            records |= self.env[model].create(vals_list[start:start + BATCH_SIZE])
+        return records
+
+    def generate(self):
+        start = time.perf_counter()
+        data = {}
+        data['warehouses'] = self._generate_warehouses()
+        data['categories'] = self._generate_categories()
+        data['products'] = self._generate_products(data['categories'])
+        data['quants'] = self._generate_quants(data['products'], data['warehouses'])
+        data['partners'] = self._generate_partners()
+        data['stages'] = self._generate_stages()
+        data['leads'] = self._generate_leads(data['partners'], data['stages'])
+        data['orders'] = self._generate_orders(data['partners'], data['products'])
+        self.env.flush_all()
+        _logger.info("Datos de benchmark generados (%s productos) en %.1fs", self.scale, time.perf_counter() - start)
+        return data
+
+    def _generate_warehouses(self):
+        main = self.env['stock.warehouse'].search([('company_id', '=', self.env.company.id)], limit=1)
+        north = self.env['stock.warehouse'].create({'name': 'Norte', 'code': 'BNOR'})
+        return main | north
+
+    def _generate_categories(self):
+        roots = self._create('product.category', [{'name': name} for name in CATEGORY_ROOTS])
+        count = max(self.scale // 100, len(roots))
+        return roots | self._create('product.category', [
+            {'name': f"{roots[index % len(roots)].name} {index:05d}", 'parent_id': roots[index % len(roots)].id}
+            for index in range(count)
+        ])
+
+    def _generate_products(self, categories):
+        vals_list = []
+        for index in range(self.scale):
+            vals_list.append({
+                'name': product_name(index),
+                'default_code': f"BENCH{index:07d}",
+                'barcode': f"99{index:011d}",
+                'categ_id': categories[self.random.randrange(len(categories))].id,
+                'list_price': round(self.random.uniform(1, 500), 2),
+                'is_storable': True,
+            })
+        return self._create('product.product', vals_list)
+
+    def _generate_quants(self, products, warehouses):
+        vals_list = []
+        for index, product in enumerate(products):
+            vals_list.append({
+                'product_id': product.id,
+                'location_id': warehouses[0].lot_stock_id.id,
+                'quantity': self.random.randint(0, 100),
+            })
+            if index % 3 == 0:
+                vals_list.append({
+                    'product_id': product.id,
+                    'location_id': warehouses[1].lot_stock_id.id,
+                    'quantity': self.random.randint(0, 50),
+                })
+        return self._create('stock.quant', vals_list)
+
+    def _generate_partners(self):
+        return self._create('res.partner', [
+            {'name': f"Cliente {index:06d}", 'email': f"cliente{index}@example.com"}
+            for index in range(max(self.scale // 10, 10))
+        ])
+
+    def _generate_stages(self):
+        existing = self.env['crm.stage'].search([])
+        return existing | self._create('crm.stage', [
+            {'name': f"Etapa {index}", 'sequence': 50 + index}
+            for index in range(max(self.scale // 100000, 2))
+        ])
+
+    def _generate_leads(self, partners, stages):
+        users = self.env.user | self.env['res.users'].create([
+            {'name': f"Vendedor {index}", 'login': f"bench_seller_{index}"} for index in range(3)
+        ])
+        vals_list = []
+        for index in range(self.scale):
+            partner = partners[index % len(partners)]
+            vals_list.append({
+                'name': f"Oportunidad {index:07d}",
+                'type': 'opportunity' if index % 4 else 'lead',
+                'partner_id': partner.id,
+                'email_from': partner.email,
+                'stage_id': stages[index % len(stages)].id,
+                'user_id': users[index % len(users)].id,
+                'expected_revenue': self.random.randint(100, 100000),
+                'probability': self.random.randint(0, 100),
+            })
+        return self._create('crm.lead', vals_list)
+
+    def _generate_orders(self, partners, products):
+        vals_list = []
+        for index in range(max(self.scale // 10, 10)):
+            vals_list.append({
+                'partner_id': partners[index % len(partners)].id,
+                'order_line': [
+                    (0, 0, {
+                        'product_id': products[self.random.randrange(len(products))].id,
+                        'product_uom_qty': self.random.randint(1, 40),
+                    })
+                    for _line in range(3)
+                ],
+            })
+        return self._create('sale.order', vals_list)
+
+
+class AIBenchmarkCase(TransactionCase):
+    """Genera los datos una vez por clase, mide llamadas y guarda los resultados en JSON
+
+    Los resultados se escriben en ``$MODULO_BENCH_DIR/<clase>.json`` (por
+    defecto en el directorio temporal) al terminar la clase.
+    """
+    SCALE = 1000
+    RUNS = 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        params = cls.env['ir.config_parameter'].sudo()
+        # Medir las herramientas, no la caché; sin API key el fallback no sale a la red
+        params.set_param('modulo.ai_cache_ttl', 0)
+        params.set_param('modulo.ai_api_key', False)
+        cls.results = []
+        cls.data = AIDataGenerator(cls.env, cls.SCALE).generate()
+        cls.product = cls.data['products'][len(cls.data['products']) // 2]
+        cls.category = cls.data['categories'][-1]
+        cls.lead = cls.data['leads'][-1]
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.results:
+            cls._write_results()
+        super().tearDownClass()
+
+    @classmethod
+    def _write_results(cls):
+        directory = os.environ.get('MODULO_BENCH_DIR') or os.path.join(tempfile.gettempdir(), 'modulo_bench')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{cls.__name__}.json")
+        with open(path, 'w') as f:
+            json.dump({
+                'commit': _git_commit(),
+                'date': fields.Datetime.now().isoformat(),
+                'scale': cls.SCALE,
+                'results': cls.results,
+            }, f, indent=2, default=str)
+        _logger.info("Resultados de benchmark escritos en %s", path)
+
+    def count_queries(self, function):
+        """Consultas SQL que ejecuta ``function`` con la caché del ORM vacía"""
+        self.env.flush_all()
+        self.env.invalidate_all()
+        count = self.env.cr.sql_log_count
+        function()
+        self.env.flush_all()
+        return self.env.cr.sql_log_count - count
+
+    def measure(self, name, function, runs=None, **extra):
+        """Ejecuta ``function`` varias veces con la caché del ORM vacía y anota tiempos y consultas"""
+        function()  # calentar ormcache y planes de consulta
+        timings, queries = [], []
+        result = None
+        for _run in range(runs or self.RUNS):
+            self.env.flush_all()
+            self.env.invalidate_all()
+            count = self.env.cr.sql_log_count
+            start = time.perf_counter()
+            result = function()
+            self.env.flush_all()
+            timings.append(time.perf_counter() - start)
+            queries.append(self.env.cr.sql_log_count - count)
+        entry = {
+            'name': name,
+            'scale': self.SCALE,
+            'runs': len(timings),
+            'mean': statistics.fmean(timings),
+            'p50': percentile(timings, 50),
+            'p99': percentile(timings, 99),
+            'queries': max(queries),
+            'bytes': len(result.encode()) if isinstance(result, str) else None,
+            **extra,
+        }
+        type(self).results.append(entry)
+        return result
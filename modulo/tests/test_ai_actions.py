@@ -0,0 +1,326 @@
+import json
+import threading
+import time
+
+from odoo.tests import tagged
+
+from .common import AIBenchmarkCase
+from ..tools import intent_router, llm_client, llm_stub
+
+
+@tagged('post_install', '-at_install')
+class TestAIActions(AIBenchmarkCase):
+    """Consultas constantes al crecer los datos y comportamiento de las herramientas IA"""
+    SCALE = 50
+
+    def _assert_constant_queries(self, call, grow):
+        """Las consultas de ``call`` no cambian después de ``grow()``"""
+        call()  # calentar ormcache
+        expected = self.count_queries(call)
+        grow()
+        self.env.flush_all()
+        with self.assertQueryCount(expected):
+            self.env.invalidate_all()
+            call()
+
+    def _create_product(self, name, qty):
+        product = self.env['product.product'].create({'name': name, 'is_storable': True})
+        self.env['stock.quant'].create({
+            'product_id': product.id,
+            'location_id': self.data['warehouses'][0].lot_stock_id.id,
+            'quantity': qty,
+        })
+        return product
+
+    def _create_quotations(self, product, quantities):
+        return self.env['sale.order'].create([
+            {
+                'partner_id': self.data['partners'][index % len(self.data['partners'])].id,
+                'order_line': [(0, 0, {'product_id': product.id, 'product_uom_qty': qty})],
+            }
+            for index, qty in enumerate(quantities)
+        ])
+
+    def test_quotation_stock_allocation(self):
+        product = self._create_product("Farola Asignación", 50)
+        self._create_quotations(product, [30, 30, 10])
+        data = json.loads(self.env['ai.crm.actions'].search_quotations_with_stock(product.name, structured=True))
+        # Solo las líneas de este producto: los datos sintéticos tienen sus propias cotizaciones
+        fills = [
+            (line['allocated'], line['fill'])
+            for row in data['rows'] for line in row['lines'] if line['product_id'] == product.id
+        ]
+        self.assertEqual(fills, [(30, 'full'), (20, 'partial'), (0, 'none')])
+
+    def test_quotation_query_count(self):
+        product = self._create_product("Pelota Consultas", 100)
+        self._create_quotations(product, [5, 5, 5])
+        self._assert_constant_queries(
+            lambda: self.env['ai.crm.actions'].search_quotations_with_stock(product.name),
+            lambda: self._create_quotations(product, [5] * 30),
+        )
+
+    def test_stock_batch_query_count(self):
+        inventory = self.env['ai.inventory.actions']
+        products = self.data['products']
+        inventory.get_stock_batch(products[:2].mapped('default_code'), warehouse='Norte')
+        self.assertEqual(
+            self.count_queries(lambda: inventory.get_stock_batch(products[:2].mapped('default_code'))),
+            self.count_queries(lambda: inventory.get_stock_batch(products[:20].mapped('default_code'))),
+        )
+
+    def test_inventory_tools_query_count(self):
+        inventory = self.env['ai.inventory.actions']
+
+        def grow():
+            for index in range(20):
+                self._create_product(f"Lámpara Nueva {index}", index)
+
+        for tool, call in (
+            ('check_low_stock', lambda: inventory.check_low_stock()),
+            ('get_inventory_summary', lambda: inventory.get_inventory_summary(by_warehouse=True, by_category=True)),
+            ('search_product_by_category', lambda: inventory.search_product_by_category(self.category.name)),
+            ('search_products_detailed', lambda: inventory.search_products_detailed("busco lámpara")),
+        ):
+            with self.subTest(tool=tool):
+                self._assert_constant_queries(call, grow)
+
+    def test_crm_tools_query_count(self):
+        crm = self.env['ai.crm.actions']
+
+        def grow():
+            self.env['crm.lead'].create([
+                {'name': f"Oportunidad extra {index}", 'type': 'opportunity',
+                 'partner_id': self.data['partners'][index % 10].id, 'stage_id': self.data['stages'][0].id}
+                for index in range(30)
+            ])
+
+        for tool, call in (
+            ('list_open_opportunities', lambda: crm.list_open_opportunities()),
+            ('get_pipeline_summary', lambda: crm.get_pipeline_summary(by_salesperson=True)),
+            ('search_leads_by_stage', lambda: crm.search_leads_by_stage(self.data['stages'][0].name)),
+        ):
+            with self.subTest(tool=tool):
+                self._assert_constant_queries(call, grow)
+
+    def test_partner_resolution_query_count(self):
+        crm = self.env['ai.crm.actions']
+        partners = self.data['partners']
+
+        def rows(count):
+            return [
+                {'name': f"Lote {index}", 'customer_name': partners[index % len(partners)].name,
+                 'email': partners[index % len(partners)].email}
+                for index in range(count)
+            ]
+
+        crm._resolve_partners(rows(1))
+        # Una sola búsqueda para todas las filas, sean 2 o 50
+        self.assertEqual(
+            self.count_queries(lambda: crm._resolve_partners(rows(2))),
+            self.count_queries(lambda: crm._resolve_partners(rows(50))),
+        )
+
+    def test_structured_result_budget(self):
+        self.env['ir.config_parameter'].sudo().set_param('modulo.ai_tool_token_budget', 40)
+        data = json.loads(self.env['ai.inventory.actions'].check_low_stock(threshold=1000, structured=True))
+        self.assertTrue(data['rows'])
+        self.assertIn('next', data)
+        following = json.loads(self.env['ai.inventory.actions'].check_low_stock(
+            threshold=1000, structured=True, cursor=data['next']))
+        self.assertNotEqual(data['rows'][0]['id'], following['rows'][0]['id'])
+
+    def test_chatter_messages_skip_livechat_queue(self):
+        partner = self.data['partners'][0]
+        queue = self.env['livechat.ai.queue']
+        jobs = queue.search_count([])
+        partner.message_post(body="Nota interna", message_type='comment')
+        self.assertEqual(queue.search_count([]), jobs)
+
+    def test_llm_fallback(self):
+        integration = self.env['livechat.ai.integration']
+        agent = self.env.ref('modulo.inventory_ai_agent')
+        params = self.env['ir.config_parameter'].sudo()
+        with llm_stub.StubLLMServer(reply="Hola desde el modelo") as stub:
+            params.set_param('modulo.ai_api_key', 'test')
+            params.set_param('modulo.ai_base_url', stub.url)
+            self.assertEqual(integration._call_ai_agent(agent, "hola, buenas tardes"), "Hola desde el modelo")
+            stub.status = 503
+            # Sin respuesta del modelo se vuelve al menú de ayuda
+            self.assertIn("Puedo ayudarte", integration._call_ai_agent(agent, "¿qué tal el día?"))
+
+    def test_llm_coalesced_error(self):
+        """Los prompts agrupados con una llamada que falla reciben el mismo error"""
+        client = llm_client.GeminiClient('http://127.0.0.1:9', 'test', 'stub')
+        started, release = threading.Event(), threading.Event()
+
+        def failing(prompt, system_prompt):
+            started.set()
+            release.wait(5)
+            raise RuntimeError("fallo inesperado")
+
+        client._generate = failing
+        errors = []
+
+        def call():
+            try:
+                client.generate("hola")
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call), threading.Thread(target=call)]
+        threads[0].start()
+        started.wait(5)
+        threads[1].start()
+        deadline = time.monotonic() + 5
+        while not client.get_stats().get('coalesced') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        client.close()
+        self.assertEqual(len(errors), 2)
+
+    def test_llm_circuit_breaker(self):
+        """Con el circuito abierto se falla sin esperar turno, y una prueba fallida no lo bloquea"""
+        client = llm_client.GeminiClient('http://127.0.0.1:9', 'test', 'stub', max_concurrency=1)
+        breaker = client.breaker
+
+        def unexpected(*args, **kwargs):
+            raise RuntimeError("fallo inesperado")
+
+        client.session.post = unexpected
+        breaker._opened_at = time.monotonic() - breaker.reset_timeout
+        with self.assertRaises(RuntimeError):
+            client.generate("hola")
+        self.assertTrue(breaker.allow())
+        breaker.end_trial()
+
+        breaker._opened_at = time.monotonic()
+        client._semaphore.acquire()
+        start = time.monotonic()
+        with self.assertRaises(llm_client.LLMUnavailable):
+            client.generate("hola")
+        self.assertLess(time.monotonic() - start, llm_client.QUEUE_TIMEOUT)
+        client._semaphore.release()
+        client.close()
+
+    def test_metrics_prometheus(self):
+        agent = self.env.ref('modulo.inventory_ai_agent')
+        self.env['livechat.ai.integration']._call_ai_agent(agent, "¿hay productos con stock bajo?")
+        body = self.env['ai.metric']._render_prometheus()
+        self.assertIn('modulo_ai_duration_seconds_count{op="intent:low_stock"}', body)
+        self.assertIn('modulo_ai_sql_queries_total{op="tool:check_low_stock"}', body)
+        self.assertIn('modulo_ai_sql_rows_total{op="tool:check_low_stock"}', body)
+
+    def test_interaction_log_flush(self):
+        agent = self.env.ref('modulo.inventory_ai_agent')
+        Log = self.env['ai.interaction.log']
+        Log._flush_buffer()
+        self.env['livechat.ai.integration']._call_ai_agent(agent, "¿hay productos con stock bajo?")
+        self.env['livechat.ai.integration']._call_ai_agent(agent, "¿qué tal el día?")
+        self.assertEqual(Log._flush_buffer(), 2)
+        logs = Log.search([], limit=2)
+        self.assertEqual(set(logs.mapped('tool')), {'check_low_stock', 'help'})
+        rollup = self.env['ai.interaction.rollup'].search([('intent', '=', 'low_stock')])
+        self.assertEqual(rollup.tool, 'check_low_stock')
+        self.assertGreaterEqual(rollup.count, 1)
+
+    def test_channel_context_follow_up(self):
+        agent = self.env.ref('modulo.inventory_ai_agent')
+        integration = self.env['livechat.ai.integration']
+        channel = self.env['discuss.channel'].create({'name': "Contexto IA"})
+        for name, qty in (("Farol Contexto Uno", 5), ("Farol Contexto Dos", 0), ("Farol Contexto Tres", 2)):
+            self._create_product(name, qty)
+        self.env.flush_all()
+        self.assertIn("Farol Contexto Dos", integration._call_ai_agent(agent, "busco farol contexto", channel=channel))
+
+        in_stock = integration._call_ai_agent(agent, "¿y cuáles de esos tienen stock?", channel=channel)
+        self.assertIn("Farol Contexto Uno", in_stock)
+        self.assertIn("Farol Contexto Tres", in_stock)
+        self.assertNotIn("Farol Contexto Dos", in_stock)
+
+        # La posición se refiere a la lista ya filtrada y no repite la búsqueda
+        second = integration._call_ai_agent(agent, "dame más detalles del segundo", channel=channel)
+        self.assertEqual(second.count("📦 **"), 1)
+        self.assertNotIn("Farol Contexto Dos", second)
+
+    def test_channel_context_new_request(self):
+        """Un ordinal o "estos" dentro de una consulta nueva no se resuelve sobre el resultado anterior"""
+        agent = self.env.ref('modulo.inventory_ai_agent')
+        integration = self.env['livechat.ai.integration']
+        channel = self.env['discuss.channel'].create({'name': "Contexto IA nuevo"})
+        self._create_product("Farol Consulta Nueva", 3)
+        self.env.flush_all()
+        integration._call_ai_agent(agent, "busco farol consulta", channel=channel)
+        context = self.env['ai.channel.context'].sudo()._recall(channel)
+        for prompt in (
+            "dame info del lead First Solutions",
+            "stock de la primera silla",
+            "crear oportunidad para estos clientes",
+        ):
+            with self.subTest(prompt=prompt):
+                follow_up = intent_router.follow_up(prompt)
+                self.assertTrue(follow_up)
+                self.assertIsNone(integration._resolve_follow_up(
+                    channel, context, follow_up, intent_router.route(prompt)))
+
+    def test_category_subtree(self):
+        Category = self.env['product.category']
+        furniture = Category.create({'name': "Muebles Índice"})
+        office = Category.create({'name': "Oficina", 'parent_id': furniture.id})
+        chair = self._create_product("Silla Índice", 4)
+        chair.categ_id = office
+        inventory = self.env['ai.inventory.actions']
+        # Sin acentos y con las subcategorías
+        data = json.loads(inventory.search_product_by_category("muebles indice", structured=True))
+        self.assertEqual([row['id'] for row in data['rows']], chair.ids)
+        self.assertEqual([(group['id'], group['products'], group['qty']) for group in data['subcategories']],
+                         [(office.id, 1, 4)])
+        data = json.loads(inventory.search_product_by_category("Muebles Índice / Oficina", structured=True))
+        self.assertEqual([group['id'] for group in data['categories']], office.ids)
+
+    def test_lead_lookup(self):
+        Lead = self.env['crm.lead']
+        light = Lead.create({'name': "Casa de la Luz", 'partner_name': "Iluminación Norte"})
+        other = Lead.create({
+            'name': "Reforma oficinas",
+            'partner_name': "Casa Sur",
+            'email_from': "Compras <compras@casasur.example>",
+        })
+        integration = self.env['livechat.ai.integration']
+        self.assertEqual(integration._extract_lead_name_from_prompt("dame info del lead Casa de la Luz"), "Casa de la Luz")
+        LeadSearch = self.env['ai.lead.search']
+        self.assertEqual(LeadSearch._find_lead_ids("Casa de la Luz")[0], light.id)
+        # Por cliente, con raíces del español, y por correo exacto
+        self.assertIn(light.id, LeadSearch._find_lead_ids("iluminaciones norte"))
+        self.assertEqual(LeadSearch._find_lead_ids("COMPRAS@casasur.example"), other.ids)
+        data = json.loads(self.env['ai.crm.actions'].get_lead_info("casa sur", structured=True))
+        self.assertEqual(data['rows'][0]['id'], other.id)
+
+    def test_leads_batch_invalid_rows(self):
+        Partner = self.env['res.partner']
+        result = self.env['ai.crm.actions'].create_leads_batch([
+            {'customer_name': "Cliente Sin Lead"},
+            {'name': "Lead Lote Válido", 'customer_name': "Cliente Con Lead"},
+        ])
+        self.assertEqual([row['status'] for row in result['results']], ['error', 'created'])
+        self.assertFalse(Partner.search([('name', '=', "Cliente Sin Lead")]))
+        self.assertEqual(Partner.browse(result['results'][1]['partner_id']).name, "Cliente Con Lead")
+
+    def test_inventory_summary_in_stock_per_product(self):
+        inventory = self.env['ai.inventory.actions']
+        before = json.loads(inventory.get_inventory_summary(by_warehouse=True, structured=True))
+        # Positivo en un almacén y negativo en otro: en stock en ese almacén, no en el total
+        product = self._create_product("Producto Saldo Negativo", 3)
+        north, south = self.data['warehouses'][:2]
+        self.env['stock.quant'].create({
+            'product_id': product.id,
+            'location_id': south.lot_stock_id.id,
+            'quantity': -5,
+        })
+        after = json.loads(inventory.get_inventory_summary(by_warehouse=True, structured=True))
+        self.assertEqual(after['in_stock'], before['in_stock'])
+        in_stock = {group['id']: group['in_stock'] for group in after['warehouses']}
+        previous = {group['id']: group['in_stock'] for group in before['warehouses']}
+        self.assertEqual(in_stock[north.id], previous.get(north.id, 0) + 1)
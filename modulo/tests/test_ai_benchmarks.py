@@ -0,0 +1,321 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from odoo.tests import tagged
+
+from .common import AIBenchmarkCase, product_name
+from ..models.ai_actions import AIInventoryActions
+from ..models.ai_crm_actions import AICrmActions
+from ..models.livechat_message_handler import MailMessage as ModuloMailMessage
+from ..tools import intent_router, llm_client, llm_stub, semantic_index
+
+# Prompt de cada intención para medir el enrutado completo de _call_ai_agent
+ROUTING_PROMPTS = {
+    'quotation': "¿hay cotizaciones de {product}?",
+    'low_stock': "¿hay productos con stock bajo?",
+    'inventory_summary': "resumen inventario por almacén",
+    'category': "productos de la categoría {category}",
+    'stage': "leads en qualified",
+    'pipeline': "resumen del pipeline por vendedor",
+    'list_opportunities': "muéstrame las oportunidades abiertas",
+    'lead_info': "dame info del lead {lead}",
+    'stock_batch': "stock de {product}, Desk Pro y Lamp Eco en el almacén Norte",
+    'product_search': "busco pelotas soccer",
+    None: "hola, buenas tardes",
+}
+
+# Prompts de búsqueda de productos y palabras que hacen relevante un resultado
+PRODUCT_QUERIES = {
+    "busco pelotas soccer": ('pelota', 'soccer'),
+    "¿tienen balon premium?": ('balon',),
+    "necesito una silla de oficina": ('silla',),
+    "monitores": ('monitor',),
+    "lampara eco": ('lamp',),
+}
+
+# Consultas semánticas y palabras que hacen relevante un resultado
+SEMANTIC_QUERIES = {
+    "balón de fútbol": ('pelota', 'balon', 'soccer'),
+    "escritorio de oficina": ('desk',),
+    "sillas": ('chair', 'silla'),
+    "lámpara": ('lamp',),
+}
+
+
+def _public_methods(model_class):
+    return {name for name, value in vars(model_class).items() if callable(value) and not name.startswith('_')}
+
+
+class AIBenchmarkMixin:
+    """Mediciones comunes a todas las escalas; las clases concretas fijan SCALE y etiquetas"""
+
+    def _read_tools(self):
+        """{(modelo, método): función(structured)} de las herramientas de lectura"""
+        inventory = self.env['ai.inventory.actions']
+        crm = self.env['ai.crm.actions']
+        product, category, lead = self.product, self.category, self.lead
+        references = [product.name, product.default_code, product.barcode, 'Desk Pro', 'Chair Basic']
+        return {
+            ('ai.inventory.actions', 'get_stock'):
+                lambda structured: inventory.get_stock(product.name, structured=structured),
+            ('ai.inventory.actions', 'get_stock_batch'):
+                lambda structured: inventory.get_stock_batch(references, warehouse='Norte', structured=structured),
+            ('ai.inventory.actions', 'search_products_detailed'):
+                lambda structured: inventory.search_products_detailed("busco pelotas soccer", structured=structured),
+            ('ai.inventory.actions', 'check_low_stock'):
+                lambda structured: inventory.check_low_stock(structured=structured),
+            ('ai.inventory.actions', 'get_inventory_summary'):
+                lambda structured: inventory.get_inventory_summary(
+                    by_warehouse=True, by_category=True, structured=structured),
+            ('ai.inventory.actions', 'search_product_by_category'):
+                lambda structured: inventory.search_product_by_category(category.name, structured=structured),
+            ('ai.crm.actions', 'get_lead_info'):
+                lambda structured: crm.get_lead_info(lead.name, structured=structured),
+            ('ai.crm.actions', 'list_open_opportunities'):
+                lambda structured: crm.list_open_opportunities(structured=structured),
+            ('ai.crm.actions', 'get_pipeline_summary'):
+                lambda structured: crm.get_pipeline_summary(by_salesperson=True, structured=structured),
+            ('ai.crm.actions', 'search_leads_by_stage'):
+                lambda structured: crm.search_leads_by_stage('Qualified', structured=structured),
+            ('ai.crm.actions', 'search_quotations_with_stock'):
+                lambda structured: crm.search_quotations_with_stock(product.name, structured=structured),
+        }
+
+    def _write_tools(self):
+        """{(modelo, método): función()}; cada llamada crea registros con nombre nuevo"""
+        crm = self.env['ai.crm.actions']
+        counter = iter(range(10 ** 9))
+
+        def batch():
+            start = next(counter) * 50
+            return crm.create_leads_batch([
+                {'name': f"Lote {start + index}", 'customer_name': f"Cliente {index:06d}",
+                 'email': f"cliente{index}@example.com", 'stage_name': 'Qualified', 'expected_revenue': 1000}
+                for index in range(50)
+            ])
+
+        return {
+            ('ai.crm.actions', 'create_opportunity'): lambda: crm.create_opportunity(
+                f"Oportunidad bench {next(counter)}", customer_name="Cliente nuevo bench",
+                email="nuevo@example.com", stage_name='Qualified', expected_revenue=5000),
+            ('ai.crm.actions', 'create_lead'): lambda: crm.create_lead(
+                f"Lead bench {next(counter)}", customer_name="Cliente 000001", email="cliente1@example.com"),
+            ('ai.crm.actions', 'create_leads_batch'): batch,
+        }
+
+    def test_read_tools(self):
+        """Texto para livechat frente a JSON estructurado: tiempo, consultas y bytes"""
+        for (model, method), function in self._read_tools().items():
+            for structured in (False, True):
+                mode = 'json' if structured else 'text'
+                self.measure(f"{model}.{method}:{mode}", lambda: function(structured), mode=mode)
+
+    def test_write_tools(self):
+        for (model, method), function in self._write_tools().items():
+            self.measure(f"{model}.{method}", function)
+
+    def test_snapshot_and_aggregates(self):
+        """Las mismas lecturas servidas desde el snapshot de inventario y los agregados del pipeline"""
+        inventory = self.env['ai.inventory.actions']
+        params = self.env['ir.config_parameter'].sudo()
+        self.measure('ai.inventory.snapshot._refresh', self.env['ai.inventory.snapshot']._refresh, runs=1)
+        params.set_param('modulo.inventory_mode', 'snapshot')
+        self.measure('ai.inventory.actions.check_low_stock:snapshot', inventory.check_low_stock)
+        self.measure('ai.inventory.actions.get_inventory_summary:snapshot', inventory.get_inventory_summary)
+
+        self.measure('ai.pipeline.aggregate._rebuild', self.env['ai.pipeline.aggregate']._rebuild, runs=1)
+        params.set_param('modulo.pipeline_aggregates', True)
+        self.measure(
+            'ai.crm.actions.get_pipeline_summary:aggregates',
+            lambda: self.env['ai.crm.actions'].get_pipeline_summary(by_salesperson=True))
+
+    def test_product_search(self):
+        """Búsqueda de productos: ilike del prompt entero (camino anterior) frente a los índices trigram"""
+        Product = self.env['product.product'].sudo()
+        ProductSearch = self.env['ai.product.search'].sudo()
+        paths = {
+            'ilike': lambda prompt: Product.search([
+                '|', '|',
+                ('name', 'ilike', prompt),
+                ('description', 'ilike', prompt),
+                ('categ_id.name', 'ilike', prompt),
+            ], limit=10),
+            'trigram': lambda prompt: ProductSearch._find_products(prompt, limit=10),
+        }
+        for label, search in paths.items():
+            hits = 0
+            for prompt, words in PRODUCT_QUERIES.items():
+                names = [semantic_index.normalize(name) for name in search(prompt).mapped('name')]
+                hits += any(word in name for name in names for word in words)
+            prompts = list(PRODUCT_QUERIES)
+            self.measure(f"product_search:{label}", lambda: [search(prompt) for prompt in prompts],
+                         queries=len(prompts), hit_rate=hits / len(prompts))
+
+    def test_lead_lookup(self):
+        """Búsqueda de leads: ilike sobre crm_lead (camino anterior) frente al índice de texto completo"""
+        Lead = self.env['crm.lead'].sudo()
+        LeadSearch = self.env['ai.lead.search']
+        lead = self.lead
+        queries = {
+            'name': lead.name,
+            'partner': lead.partner_id.name,
+            'email': lead.email_from,
+        }
+        for label, text in queries.items():
+            self.measure(f"crm.lead.search:ilike:{label}", lambda: Lead.search([('name', 'ilike', text)], limit=6))
+            self.measure(f"ai.lead.search._find_lead_ids:{label}",
+                         lambda: LeadSearch._find_lead_ids(text, limit=6))
+        self.assertIn(lead.id, LeadSearch._find_lead_ids(lead.name, limit=6))
+
+    def test_call_ai_agent_routing(self):
+        integration = self.env['livechat.ai.integration']
+        agent = self.env.ref('modulo.inventory_ai_agent')
+        for intent, template in ROUTING_PROMPTS.items():
+            prompt = template.format(product=self.product.name, category=self.category.name, lead=self.lead.name)
+            self.assertEqual(intent_router.route(prompt).intent, intent, prompt)
+            self.measure(f"_call_ai_agent:{intent or 'help'}", lambda: integration._call_ai_agent(agent, prompt))
+
+    def test_intent_router(self):
+        """Enrutado puro (sin base de datos) en microsegundos por mensaje"""
+        prompts = list(ROUTING_PROMPTS.values())
+        iterations = 2000
+        start = time.perf_counter()
+        for _iteration in range(iterations):
+            for prompt in prompts:
+                intent_router.route(prompt)
+        elapsed = time.perf_counter() - start
+        self.results.append({
+            'name': 'intent_router.route',
+            'scale': self.SCALE,
+            'runs': iterations * len(prompts),
+            'mean': elapsed / (iterations * len(prompts)),
+        })
+
+    def test_mail_message_create(self):
+        """Creación masiva de mensajes con el override del módulo y sin él, fuera del livechat y dentro
+
+        "sin módulo" llama a la implementación siguiente en la cadena de
+        herencia, la misma que se ejecuta si el módulo no está instalado.
+        """
+        author = self.data['partners'][0]
+        livechat = self.env['im_livechat.channel'].create({'name': 'Bench'})
+        channel = self.env['discuss.channel'].create({
+            'name': 'Bench visitante',
+            'channel_type': 'livechat',
+            'livechat_channel_id': livechat.id,
+            'livechat_operator_id': self.env.user.partner_id.id,
+        })
+        messages = 200
+        Message = self.env['mail.message']
+        creates = {
+            'module': Message.create,
+            'no_module': super(ModuloMailMessage, Message).create,
+        }
+        for label, model, res_id in (
+            ('res.partner', 'res.partner', author.id),
+            ('livechat', 'discuss.channel', channel.id),
+        ):
+            for variant, create in creates.items():
+                self.measure(f"mail.message.create:{label}:{variant}", lambda: create([
+                    {'model': model, 'res_id': res_id, 'body': f"Mensaje {index}", 'author_id': author.id,
+                     'message_type': 'comment'}
+                    for index in range(messages)
+                ]), messages=messages)
+
+    @unittest.skipUnless(semantic_index.is_available(), "numpy no está instalado")
+    def test_semantic_index(self):
+        """Construcción, latencia y precisión@10 de consultas con sinónimos sobre SCALE productos"""
+        def batches():
+            for start in range(0, self.SCALE, semantic_index.BUILD_BATCH_SIZE):
+                ids = list(range(start + 1, min(start + semantic_index.BUILD_BATCH_SIZE, self.SCALE) + 1))
+                yield ids, [(product_name(product_id - 1), 'Deportes' if product_id % 2 else 'Muebles', '')
+                            for product_id in ids]
+
+        with tempfile.TemporaryDirectory() as path:
+            index = semantic_index.SemanticIndex(os.path.join(path, 'index'))
+            start = time.perf_counter()
+            index.build(batches())
+            self.results.append({'name': 'semantic_index.build', 'scale': self.SCALE, 'mean': time.perf_counter() - start})
+
+            queries = list(SEMANTIC_QUERIES)
+            relevant = hits = 0
+            for query, words in SEMANTIC_QUERIES.items():
+                [results] = index.search([query], limit=10)
+                relevant_results = [
+                    product_id for product_id, _score in results
+                    if any(word in semantic_index.normalize(product_name(product_id - 1)) for word in words)
+                ]
+                relevant += len(relevant_results)
+                hits += bool(relevant_results)
+            self.measure('semantic_index.search', lambda: index.search([queries[0]], limit=10),
+                         precision_at_10=relevant / (10 * len(queries)), hit_rate=hits / len(queries))
+            self.measure('semantic_index.search:batch', lambda: index.search(queries, limit=10),
+                         queries=len(queries))
+
+    def test_llm_client_load(self):
+        """Cliente LLM contra el servidor local: 8 hilos para 4 llamadas simultáneas"""
+        threads_count, prompts_per_thread = 8, 25
+        with llm_stub.StubLLMServer(latency=0.02) as stub:
+            client = llm_client.GeminiClient(stub.url, 'bench', 'stub', timeout=5, max_concurrency=4)
+            errors = []
+
+            def worker(thread_index):
+                for prompt_index in range(prompts_per_thread):
+                    try:
+                        client.generate(f"pregunta {thread_index}-{prompt_index}")
+                    except llm_client.LLMUnavailable as e:
+                        errors.append(e)
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=worker, args=(index,)) for index in range(threads_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            client.close()
+
+        stats = client.get_stats()
+        self.assertFalse(errors)
+        self.assertEqual(stub.requests, threads_count * prompts_per_thread)
+        self.results.append({
+            'name': 'llm_client.generate',
+            'scale': self.SCALE,
+            'runs': stats['calls'],
+            'mean': elapsed / stats['calls'],
+            'p50': stats['p50'],
+            'p99': stats['p99'],
+            'throughput': stats['calls'] / elapsed,
+        })
+
+
+@tagged('post_install', '-at_install')
+class TestAIBenchmarkCoverage(AIBenchmarkCase):
+    """Comprobaciones de la suite que corren en cada ejecución, sin medir ni escribir resultados"""
+    SCALE = 50
+
+    def test_every_public_method_is_benchmarked(self):
+        benchmarked = set(AIBenchmarkMixin._read_tools(self)) | set(AIBenchmarkMixin._write_tools(self))
+        expected = {('ai.inventory.actions', name) for name in _public_methods(AIInventoryActions)}
+        expected |= {('ai.crm.actions', name) for name in _public_methods(AICrmActions)}
+        self.assertEqual(expected - benchmarked, set(), "Métodos públicos sin benchmark")
+
+
+@tagged('post_install', '-at_install', '-standard', 'modulo_bench', 'modulo_bench_1k')
+class TestAIBenchmark1k(AIBenchmarkMixin, AIBenchmarkCase):
+    SCALE = 1000
+
+
+@tagged('post_install', '-at_install', '-standard', 'modulo_bench_100k')
+class TestAIBenchmark100k(AIBenchmarkMixin, AIBenchmarkCase):
+    SCALE = 100000
+    RUNS = 3
+
+
+@tagged('post_install', '-at_install', '-standard', 'modulo_bench_1m')
+class TestAIBenchmark1m(AIBenchmarkMixin, AIBenchmarkCase):
+    SCALE = 1000000
+    RUNS = 3
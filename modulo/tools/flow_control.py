@@ -0,0 +1,95 @@
+"""Control de admisión para las respuestas IA del livechat.
+
+* ``TokenBucket``: cubo de fichas que se rellena a ``rate`` fichas por minuto
+  hasta ``rate`` (ráfaga de un minuto); cada respuesta consume una ficha.
+* ``FlowController``: cubos por visitante y por canal de livechat y contadores.
+
+El estado vive en memoria del proceso que ejecuta el despachador de la cola
+(un solo cron a la vez). Si el cron pasa a otro worker los cubos empiezan
+llenos, lo que solo puede errar a favor de responder.
+"""
+import collections
+import threading
+import time
+
+# Cubos conservados por tipo; los más antiguos se descartan (están llenos de nuevo)
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, rate_per_minute, now):
+        """Rellena según el tiempo transcurrido y consume una ficha si la hay"""
+        capacity = rate_per_minute
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate_per_minute / 60.0)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def give_back(self):
+        self.tokens += 1
+
+
+class FlowController:
+    """Cubos por visitante y canal y contadores de una base de datos"""
+
+    def __init__(self):
+        self._buckets = {'visitor': collections.OrderedDict(), 'channel': collections.OrderedDict()}
+        self._lock = threading.Lock()
+        self.counters = collections.Counter()
+
+    def _bucket(self, kind, key, rate):
+        buckets = self._buckets[kind]
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_BUCKETS:
+                buckets.popitem(last=False)
+            bucket = buckets[key] = TokenBucket(rate)
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+    def admit(self, visitor_id, channel_id, visitor_rate, channel_rate):
+        """Consume una ficha del visitante y otra del canal; si falta alguna no consume ninguna
+
+        Una tasa de 0 desactiva ese límite.
+        """
+        now = time.monotonic()
+        with self._lock:
+            visitor = self._bucket('visitor', visitor_id, visitor_rate) if visitor_rate and visitor_id else None
+            if visitor and not visitor.take(visitor_rate, now):
+                return False
+            channel = self._bucket('channel', channel_id, channel_rate) if channel_rate and channel_id else None
+            if channel and not channel.take(channel_rate, now):
+                if visitor:
+                    visitor.give_back()
+                return False
+            return True
+
+    def count(self, counter, amount=1):
+        if amount:
+            with self._lock:
+                self.counters[counter] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(dbname):
+    with _controllers_lock:
+        controller = _controllers.get(dbname)
+        if controller is None:
+            controller = _controllers[dbname] = FlowController()
+        return controller
@@ -0,0 +1,357 @@
+"""Enrutador de intenciones para mensajes de livechat.
+
+El prompt se parte en palabras con una única expresión regular compilada y
+cada palabra se clasifica contra una tabla de raíces (las palabras ya vistas
+se resuelven con una sola búsqueda en diccionario). Las frases de dos o tres
+palabras ("stock bajo", "leads en qualified") se reconocen en la misma
+pasada, junto con las entidades (email, categoría, etapa). La intención
+ganadora se elige después recorriendo ``INTENTS`` en orden de prioridad, sin
+volver a escanear el texto.
+
+``follow_up`` reconoce las preguntas que se refieren al resultado anterior
+del canal ("ver más", "el segundo", "¿cuáles de esos tienen stock?").
+"""
+import re
+from dataclasses import dataclass, field
+
+# Raíces de palabra: una palabra activa el token si empieza por la raíz
+# ("oportunidades" -> opportunity, "listar" -> list_verb)
+STEMS = {
+    'cotizaci': 'quote', 'presupuesto': 'quote', 'quote': 'quote',
+    'categor': 'category',
+    'pipeline': 'pipeline',
+    'crear': 'create_verb', 'nueva': 'create_verb', 'create': 'create_verb', 'new': 'create_verb',
+    'oportunidad': 'opportunity', 'opportunity': 'opportunity',
+    'lead': 'lead',
+    'info': 'detail_verb', 'detalles': 'detail_verb', 'details': 'detail_verb', 'dame': 'detail_verb',
+    'list': 'list_verb', 'mostrar': 'list_verb', 'show': 'list_verb', 'todas': 'list_verb',
+    'abiertas': 'list_verb', 'abierto': 'list_verb',
+    'busco': 'product', 'search': 'product', 'productos': 'product', 'products': 'product',
+    'stock': 'stock', 'existencia': 'stock', 'inventario': 'product',
+    'almac': 'warehouse', 'warehouse': 'warehouse',
+    'vendedor': 'salesperson', 'salesperson': 'salesperson', 'comercial': 'salesperson',
+}
+STEM_LENGTHS = sorted({len(stem) for stem in STEMS})
+
+# Frases de dos palabras consecutivas (en minúsculas)
+PHRASES = {
+    ('stock', 'bajo'): 'low_stock',
+    ('poco', 'stock'): 'low_stock',
+    ('bajo', 'inventario'): 'low_stock',
+    ('inventory', 'low'): 'low_stock',
+    ('resumen', 'inventario'): 'inventory_summary',
+    ('inventario', 'completo'): 'inventory_summary',
+    ('estado', 'inventario'): 'inventory_summary',
+    ('inventory', 'summary'): 'inventory_summary',
+    ('by', 'category'): 'category',
+    ('resumen', 'ventas'): 'pipeline',
+    ('sales', 'summary'): 'pipeline',
+    ('tell', 'me'): 'detail_verb',
+}
+STAGES = {'qualified': 'Qualified', 'proposition': 'Proposition', 'won': 'Won', 'new': 'New'}
+CATEGORY_WORDS = {'categoría', 'categoria'}
+PAGE_WORDS = {'página', 'pagina', 'page'}
+WAREHOUSE_WORDS = {'almacén', 'almacen', 'warehouse', 'bodega'}
+
+# Tabla de intenciones en orden de prioridad. Cada intención exige que
+# aparezca al menos un token de cada uno de sus grupos.
+INTENTS = [
+    ('quotation', [{'quote'}]),
+    ('low_stock', [{'low_stock'}]),
+    ('inventory_summary', [{'inventory_summary'}]),
+    ('category', [{'category'}]),
+    ('create_opportunity', [{'create_verb'}, {'opportunity'}]),
+    ('stage', [{'stage'}]),
+    ('pipeline', [{'pipeline'}]),
+    ('list_opportunities', [{'opportunity', 'lead'}, {'list_verb'}]),
+    ('lead_info', [{'detail_verb'}, {'opportunity', 'lead'}]),
+    ('product_search', [{'product', 'stock'}]),
+]
+# Intenciones derivadas de otra tras extraer entidades (no se buscan por tokens)
+# - stock_batch: product_search con "stock" y varios productos o un almacén
+
+WORD_RE = re.compile(r'[\w.%+-]+@[\w-]+(?:\.[\w-]+)*\.[a-zA-Z]{2,}|\w+')
+PRODUCT_STOPWORDS_RE = re.compile(
+    r'\b(existe|hay|alguna|algún|muéstrame|dame|verifica|para|con|en|el|la|los|las|de|del'
+    r'|cotización|cotizacion|cotizaciones|presupuesto|presupuestos|quote|quotes)\b',
+    re.IGNORECASE,
+)
+PUNCTUATION_RE = re.compile(r'[¿?¡!,;]')
+SEARCH_WORD_RE = re.compile(r'\w+')
+
+# Palabras que no aportan a una búsqueda de productos
+SEARCH_STOPWORDS = frozenset("""
+    a al algo algun alguna algunas alguno algunos algún con cual cuales cuanto cuantos cuánto cuántos de del
+    dame el en es esta este estos existe hay la las lo los me mi muéstrame muestrame para por que qué
+    quiero se su sus tiene tienen tienes un una unas unos y o busco buscar buscando necesito producto
+    productos stock inventario disponible disponibles precio precios
+    the an and any are for have is of on or show me search find products product stock inventory
+    do does what which with available price prices
+""".split())
+SPACES_RE = re.compile(r'\s+')
+
+# "productos de la categoría Muebles / Oficina" -> "Muebles / Oficina"
+CATEGORY_RE = re.compile(
+    r'\bcategor(?:[íi]as?|y|ies)\s+(?:(?:de|del|of|la|las|el|los|the)\s+)*([^¿?¡!,;.:]+)', re.IGNORECASE)
+CATEGORY_MAX_WORDS = 6
+
+# "stock de A, B y C en el almacén Norte" -> ["A", "B", "C"]
+MAX_PRODUCTS = 20
+STOCK_LIST_RE = re.compile(
+    r'\b(?:stock|existencias?|disponibilidad|inventario|inventory)\s+(?:de(?:l)?\s+|of\s+|for\s+)?(.+)',
+    re.IGNORECASE,
+)
+WAREHOUSE_CLAUSE_RE = re.compile(
+    r'\s*\b(?:en|in)\s+(?:el\s+|la\s+|the\s+)?(?:almac[eé]n|warehouse|bodega)\b.*$', re.IGNORECASE)
+LIST_SEPARATOR_RE = re.compile(r'\s*(?:[,;/]|\by\b|\be\b|\band\b)\s*', re.IGNORECASE)
+LIST_TRIM_RE = re.compile(r'^[\s¿?¡!.:]+|[\s¿?¡!.:]+$')
+# Palabras que pueden quedar delante de una referencia ("hay de Desk", "the Chair")
+LEADING_WORDS_RE = re.compile(
+    r'^(?:(?:qué|que|hay|tienes|tienen|de|del|el|la|los|las|of|the|for)\s+)+', re.IGNORECASE)
+# Palabras de la petición delante del nombre de un lead ("dame info del lead Casa de la Luz");
+# el nombre empieza en la primera palabra que no es de la petición y se conserva entero
+LEAD_LEADING_WORDS_RE = re.compile(
+    r'^(?:(?:dame|me|das|puedes|podr[ií]as|dar|mostrar|muestra|mu[eé]strame|quiero|ver|necesito|busca|buscar|'
+    r'informaci[oó]n|info|detalles?|details|datos|tell|show|give|the|leads?|oportunidad(?:es)?|'
+    r'opportunit(?:y|ies)|de|del|la|el|los|las|sobre|about|of|on|for|llamad[ao]|named|called)\s+)+',
+    re.IGNORECASE,
+)
+
+# Preguntas de seguimiento sobre el resultado anterior
+ANAPHORA_WORDS = frozenset({'esos', 'esas', 'estos', 'estas', 'ellos', 'ellas', 'those', 'these', 'them'})
+MORE_WORDS = frozenset({'más', 'mas', 'siguiente', 'siguientes', 'more', 'next'})
+# Lo único que puede acompañar a "más" para pedir la página siguiente ("ver más", "¿hay más?",
+# "muéstrame los siguientes"); cualquier otra palabra ("quiero saber más", "algo más barato")
+# hace que el mensaje se enrute como una pregunta nueva
+MORE_COMMAND_WORDS = frozenset({
+    'ver', 'muestra', 'muéstrame', 'muestrame', 'mostrar', 'dame', 'hay', 'y', 'los', 'las', 'el', 'la', 'de',
+    'resultados', 'otros', 'otras', 'página', 'pagina', 'por', 'favor', 'show', 'me', 'give', 'the', 'page',
+    'results', 'please',
+})
+# Lo que puede rodear a un ordinal o a "esos" en una pregunta de seguimiento ("dame más detalles
+# del segundo", "¿cuáles de esos productos tienen stock?"); con cualquier otra palabra ("stock de la
+# primera silla", "lead First Solutions") el mensaje es una consulta nueva
+FOLLOW_UP_FILLER_WORDS = MORE_COMMAND_WORDS | frozenset({
+    'e', 'o', 'del', 'al', 'a', 'en', 'con', 'sin', 'no', 'que', 'qué', 'cual', 'cuál', 'cuales', 'cuáles',
+    'tiene', 'tienen', 'son', 'está', 'esta', 'están', 'estan', 'lo', 'uno', 'una', 'solo', 'sólo', 'todos',
+    'todas', 'quiero', 'sobre', 'stock', 'producto', 'productos', 'lead', 'leads', 'oportunidad',
+    'oportunidades', 'resultado', 'which', 'what', 'of', 'in', 'with', 'one', 'ones', 'about', 'have', 'has',
+    'are', 'is', 'product', 'products', 'opportunity', 'opportunities',
+})
+# Tokens del enrutador que una pregunta de seguimiento activa por sí misma
+# ("¿cuáles de esos productos tienen stock?", "info del segundo lead")
+FOLLOW_UP_TOKENS = frozenset({'stock', 'product', 'detail_verb', 'opportunity', 'lead'})
+DETAIL_WORDS = frozenset({'detalle', 'detalles', 'info', 'información', 'informacion', 'details'})
+ORDINALS = {
+    'primero': 1, 'primer': 1, 'primera': 1, 'segundo': 2, 'segunda': 2, 'tercero': 3, 'tercer': 3,
+    'tercera': 3, 'cuarto': 4, 'cuarta': 4, 'quinto': 5, 'quinta': 5, 'último': -1, 'ultimo': -1,
+    'última': -1, 'ultima': -1, 'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5, 'last': -1,
+}
+# "el 3", "número 3": posición explícita
+POSITION_WORDS = frozenset({'el', 'la', 'número', 'numero', 'nº', 'number'})
+IN_STOCK_WORDS = frozenset({'disponible', 'disponibles', 'available'})
+OUT_OF_STOCK_WORDS = frozenset({'agotado', 'agotados', 'agotada', 'agotadas'})
+
+# Clasificación memorizada por palabra: el vocabulario de un chat es pequeño
+WORD_CACHE_SIZE = 50000
+_word_cache = {}
+
+
+@dataclass
+class Route:
+    """Resultado del enrutado: intención detectada y entidades extraídas"""
+    intent: str | None
+    entities: dict = field(default_factory=dict)
+    tokens: frozenset = frozenset()
+
+
+@dataclass
+class FollowUp:
+    """Referencia al resultado anterior: una posición, un filtro sobre todo el resultado o la página siguiente"""
+    position: int | None = None
+    anaphora: bool = False
+    more: bool = False
+    in_stock: bool | None = None
+    stage: str | None = None
+    # Palabras ajenas al seguimiento (un nombre, otro producto): puede ser una consulta nueva
+    extra_words: bool = False
+
+    @property
+    def kind(self):
+        if self.position:
+            return 'select'
+        if self.anaphora:
+            return 'filter'
+        return 'more'
+
+
+def _classify(word):
+    """Devuelve (palabra en minúsculas, tokens que activa)"""
+    cached = _word_cache.get(word)
+    if cached is None:
+        lower = word.lower()
+        tokens = tuple({STEMS[lower[:n]] for n in STEM_LENGTHS if lower[:n] in STEMS})
+        if len(_word_cache) >= WORD_CACHE_SIZE:
+            _word_cache.clear()
+        cached = _word_cache[word] = (lower, tokens)
+    return cached
+
+
+def extract_product(prompt):
+    """Extrae el nombre de producto eliminando palabras vacías completas"""
+    cleaned = PUNCTUATION_RE.sub('', prompt.lower())
+    cleaned = PRODUCT_STOPWORDS_RE.sub('', cleaned)
+    cleaned = SPACES_RE.sub(' ', cleaned).strip()
+    words = [w for w in cleaned.split() if len(w) > 1]
+    return ' '.join(words[:5]) if words else 'producto'
+
+
+def extract_products(prompt):
+    """Referencias de producto de una lista en el prompt ("stock de A, B y C en el almacén Norte")"""
+    match = STOCK_LIST_RE.search(prompt)
+    text = WAREHOUSE_CLAUSE_RE.sub('', match.group(1) if match else prompt)
+    products = []
+    for part in LIST_SEPARATOR_RE.split(text):
+        part = LEADING_WORDS_RE.sub('', LIST_TRIM_RE.sub('', part))
+        if part and part not in products:
+            products.append(part)
+    return products[:MAX_PRODUCTS]
+
+
+def extract_category(prompt):
+    """Nombre o ruta de categoría que sigue a "categoría" en el prompt, o None"""
+    match = CATEGORY_RE.search(prompt)
+    if not match:
+        return None
+    words = match.group(1).split()[:CATEGORY_MAX_WORDS]
+    # "¿qué categorías hay?" no nombra ninguna categoría
+    if all(word.lower() in SEARCH_STOPWORDS for word in words):
+        return None
+    return ' '.join(words)
+
+
+def extract_lead_name(prompt):
+    """Nombre, correo o teléfono del lead que sigue a la petición, o '' si no hay"""
+    text = LIST_TRIM_RE.sub('', prompt)
+    return LIST_TRIM_RE.sub('', LEAD_LEADING_WORDS_RE.sub('', text + ' ')).strip()
+
+
+def extract_search_terms(prompt, max_terms=5):
+    """Palabras significativas de un prompt para buscar productos"""
+    terms = []
+    for word in SEARCH_WORD_RE.findall(prompt.lower()):
+        if len(word) > 2 and word not in SEARCH_STOPWORDS and not word.isdigit() and word not in terms:
+            terms.append(word)
+    return terms[:max_terms]
+
+
+def scan(prompt):
+    """Recorre el prompt una sola vez y devuelve las posiciones de cada token y las entidades"""
+    positions = {}
+    entities = {}
+    words = WORD_RE.findall(prompt)
+    previous = previous2 = None
+    for index, word in enumerate(words):
+        if '@' in word:
+            positions.setdefault('email', []).append(index)
+            entities.setdefault('email', word)
+            previous2, previous = previous, None
+            continue
+        lower, tokens = _word_cache.get(word) or _classify(word)
+        for token in tokens:
+            if token in positions:
+                positions[token].append(index)
+            else:
+                positions[token] = [index]
+        if previous is not None:
+            phrase = PHRASES.get((previous, lower))
+            if phrase:
+                positions.setdefault(phrase, []).append(index - 1)
+            if previous in CATEGORY_WORDS:
+                entities.setdefault('category', word)
+            if previous in PAGE_WORDS and word.isdigit():
+                entities.setdefault('page', int(word))
+            if previous in WAREHOUSE_WORDS:
+                entities.setdefault('warehouse', word)
+            if lower in STAGES and (previous == 'etapa' or (previous == 'en' and previous2 in ('lead', 'leads'))):
+                positions.setdefault('stage', []).append(index)
+                entities.setdefault('stage', STAGES[lower])
+        previous2, previous = previous, lower
+    return positions, entities
+
+
+def route(prompt):
+    """Devuelve la intención de mayor prioridad presente en el prompt"""
+    positions, entities = scan(prompt)
+    if not positions:
+        return Route(None, entities)
+    present = positions.keys()
+    for intent, groups in INTENTS:
+        if present.isdisjoint(groups[0]) or (len(groups) > 1 and present.isdisjoint(groups[1])):
+            continue
+        if intent == 'create_opportunity':
+            # El verbo debe aparecer antes que el sustantivo ("crear ... oportunidad")
+            if positions['create_verb'][0] > positions['opportunity'][-1]:
+                continue
+        if intent == 'quotation':
+            entities['product'] = extract_product(prompt)
+        if intent == 'category':
+            # La palabra siguiente a "categoría" no basta para "categoría de Muebles / Oficina"
+            category = extract_category(prompt)
+            if category:
+                entities['category'] = category
+            else:
+                entities.pop('category', None)
+        if intent == 'product_search' and 'stock' in present:
+            # Varios productos o un almacén concreto: consulta de stock en bloque
+            products = extract_products(prompt)
+            if len(products) > 1 or 'warehouse' in entities:
+                intent = 'stock_batch'
+                entities['products'] = products
+        return Route(intent, entities, frozenset(present))
+    return Route(None, entities)
+
+
+def follow_up(prompt):
+    """``FollowUp`` si el prompt se refiere al resultado anterior, o None"""
+    result = FollowUp()
+    previous = None
+    detail = False
+    other_words = False
+    for word in WORD_RE.findall(prompt):
+        lower = word.lower()
+        if lower in ANAPHORA_WORDS:
+            result.anaphora = True
+        elif lower in ORDINALS:
+            result.position = result.position or ORDINALS[lower]
+        elif lower in MORE_WORDS:
+            result.more = True
+        elif lower in DETAIL_WORDS:
+            detail = True
+        elif lower in IN_STOCK_WORDS:
+            result.in_stock = True
+        elif lower in OUT_OF_STOCK_WORDS:
+            result.in_stock = False
+        elif lower == 'stock' and previous in ('con', 'tienen', 'tiene', 'hay', 'in'):
+            result.in_stock = True
+        elif lower == 'stock' and previous in ('sin', 'no', 'out'):
+            result.in_stock = False
+        elif lower in STAGES:
+            result.stage = STAGES[lower]
+        elif word.isdigit() and previous in POSITION_WORDS:
+            result.position = result.position or int(word)
+        else:
+            if lower not in MORE_COMMAND_WORDS:
+                other_words = True
+            if lower not in FOLLOW_UP_FILLER_WORDS:
+                result.extra_words = True
+        previous = lower
+    if result.more and other_words:
+        result.more = False
+    # "más detalles" pide el detalle de lo ya mostrado, no la página siguiente
+    if detail and result.more and not result.position:
+        result.more = False
+        result.anaphora = True
+    if result.position or result.anaphora or result.more:
+        return result
+    return None
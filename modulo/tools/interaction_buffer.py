@@ -0,0 +1,117 @@
+"""Buffer en memoria del registro de interacciones IA.
+
+El camino caliente solo anexa un dict al buffer circular del proceso; un
+solo hilo a la vez lo vacía en bloque (ver ``ai.interaction.log``). Si el
+buffer se llena antes del volcado se descartan los registros más antiguos y
+se cuentan, para que las pérdidas bajo carga queden reportadas.
+
+Además del volcado desde las propias peticiones, un hilo por buffer vuelca
+cada FLUSH_INTERVAL segundos lo pendiente aunque el worker no reciba más
+tráfico, y al salir el proceso se vuelca lo que quede.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 10000
+# Volcar al alcanzar este número de registros o tras este intervalo (s)
+FLUSH_SIZE = 200
+FLUSH_INTERVAL = 5
+
+
+class InteractionBuffer:
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.size = size
+        self._items = collections.deque()
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.dropped = 0
+        self.flushed = 0
+        self._unreported_drops = 0
+        self._flusher_pid = None
+
+    def append(self, item):
+        with self._lock:
+            if len(self._items) >= self.size:
+                self._items.popleft()
+                self.dropped += 1
+                self._unreported_drops += 1
+            self._items.append(item)
+            return len(self._items)
+
+    def flush_due(self, pending):
+        return pending >= FLUSH_SIZE or time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+
+    def drain(self):
+        """(registros, descartados desde el último volcado) y vacía el buffer"""
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+            dropped, self._unreported_drops = self._unreported_drops, 0
+            self._last_flush = time.monotonic()
+        return items, dropped
+
+    def lost(self, count):
+        """Registros que no se pudieron escribir: se cuentan como descartados en el próximo volcado"""
+        with self._lock:
+            self.dropped += count
+            self._unreported_drops += count
+
+    def has_pending(self):
+        return bool(self._items or self._unreported_drops)
+
+    def start_flusher(self, flush):
+        """Arranca (una vez por proceso) el hilo que llama a ``flush()`` si hay pendientes"""
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        with self._lock:
+            # Tras un fork el hilo del proceso padre no existe en el hijo
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+        threading.Thread(target=self._run_flusher, args=(flush,), name='modulo-interaction-flush', daemon=True).start()
+
+    def _run_flusher(self, flush):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if self.has_pending() and time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                try:
+                    flush()
+                except Exception:
+                    _logger.warning("Fallo en el volcado periódico de interacciones IA", exc_info=True)
+
+    def flushing(self):
+        """Bloqueo no bloqueante: un solo volcado a la vez por proceso"""
+        return self._flushing.acquire(blocking=False)
+
+    def done_flushing(self, written):
+        self.flushed += written
+        self._flushing.release()
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._items), 'dropped': self.dropped, 'flushed': self.flushed, 'size': self.size}
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_buffer(dbname):
+    with _buffers_lock:
+        buffer = _buffers.get(dbname)
+        if buffer is None:
+            buffer = _buffers[dbname] = InteractionBuffer()
+        return buffer
+
+
+def buffers():
+    with _buffers_lock:
+        return dict(_buffers)
@@ -0,0 +1,245 @@
+"""Cliente Gemini compartido por proceso para el fallback LLM del livechat.
+
+Cada worker mantiene un único ``requests.Session`` por configuración, de modo
+que las llamadas reutilizan las conexiones HTTP keep-alive en lugar de abrir
+una nueva por mensaje. Las llamadas al modelo están acotadas por:
+
+* un timeout por petición (conexión y lectura),
+* un semáforo global que limita las llamadas simultáneas del proceso,
+* la agrupación de prompts idénticos en vuelo (solo uno llega al modelo),
+* un circuit breaker que deja de llamar tras fallos consecutivos.
+
+Así un modelo lento o caído no puede dejar a todos los workers de Odoo
+esperando. La URL base es configurable para apuntar a un servidor local que
+devuelva respuestas fijas con la latencia deseada.
+"""
+import collections
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = 'https://generativelanguage.googleapis.com'
+DEFAULT_MODEL = 'gemini-1.5-flash'
+DEFAULT_TIMEOUT = 20.0
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Tiempo máximo esperando un hueco del semáforo antes de rendirse
+QUEUE_TIMEOUT = 2.0
+# Fallos consecutivos que abren el circuito y segundos que permanece abierto
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+# Latencias recientes conservadas para los percentiles
+STATS_WINDOW = 1000
+MAX_OUTPUT_TOKENS = 1024
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class LLMUnavailable(Exception):
+    """El modelo no dio respuesta: circuito abierto, saturación, timeout o error HTTP"""
+
+
+class CircuitBreaker:
+    """Circuito cerrado -> abierto tras N fallos -> semiabierto con una sola llamada de prueba"""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        # Hilo que hace la llamada de prueba con el circuito semiabierto
+        self._trial = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return 'open'
+            return 'half_open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial:
+                return False
+            self._trial = threading.get_ident()
+            return True
+
+    def end_trial(self):
+        """Libera la llamada de prueba del hilo actual si terminó sin registrar resultado"""
+        with self._lock:
+            if self._trial == threading.get_ident():
+                self._trial = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial = None
+
+
+class LatencyStats:
+    """Latencias de las últimas llamadas y contadores del cliente"""
+
+    def __init__(self, window=STATS_WINDOW):
+        self._samples = collections.deque(maxlen=window)
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds))
+            self._counters['calls'] += 1
+
+    def count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = list(self._samples)
+            result = dict(self._counters)
+        latencies = sorted(seconds for _at, seconds in samples)
+        result['p50'] = _percentile(latencies, 50)
+        result['p99'] = _percentile(latencies, 99)
+        elapsed = samples[-1][0] - samples[0][0] + samples[0][1] if samples else 0.0
+        result['throughput'] = len(samples) / elapsed if elapsed > 0 else 0.0
+        return result
+
+
+def _percentile(values, percent):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not values:
+        return 0.0
+    index = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class _Call:
+    """Resultado compartido de una llamada en vuelo"""
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GeminiClient:
+    """Cliente REST de generateContent con pool de conexiones y límites de concurrencia"""
+
+    def __init__(self, base_url, api_key, model, timeout=DEFAULT_TIMEOUT, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model}:generateContent"
+        self.timeout = (min(3.05, timeout), timeout)
+        self.max_concurrency = max_concurrency
+        self.session = requests.Session()
+        self.session.headers.update({'x-goog-api-key': api_key, 'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breaker = CircuitBreaker()
+        self.stats = LatencyStats()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def generate(self, prompt, system_prompt=None):
+        """Texto generado para el prompt; los prompts idénticos en vuelo comparten la llamada"""
+        key = (system_prompt, prompt)
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+
+        if not leader:
+            self.stats.count('coalesced')
+            if not call.event.wait(QUEUE_TIMEOUT + self.timeout[0] + self.timeout[1]):
+                raise LLMUnavailable("Tiempo agotado esperando una llamada idéntica en curso")
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._generate(prompt, system_prompt)
+        except BaseException as e:
+            # Los que esperan reciben el mismo error, no un resultado vacío
+            call.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+        return call.result
+
+    def _generate(self, prompt, system_prompt):
+        # Con el circuito abierto se falla enseguida, sin esperar turno en la cola
+        if not self.breaker.allow():
+            self.stats.count('short_circuited')
+            raise LLMUnavailable("Circuito abierto tras fallos consecutivos del modelo")
+        try:
+            if not self._semaphore.acquire(timeout=QUEUE_TIMEOUT):
+                self.stats.count('rejected')
+                raise LLMUnavailable("Demasiadas llamadas simultáneas al modelo")
+            try:
+                payload = {
+                    'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+                    'generationConfig': {'maxOutputTokens': MAX_OUTPUT_TOKENS},
+                }
+                if system_prompt:
+                    payload['systemInstruction'] = {'parts': [{'text': system_prompt}]}
+                start = time.monotonic()
+                try:
+                    response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    text = _extract_text(response.json())
+                except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+                    self.breaker.record_failure()
+                    self.stats.count('errors')
+                    raise LLMUnavailable(str(e)) from e
+                self.breaker.record_success()
+                self.stats.record(time.monotonic() - start)
+                return text
+            finally:
+                self._semaphore.release()
+        finally:
+            # Una prueba sin resultado (cola llena, error inesperado) no deja el circuito bloqueado
+            self.breaker.end_trial()
+
+    def get_stats(self):
+        stats = self.stats.snapshot()
+        stats['circuit'] = self.breaker.state
+        stats['max_concurrency'] = self.max_concurrency
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+def _extract_text(data):
+    parts = data['candidates'][0]['content']['parts']
+    return ''.join(part.get('text', '') for part in parts).strip()
+
+
+def get_client(base_url, api_key, model, timeout=DEFAULT_TIMEOUT, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Cliente del proceso para esta configuración (uno por base de datos en la práctica)"""
+    key = (base_url, api_key, model, timeout, max_concurrency)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = GeminiClient(base_url, api_key, model, timeout, max_concurrency)
+        return client
@@ -0,0 +1,75 @@
+"""Servidor local que imita generateContent de Gemini para pruebas de carga.
+
+Devuelve siempre la misma respuesta tras la latencia configurada, sin red ni
+API key. Se usa en los benchmarks del cliente LLM y en la herramienta de
+reproducción de conversaciones::
+
+    with StubLLMServer(latency=0.2) as stub:
+        client = llm_client.GeminiClient(stub.url, 'test', 'stub')
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Respuesta de prueba del modelo."
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        with stub.lock:
+            stub.requests += 1
+        if stub.latency:
+            time.sleep(stub.latency)
+        if stub.status != 200:
+            body = json.dumps({'error': {'code': stub.status, 'message': 'stub error'}}).encode()
+        else:
+            body = json.dumps({'candidates': [{'content': {'parts': [{'text': stub.reply}]}}]}).encode()
+        self.send_response(stub.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubLLMServer:
+    """Servidor en un hilo propio; ``latency`` y ``status`` pueden cambiarse en caliente"""
+
+    def __init__(self, latency=0.0, reply=DEFAULT_REPLY, status=200, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.reply = reply
+        self.status = status
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='llm-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,234 @@
+"""Instrumentación de las rutas calientes de la IA.
+
+``timed(env, name)`` mide tiempo de pared, consultas SQL y filas de un bloque
+(``cr.rowcount`` de su última consulta: las filas que devuelve o modifica la
+consulta principal de la herramienta) y lo suma a un dict del proceso
+protegido por un bloqueo (la sección crítica son unas pocas sumas; en modo
+multihilo cada petición usa un hilo nuevo, así que un acumulador por hilo
+crecería sin límite). Cada ``FLUSH_INTERVAL`` segundos un worker vuelca a la tabla
+``ai_metric`` lo acumulado desde su último volcado, y ``/modulo/metrics``
+expone la suma de todos los workers en formato Prometheus.
+
+Perfilado opcional: con una tasa de muestreo mayor que 0, esa fracción de
+las operaciones de primer nivel (no anidadas) se ejecuta bajo cProfile y se
+conservan en disco los volcados de las N más lentas del proceso.
+"""
+import bisect
+import contextlib
+import cProfile
+import functools
+import heapq
+import os
+import random
+import re
+import threading
+import time
+
+# Límites superiores (s) de los cubos del histograma de tiempo
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 30
+
+# Posiciones de cada entrada: conteo, tiempo, consultas, filas y cubos (+Inf al final)
+COUNT, WALL, SQL, ROWS, HISTOGRAM = range(5)
+
+# Profundidad de anidamiento de timed() en el hilo actual
+_local = threading.local()
+# {(base de datos, operación): entrada} del proceso
+_totals = {}
+_totals_lock = threading.Lock()
+
+_flushed = {}
+_last_flush = {}
+_flush_lock = threading.Lock()
+
+_profile_settings = {}
+_profile_lock = threading.Lock()
+_slowest = {}
+
+PROFILE_NAME_RE = re.compile(r'[^\w.-]+')
+
+
+def record(dbname, name, seconds, queries=0, rows=0):
+    """Anota una medición en los totales del proceso"""
+    bucket = bisect.bisect_left(BUCKETS, seconds)
+    with _totals_lock:
+        entry = _totals.get((dbname, name))
+        if entry is None:
+            entry = _totals[(dbname, name)] = [0, 0.0, 0, 0, [0] * (len(BUCKETS) + 1)]
+        entry[COUNT] += 1
+        entry[WALL] += seconds
+        entry[SQL] += queries
+        entry[ROWS] += rows
+        entry[HISTOGRAM][bucket] += 1
+
+
+def collect(dbname):
+    """{nombre: entrada} acumulado por el proceso para la base de datos (copia)"""
+    with _totals_lock:
+        return {
+            name: [entry[COUNT], entry[WALL], entry[SQL], entry[ROWS], list(entry[HISTOGRAM])]
+            for (entry_dbname, name), entry in _totals.items()
+            if entry_dbname == dbname
+        }
+
+
+def flush_due(dbname):
+    """True para un solo hilo del proceso cada FLUSH_INTERVAL segundos"""
+    now = time.monotonic()
+    if now - _last_flush.get(dbname, 0.0) < FLUSH_INTERVAL or not _flush_lock.acquire(blocking=False):
+        return False
+    try:
+        if now - _last_flush.get(dbname, 0.0) < FLUSH_INTERVAL:
+            return False
+        _last_flush[dbname] = now
+        return True
+    finally:
+        _flush_lock.release()
+
+
+def pending(dbname):
+    """(deltas desde el último volcado, totales actuales) del proceso"""
+    totals = collect(dbname)
+    flushed = _flushed.get(dbname, {})
+    deltas = {}
+    for name, total in totals.items():
+        previous = flushed.get(name)
+        if previous is None:
+            delta = total
+        else:
+            delta = [total[index] - previous[index] for index in (COUNT, WALL, SQL, ROWS)]
+            delta.append([a - b for a, b in zip(total[HISTOGRAM], previous[HISTOGRAM])])
+        if delta[COUNT]:
+            deltas[name] = delta
+    return deltas, totals
+
+
+def mark_flushed(dbname, totals):
+    _flushed[dbname] = totals
+
+
+class Timer:
+    """Medición en curso; ``name`` puede cambiarse dentro del bloque (p. ej. al conocer la intención)"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+@contextlib.contextmanager
+def timed(env, name):
+    cr = env.cr
+    dbname = cr.dbname
+    timer = Timer(name)
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    profiler = _start_profile(dbname) if depth == 0 else None
+    queries = cr.sql_log_count
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        elapsed = time.perf_counter() - start
+        _local.depth = depth
+        if profiler:
+            _finish_profile(dbname, timer.name, profiler, elapsed)
+        queries = cr.sql_log_count - queries
+        record(dbname, timer.name, elapsed, queries, max(cr.rowcount, 0) if queries else 0)
+        # En pruebas el volcado compartiría el cursor y alteraría los conteos de consultas
+        if flush_due(dbname) and not env.registry.in_test_mode():
+            env['ai.metric']._flush_process_metrics()
+
+
+def instrumented(method):
+    """Mide cada llamada a una herramienta IA como ``tool:<método>``"""
+    name = f"tool:{method.__name__}"
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with timed(self.env, name):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# -- perfilado -----------------------------------------------------------------
+
+def configure_profiling(dbname, rate, keep, directory):
+    _profile_settings[dbname] = {'rate': rate, 'keep': keep, 'directory': directory}
+
+
+def _start_profile(dbname):
+    settings = _profile_settings.get(dbname)
+    if not settings or settings['rate'] <= 0 or random.random() >= settings['rate']:
+        return None
+    # Un solo perfilador activo por proceso
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+def _finish_profile(dbname, name, profiler, elapsed):
+    """Guarda el volcado si está entre los ``keep`` más lentos y borra el que sale"""
+    try:
+        profiler.disable()
+        settings = _profile_settings[dbname]
+        slowest = _slowest.setdefault(dbname, [])
+        if len(slowest) >= settings['keep'] and elapsed <= slowest[0][0]:
+            return
+        os.makedirs(settings['directory'], exist_ok=True)
+        path = os.path.join(
+            settings['directory'],
+            f"{PROFILE_NAME_RE.sub('_', name)}-{int(elapsed * 1000)}ms-{int(time.time() * 1000)}.prof")
+        profiler.dump_stats(path)
+        heapq.heappush(slowest, (elapsed, path))
+        while len(slowest) > settings['keep']:
+            _elapsed, removed = heapq.heappop(slowest)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(removed)
+    except OSError:
+        # Un volcado que no se puede escribir no debe romper la petición
+        pass
+    finally:
+        _profile_lock.release()
+
+
+def slowest_profiles(dbname):
+    """[(segundos, ruta)] de los volcados conservados por este proceso, del más lento al más rápido"""
+    return sorted(_slowest.get(dbname, []), reverse=True)
+
+
+# -- exposición ----------------------------------------------------------------
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(rows):
+    """Texto Prometheus para filas (nombre, conteo, tiempo, consultas, filas, cubos)"""
+    lines = [
+        "# HELP modulo_ai_duration_seconds Tiempo de pared de las operaciones IA",
+        "# TYPE modulo_ai_duration_seconds histogram",
+    ]
+    for name, count, wall, _sql, _rows, buckets in rows:
+        label = _label(name)
+        cumulative = 0
+        for bound, value in zip(BUCKETS, buckets):
+            cumulative += value
+            lines.append(f'modulo_ai_duration_seconds_bucket{{op="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'modulo_ai_duration_seconds_bucket{{op="{label}",le="+Inf"}} {count}')
+        lines.append(f'modulo_ai_duration_seconds_sum{{op="{label}"}} {wall}')
+        lines.append(f'modulo_ai_duration_seconds_count{{op="{label}"}} {count}')
+    for metric, index, help_text in (
+        ('modulo_ai_sql_queries_total', 3, "Consultas SQL ejecutadas por las operaciones IA"),
+        ('modulo_ai_sql_rows_total', 4, "Filas devueltas o afectadas por la consulta principal de las operaciones IA"),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for row in rows:
+            lines.append(f'{metric}{{op="{_label(row[0])}"}} {row[index]}')
+    return '\n'.join(lines) + '\n'
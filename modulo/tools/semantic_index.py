@@ -0,0 +1,380 @@
+"""Índice semántico local de productos, sin red.
+
+Cada producto se representa con un vector float32 de n-gramas de caracteres
+(trigramas de cada palabra, sin acentos) proyectados por hashing sobre
+``DIMENSIONS`` posiciones; nombre, categoría y descripción pesan distinto.
+Las consultas se expanden con una tabla de sinónimos ("balón" -> "pelota",
+"fútbol" -> "soccer") para que "balón de fútbol" encuentre "Pelota Soccer".
+
+En disco, por base de datos:
+
+* ``main-<gen>.f32`` / ``main-<gen>.ids``: matriz principal y sus ids, abierta
+  con ``numpy.memmap`` en solo lectura, de modo que todos los workers del
+  servidor comparten las páginas del sistema operativo sin copiarlas;
+* ``delta-<gen>.f32`` / ``delta-<gen>.ids``: segmento de solo anexado con los
+  productos creados o modificados desde la última compactación (la última
+  fila de un id manda; un vector nulo significa borrado);
+* ``manifest.json``: generación vigente, dimensiones e idioma.
+
+La compactación fusiona el delta en una nueva generación de la matriz
+principal. Una consulta (o un lote de consultas) es un producto matricial
+por segmento seguido de un top-k con ``argpartition``.
+"""
+import fcntl
+import json
+import os
+import re
+import threading
+import unicodedata
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DIMENSIONS = 512
+# Peso de nombre, categoría y descripción en el vector del producto
+FIELD_WEIGHTS = (1.0, 0.6, 0.4)
+# Similitud coseno mínima para considerar un producto relacionado
+MIN_SCORE = 0.2
+# Productos por bloque al construir el índice
+BUILD_BATCH_SIZE = 10000
+
+# Equivalencias aplicadas a las consultas (palabras ya normalizadas)
+SYNONYMS = {
+    'balon': ('pelota', 'ball'),
+    'pelota': ('balon', 'ball'),
+    'ball': ('pelota', 'balon'),
+    'futbol': ('soccer', 'football'),
+    'soccer': ('futbol', 'football'),
+    'football': ('futbol', 'soccer'),
+    'escritorio': ('desk',),
+    'desk': ('escritorio',),
+    'mesa': ('table',),
+    'table': ('mesa',),
+    'silla': ('chair',),
+    'chair': ('silla',),
+    'zapatilla': ('shoe', 'sneaker'),
+    'zapato': ('shoe',),
+    'shoe': ('zapato', 'zapatilla'),
+    'camiseta': ('shirt', 'jersey'),
+    'shirt': ('camiseta',),
+    'lampara': ('lamp',),
+    'lamp': ('lampara',),
+    'cajon': ('drawer', 'box'),
+    'drawer': ('cajon',),
+}
+
+TAG_RE = re.compile(r'<[^>]+>')
+WORD_RE = re.compile(r'\w+')
+
+# Trigramas ya calculados por (palabra, dimensiones)
+_bucket_cache = {}
+BUCKET_CACHE_SIZE = 200000
+
+
+def is_available():
+    return np is not None
+
+
+def normalize(text):
+    """Palabras en minúsculas y sin acentos ni etiquetas HTML"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', TAG_RE.sub(' ', text).lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return WORD_RE.findall(text)
+
+
+def expand_synonyms(words):
+    expanded = list(words)
+    for word in words:
+        if word in SYNONYMS:
+            expanded.extend(SYNONYMS[word])
+            continue
+        # Plurales simples: "pelotas", "balones", "desks"
+        for suffix in ('es', 's'):
+            if word.endswith(suffix) and word[:-len(suffix)] in SYNONYMS:
+                expanded.extend(SYNONYMS[word[:-len(suffix)]])
+                break
+    return expanded
+
+
+def _buckets(word, dimensions):
+    key = (word, dimensions)
+    buckets = _bucket_cache.get(key)
+    if buckets is None:
+        padded = f" {word} ".encode()
+        buckets = [zlib.crc32(padded[i:i + 3]) % dimensions for i in range(max(len(padded) - 2, 1))]
+        if len(_bucket_cache) >= BUCKET_CACHE_SIZE:
+            _bucket_cache.clear()
+        _bucket_cache[key] = buckets
+    return buckets
+
+
+def vectorize(documents, dimensions=DIMENSIONS):
+    """Matriz (n, dimensions) normalizada para documentos (nombre, categoría, descripción)
+
+    Un documento ``None`` produce un vector nulo (producto borrado).
+    """
+    rows, cols, values = [], [], []
+    count = 0
+    for row, document in enumerate(documents):
+        count += 1
+        if document is None:
+            continue
+        for text, weight in zip(document, FIELD_WEIGHTS):
+            for word in normalize(text):
+                buckets = _buckets(word, dimensions)
+                rows.extend([row] * len(buckets))
+                cols.extend(buckets)
+                values.extend([weight] * len(buckets))
+    return _finish(count, rows, cols, values, dimensions)
+
+
+def vectorize_queries(queries, dimensions=DIMENSIONS):
+    """Matriz (m, dimensions) de consultas con sinónimos expandidos"""
+    rows, cols, values = [], [], []
+    for row, query in enumerate(queries):
+        for word in expand_synonyms(normalize(query)):
+            buckets = _buckets(word, dimensions)
+            rows.extend([row] * len(buckets))
+            cols.extend(buckets)
+            values.extend([1.0] * len(buckets))
+    return _finish(len(queries), rows, cols, values, dimensions)
+
+
+def _finish(count, rows, cols, values, dimensions):
+    matrix = np.zeros((count, dimensions), dtype=np.float32)
+    if rows:
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(values, dtype=np.float32))
+        # Frecuencias sublineales: un trigrama repetido no domina el vector
+        np.log1p(matrix, out=matrix)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class SemanticIndex:
+    """Índice de un directorio; seguro entre hilos y entre procesos del mismo servidor"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._manifest_stamp = None
+        self._manifest = None
+        self._main = None
+        self._main_ids = None
+        self._delta_rows = -1
+        self._delta = None
+
+    # -- ficheros -----------------------------------------------------------
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _write_lock(self):
+        """Bloqueo exclusivo entre procesos para anexar, construir o compactar"""
+        os.makedirs(self.path, exist_ok=True)
+        handle = open(self._file('lock'), 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def _read_manifest(self):
+        try:
+            with open(self._file('manifest.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, manifest):
+        tmp = self._file('manifest.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._file('manifest.json'))
+
+    def _remove_generation(self, generation):
+        for kind in ('main', 'delta'):
+            for ext in ('f32', 'ids'):
+                try:
+                    os.remove(self._file(f"{kind}-{generation}.{ext}"))
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _append(handle_vectors, handle_ids, ids, vectors):
+        handle_vectors.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        handle_ids.write(np.asarray(ids, dtype=np.int64).tobytes())
+
+    # -- escritura ----------------------------------------------------------
+
+    def build(self, batches, dimensions=DIMENSIONS, lang='en_US'):
+        """Reconstruye el índice completo desde bloques [(ids, documentos)]"""
+        with self._write_lock():
+            previous = self._read_manifest()
+            generation = previous['generation'] + 1 if previous else 1
+            rows = 0
+            with open(self._file(f"main-{generation}.f32"), 'wb') as vectors_file, \
+                    open(self._file(f"main-{generation}.ids"), 'wb') as ids_file:
+                for ids, documents in batches:
+                    self._append(vectors_file, ids_file, ids, vectorize(documents, dimensions))
+                    rows += len(ids)
+            open(self._file(f"delta-{generation}.f32"), 'wb').close()
+            open(self._file(f"delta-{generation}.ids"), 'wb').close()
+            self._write_manifest({'generation': generation, 'dimensions': dimensions, 'lang': lang, 'rows': rows})
+            if previous:
+                self._remove_generation(previous['generation'])
+        return rows
+
+    def update(self, ids, documents):
+        """Anexa al delta los vectores de productos creados, modificados o borrados (documento None)"""
+        if not ids:
+            return
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if not manifest:
+                return
+            vectors = vectorize(documents, manifest['dimensions'])
+            generation = manifest['generation']
+            with open(self._file(f"delta-{generation}.f32"), 'ab') as vectors_file, \
+                    open(self._file(f"delta-{generation}.ids"), 'ab') as ids_file:
+                self._append(vectors_file, ids_file, ids, vectors)
+
+    def compact(self):
+        """Fusiona el delta en una nueva generación de la matriz principal; devuelve las filas"""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if not manifest:
+                return 0
+            generation = manifest['generation']
+            dimensions = manifest['dimensions']
+            main, main_ids = self._open_main(manifest)
+            delta, delta_ids = self._read_delta(generation, dimensions)
+            if not len(delta_ids):
+                return manifest['rows']
+
+            keep = ~np.isin(main_ids, delta_ids)
+            alive = delta.any(axis=1)
+            new_generation = generation + 1
+            with open(self._file(f"main-{new_generation}.f32"), 'wb') as vectors_file, \
+                    open(self._file(f"main-{new_generation}.ids"), 'wb') as ids_file:
+                for start in range(0, len(main_ids), BUILD_BATCH_SIZE):
+                    chunk = keep[start:start + BUILD_BATCH_SIZE]
+                    self._append(vectors_file, ids_file,
+                                 main_ids[start:start + BUILD_BATCH_SIZE][chunk],
+                                 main[start:start + BUILD_BATCH_SIZE][chunk])
+                self._append(vectors_file, ids_file, delta_ids[alive], delta[alive])
+            open(self._file(f"delta-{new_generation}.f32"), 'wb').close()
+            open(self._file(f"delta-{new_generation}.ids"), 'wb').close()
+            rows = int(keep.sum() + alive.sum())
+            self._write_manifest(dict(manifest, generation=new_generation, rows=rows))
+            # Los workers que aún tengan mapeada la generación anterior la conservan hasta recargar
+            self._remove_generation(generation)
+            return rows
+
+    # -- lectura ------------------------------------------------------------
+
+    def _open_main(self, manifest):
+        generation = manifest['generation']
+        if not manifest['rows']:
+            return np.zeros((0, manifest['dimensions']), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        main = np.memmap(self._file(f"main-{generation}.f32"), dtype=np.float32, mode='r',
+                         shape=(manifest['rows'], manifest['dimensions']))
+        main_ids = np.fromfile(self._file(f"main-{generation}.ids"), dtype=np.int64)
+        return main, main_ids
+
+    def _read_delta(self, generation, dimensions):
+        """Última versión de cada producto del delta: (vectores, ids)"""
+        vectors = np.fromfile(self._file(f"delta-{generation}.f32"), dtype=np.float32)
+        ids = np.fromfile(self._file(f"delta-{generation}.ids"), dtype=np.int64)
+        # Un anexado concurrente puede haber escrito los vectores y no aún los ids
+        rows = min(len(vectors) // dimensions, len(ids))
+        vectors = vectors[:rows * dimensions].reshape(rows, dimensions)
+        ids = ids[:rows]
+        _unique, last = np.unique(ids[::-1], return_index=True)
+        latest = rows - 1 - last
+        return vectors[latest], ids[latest]
+
+    def _load(self):
+        """Reabre los segmentos si otro proceso reconstruyó, compactó o anexó"""
+        try:
+            stat = os.stat(self._file('manifest.json'))
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._manifest_stamp:
+            self._manifest = self._read_manifest()
+            self._main, self._main_ids = self._open_main(self._manifest)
+            self._manifest_stamp = stamp
+            self._delta_rows = -1
+
+        manifest = self._manifest
+        generation = manifest['generation']
+        try:
+            delta_rows = os.path.getsize(self._file(f"delta-{generation}.ids")) // 8
+        except FileNotFoundError:
+            delta_rows = 0
+        if delta_rows != self._delta_rows:
+            delta = np.zeros((0, manifest['dimensions']), dtype=np.float32), np.zeros(0, dtype=np.int64)
+            if delta_rows:
+                delta = self._read_delta(generation, manifest['dimensions'])
+            superseded = np.isin(self._main_ids, delta[1]) if len(delta[1]) else None
+            self._delta = delta + (superseded,)
+            self._delta_rows = delta_rows
+        return manifest
+
+    def search(self, queries, limit=10, min_score=MIN_SCORE):
+        """Por consulta, [(id, similitud)] de mayor a menor, con un producto matricial por segmento"""
+        with self._lock:
+            manifest = self._load()
+            if not manifest:
+                return [[] for _query in queries]
+            main, main_ids = self._main, self._main_ids
+            delta, delta_ids, superseded = self._delta
+
+        matrix = vectorize_queries(queries, manifest['dimensions'])
+        main_scores = main @ matrix.T if len(main_ids) else None
+        if main_scores is not None and superseded is not None:
+            main_scores[superseded] = -1.0
+        delta_scores = delta @ matrix.T if len(delta_ids) else None
+
+        results = []
+        for column in range(len(queries)):
+            candidates = []
+            for scores, ids in ((main_scores, main_ids), (delta_scores, delta_ids)):
+                if scores is None:
+                    continue
+                column_scores = scores[:, column]
+                top = _top_k(column_scores, limit)
+                candidates.extend(
+                    (int(ids[i]), float(column_scores[i])) for i in top if column_scores[i] >= min_score)
+            candidates.sort(key=lambda item: (-item[1], item[0]))
+            results.append(candidates[:limit])
+        return results
+
+    def stats(self):
+        with self._lock:
+            manifest = self._load()
+            if not manifest:
+                return {}
+            return dict(manifest, delta_rows=len(self._delta[1]))
+
+
+def _top_k(scores, limit):
+    if len(scores) <= limit:
+        return np.arange(len(scores))
+    return np.argpartition(-scores, limit)[:limit]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path):
+    """Índice del proceso para el directorio (los mapeos se comparten entre peticiones)"""
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = SemanticIndex(path)
+        return index
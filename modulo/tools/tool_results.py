@@ -0,0 +1,77 @@
+"""Resultados estructurados de las herramientas IA.
+
+Cada herramienta de lectura obtiene primero sus datos como un dict compacto
+(ids, números y etiquetas cortas) y después, según el modo, los devuelve como
+JSON para el agente o los formatea como texto para el livechat::
+
+    {"tool": "get_stock", "rows": [{"id": 7, "name": "Desk", "qty": 12.0}],
+     "total": 31, "next": "10"}
+
+``rows`` se recorta al presupuesto de filas y de tokens (aprox. 4 bytes por
+token); si quedan filas, ``next`` es el cursor que la herramienta acepta
+para continuar donde terminó la respuesta anterior.
+
+Con ``structured=FULL`` la herramienta devuelve todas las filas leídas, sin
+presupuesto: es la forma que usa el livechat para formatear el texto y
+guardar los ids mostrados en el contexto del canal (ver ``load``).
+"""
+import json
+
+# Aproximación del tamaño de un token en bytes de JSON
+BYTES_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 600
+# Modo estructurado sin presupuesto de tokens
+FULL = 'full'
+
+
+def decode_cursor(cursor):
+    """Desplazamiento representado por un cursor de continuación (0 si no hay o no es válido)"""
+    try:
+        return max(int(cursor or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def encode_cursor(offset):
+    return str(offset)
+
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def dump(data, token_budget=DEFAULT_TOKEN_BUDGET):
+    """JSON compacto de ``data`` con ``rows`` recortado al presupuesto y el cursor siguiente
+
+    ``data`` admite ``offset`` (primera fila devuelta) y ``more`` (hay filas
+    después de las leídas), que se traducen en ``next``.
+    """
+    payload = {key: value for key, value in data.items() if key not in ('offset', 'more')}
+    rows = payload.get('rows')
+    if rows is None:
+        return _dumps(payload)
+
+    offset = data.get('offset', 0)
+    more = data.get('more', False)
+    byte_budget = token_budget * BYTES_PER_TOKEN if token_budget else 0
+    payload['rows'] = []
+    size = len(_dumps(payload)) + len(',"next":""') + 12
+    kept = 0
+    for row in rows:
+        row_size = len(_dumps(row)) + 1
+        if byte_budget and kept and size + row_size > byte_budget:
+            break
+        payload['rows'].append(row)
+        size += row_size
+        kept += 1
+    if more or kept < len(rows):
+        payload['next'] = encode_cursor(offset + kept)
+    return _dumps(payload)
+
+
+def load(text, offset=0):
+    """Datos de un resultado de ``dump`` con ``offset`` y ``more`` restaurados para los formateadores"""
+    data = json.loads(text)
+    data['offset'] = offset
+    data['more'] = 'next' in data
+    return data